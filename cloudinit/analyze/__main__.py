@@ -3,11 +3,18 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import argparse
+import os
 import re
 import sys
 
+from cloudinit.reporting import handlers
+
+from . import batch
 from . import dump
 from . import show
+from . import trace
+
+DEFAULT_LOG = '/var/log/cloud-init.log'
 
 
 def get_parser(parser=None):
@@ -21,9 +28,10 @@ def get_parser(parser=None):
     parser_blame = subparsers.add_parser(
         'blame', help='Print list of executed stages ordered by time to init')
     parser_blame.add_argument(
-        '-i', '--infile', action='store', dest='infile',
-        default='/var/log/cloud-init.log',
-        help='specify where to read input.')
+        '-i', '--infile', action='store', dest='infile', default=None,
+        help=('specify where to read input. Defaults to the profile trace '
+              '%s if present, else %s.' % (handlers.DEFAULT_TRACE_FILE,
+                                           DEFAULT_LOG)))
     parser_blame.add_argument(
         '-o', '--outfile', action='store', dest='outfile', default='-',
         help='specify where to write output. ')
@@ -34,9 +42,11 @@ def get_parser(parser=None):
     parser_show.add_argument('-f', '--format', action='store',
                              dest='print_format', default='%I%D @%Es +%ds',
                              help='specify formatting of output.')
-    parser_show.add_argument('-i', '--infile', action='store',
-                             dest='infile', default='/var/log/cloud-init.log',
-                             help='specify where to read input.')
+    parser_show.add_argument(
+        '-i', '--infile', action='store', dest='infile', default=None,
+        help=('specify where to read input. Defaults to the profile trace '
+              '%s if present, else %s.' % (handlers.DEFAULT_TRACE_FILE,
+                                           DEFAULT_LOG)))
     parser_show.add_argument('-o', '--outfile', action='store',
                              dest='outfile', default='-',
                              help='specify where to write output.')
@@ -44,12 +54,51 @@ def get_parser(parser=None):
     parser_dump = subparsers.add_parser(
         'dump', help='Dump cloud-init events in JSON format')
     parser_dump.add_argument('-i', '--infile', action='store',
-                             dest='infile', default='/var/log/cloud-init.log',
+                             dest='infile', default=DEFAULT_LOG,
                              help='specify where to read input. ')
     parser_dump.add_argument('-o', '--outfile', action='store',
                              dest='outfile', default='-',
                              help='specify where to write output. ')
+    parser_dump.add_argument('--ndjson', action='store_true', default=False,
+                             help='write one json event per line as parsed.')
+    parser_dump.add_argument(
+        '--offset-file', action='store', dest='offset_file', default=None,
+        help=('resume reading infile at the byte offset saved in this file '
+              'and save the new offset when done.'))
     parser_dump.set_defaults(action=('dump', analyze_dump))
+    parser_trace = subparsers.add_parser(
+        'trace', help='Export nested events for trace viewers')
+    parser_trace.add_argument(
+        '-f', '--format', action='store', dest='trace_format',
+        choices=trace.TRACE_FORMATS, default='chrome',
+        help=('chrome: Chrome trace-event json (chrome://tracing). '
+              'folded: folded stacks for flamegraph.pl.'))
+    parser_trace.add_argument(
+        '-i', '--infile', action='store', dest='infile', default=None,
+        help=('specify where to read input. Defaults to the profile trace '
+              '%s if present, else %s.' % (handlers.DEFAULT_TRACE_FILE,
+                                           DEFAULT_LOG)))
+    parser_trace.add_argument('-o', '--outfile', action='store',
+                              dest='outfile', default='-',
+                              help='specify where to write output.')
+    parser_trace.set_defaults(action=('trace', analyze_trace))
+    parser_batch = subparsers.add_parser(
+        'batch', help='Aggregate stage and module timing across many logs')
+    parser_batch.add_argument(
+        'infiles', nargs='+', metavar='INFILE',
+        help=('cloud-init logs, analyze dump output or profile traces, '
+              'optionally gzip compressed.'))
+    parser_batch.add_argument(
+        '-f', '--format', action='store', dest='batch_format',
+        choices=batch.BATCH_FORMATS, default='csv',
+        help='specify the report format.')
+    parser_batch.add_argument(
+        '-j', '--jobs', action='store', dest='jobs', type=int, default=None,
+        help='number of worker processes. Defaults to the number of cpus.')
+    parser_batch.add_argument('-o', '--outfile', action='store',
+                              dest='outfile', default='-',
+                              help='specify where to write output.')
+    parser_batch.set_defaults(action=('batch', analyze_batch))
     return parser
 
 
@@ -62,8 +111,9 @@ def analyze_blame(name, args):
         166ms (modules-config) ....
         807us (modules-final) ...
 
-    We generate event records parsing cloud-init logs, formatting the output
-    and sorting by record data ('delta')
+    We generate event records from the profile trace or by parsing
+    cloud-init logs, formatting the output and sorting by record data
+    ('delta')
     """
     (infh, outfh) = configure_io(args)
     blame_format = '     %ds (%n)'
@@ -110,14 +160,69 @@ def analyze_show(name, args):
 
 
 def analyze_dump(name, args):
-    """Dump cloud-init events in json format"""
+    """Dump cloud-init events in json format
+
+    Events are parsed and written as the log is read.  With --offset-file
+    only lines appended since the previous run are read.
+    """
+    if args.infile == '-':
+        if args.offset_file:
+            sys.stderr.write('Cannot resume from an offset on stdin\n')
+            sys.exit(1)
+        infh = getattr(sys.stdin, 'buffer', sys.stdin)
+    else:
+        try:
+            infh = open(args.infile, 'rb')
+        except (IOError, OSError):
+            sys.stderr.write('Cannot open file %s\n' % args.infile)
+            sys.exit(1)
+    outfh = _open_outfile(args.outfile)
+
+    offset = 0
+    if args.offset_file:
+        offset = dump.load_offset(args.offset_file)
+    reader = dump.LogReader(infh, offset, resume=bool(args.offset_file))
+    if args.ndjson:
+        dump.write_ndjson(dump.iter_events(reader), outfh)
+    else:
+        dump.write_json(dump.iter_events(reader), outfh)
+    if args.offset_file:
+        dump.save_offset(args.offset_file, reader.offset)
+
+
+def analyze_trace(name, args):
+    """Export the tree of nested events for trace viewers.
+
+    The chrome format can be loaded in chrome://tracing or Perfetto, the
+    folded format is input for flamegraph.pl:
+      init-network;config-ssh 1500123
+    """
     (infh, outfh) = configure_io(args)
-    outfh.write(dump.json_dumps(_get_events(infh)) + '\n')
+    outfh.write(trace.format_trace(_get_events(infh), args.trace_format))
+
+
+def analyze_batch(name, args):
+    """Report percentiles and failures of each stage and module.
+
+    For example, as csv:
+      name,kind,count,failures,p50,p95,p99
+      init-network,stage,20000,3,2.1,6.3,9.8
+      init-network/config-ssh,module,20000,0,0.4,1.2,1.9
+    """
+    outfh = _open_outfile(args.outfile)
+    stats = batch.collect(args.infiles, jobs=args.jobs)
+    for (path, error) in stats.errors:
+        sys.stderr.write('Skipping %s: %s\n' % (path, error))
+    batch.write_report(stats, outfh, args.batch_format)
 
 
 def _get_events(infile):
     rawdata = None
     events, rawdata = show.load_events(infile, None)
+    if not isinstance(events, list):
+        profile = handlers.parse_trace(rawdata.splitlines())
+        if profile:
+            return show.trace_to_events(profile)
     if not events:
         events, _ = dump.dump_events(rawdata=rawdata)
     return events
@@ -125,6 +230,11 @@ def _get_events(infile):
 
 def configure_io(args):
     """Common parsing and setup of input/output files"""
+    if args.infile is None:
+        if os.path.exists(handlers.DEFAULT_TRACE_FILE):
+            args.infile = handlers.DEFAULT_TRACE_FILE
+        else:
+            args.infile = DEFAULT_LOG
     if args.infile == '-':
         infh = sys.stdin
     else:
@@ -134,16 +244,17 @@ def configure_io(args):
             sys.stderr.write('Cannot open file %s\n' % args.infile)
             sys.exit(1)
 
-    if args.outfile == '-':
-        outfh = sys.stdout
-    else:
-        try:
-            outfh = open(args.outfile, 'w')
-        except OSError:
-            sys.stderr.write('Cannot open file %s\n' % args.outfile)
-            sys.exit(1)
+    return (infh, _open_outfile(args.outfile))
+
 
-    return (infh, outfh)
+def _open_outfile(outfile):
+    if outfile == '-':
+        return sys.stdout
+    try:
+        return open(outfile, 'w')
+    except OSError:
+        sys.stderr.write('Cannot open file %s\n' % outfile)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
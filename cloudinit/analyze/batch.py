@@ -0,0 +1,170 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Aggregate boot timing across many cloud-init logs.
+
+Each input is a cloud-init.log, an 'analyze dump' of events or a profile
+trace, optionally gzip compressed.  Inputs are parsed on a process pool
+as they are read, and the durations of each stage, config module and
+other nested event are reduced to percentiles and failure counts.
+"""
+
+from contextlib import closing
+import csv
+import gzip
+import itertools
+import json
+import math
+import multiprocessing
+
+import six
+
+from cloudinit.reporting import handlers
+
+from . import dump
+from . import show
+from . import trace
+
+BATCH_FORMATS = ('csv', 'json')
+PERCENTILES = (50, 95, 99)
+KINDS = ('stage', 'module', 'event')
+FIELDS = (['name', 'kind', 'count', 'failures'] +
+          ['p%d' % p for p in PERCENTILES])
+
+
+def _iter_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with closing(opener(path, 'rb')) as fh:
+        for line in fh:
+            yield line.decode('utf-8', 'replace')
+
+
+def read_events(path):
+    """Yield the events in a log, event dump or profile trace at path.
+
+    Logs are parsed a line at a time as they are read.
+    """
+    lines = _iter_lines(path)
+    for line in lines:
+        if line.strip():
+            break
+    else:
+        return
+    if line.lstrip()[0] == '{':
+        profile = handlers.parse_trace(itertools.chain([line], lines))
+        if profile is None:
+            raise ValueError("not a profile trace of version %s" %
+                             handlers.TRACE_VERSION)
+        events = show.trace_to_events(profile)
+    elif line.lstrip()[0] == '[':
+        events = json.loads(line + ''.join(lines))
+    else:
+        events = dump.iter_events(itertools.chain([line], lines))
+    for event in events:
+        yield event
+
+
+def event_kind(name):
+    """Return 'stage', 'module' or 'event' for the event named name."""
+    if '/' not in name:
+        return 'stage'
+    if name.rsplit('/', 1)[1].startswith('config-'):
+        return 'module'
+    return 'event'
+
+
+def sample_file(path):
+    """Return (path, samples, error) for the events of one input.
+
+    samples is a list of (name, kind, seconds, failed) tuples, one per
+    finished event.  error is a message if the input could not be read.
+    """
+    samples = []
+    try:
+        for root in trace.build_tree(read_events(path)):
+            for (_stack, node) in root.walk():
+                if node.end is None:
+                    continue
+                samples.append((node.name, event_kind(node.name),
+                                node.duration, node.result == 'FAIL'))
+    except Exception as e:
+        return (path, [], str(e))
+    return (path, samples, None)
+
+
+def percentile(values, pct):
+    """Return the pct percentile of sorted values (nearest rank)."""
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class BatchStats(object):
+    """Durations and failures of each event name across inputs."""
+
+    def __init__(self):
+        self.durations = {}
+        self.failures = {}
+        self.kinds = {}
+        self.inputs = 0
+        self.errors = []
+
+    def add(self, path, samples, error=None):
+        self.inputs += 1
+        if error:
+            self.errors.append((path, error))
+        for (name, kind, seconds, failed) in samples:
+            self.kinds[name] = kind
+            self.durations.setdefault(name, []).append(seconds)
+            self.failures[name] = self.failures.get(name, 0) + int(failed)
+
+    def rows(self):
+        """Return one dict per event name, stages first, then modules."""
+        rows = []
+        for name in sorted(self.durations,
+                           key=lambda n: (KINDS.index(self.kinds[n]), n)):
+            values = sorted(self.durations[name])
+            row = {'name': name, 'kind': self.kinds[name],
+                   'count': len(values), 'failures': self.failures[name]}
+            for pct in PERCENTILES:
+                row['p%d' % pct] = round(percentile(values, pct), 6)
+            rows.append(row)
+        return rows
+
+
+def collect(paths, jobs=None):
+    """Parse paths on a pool of jobs processes and return BatchStats."""
+    stats = BatchStats()
+    if jobs == 1 or len(paths) < 2:
+        results = six.moves.map(sample_file, paths)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=jobs)
+        results = pool.imap_unordered(sample_file, paths, chunksize=16)
+    try:
+        for (path, samples, error) in results:
+            stats.add(path, samples, error)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return stats
+
+
+def write_report(stats, outfh, batch_format):
+    """Write the rows of stats to outfh in one of BATCH_FORMATS."""
+    if batch_format == 'json':
+        outfh.write(dump.json_dumps(
+            {'inputs': stats.inputs,
+             'errors': [{'path': p, 'error': e} for (p, e) in stats.errors],
+             'events': stats.rows()}) + '\n')
+    elif batch_format == 'csv':
+        writer = csv.DictWriter(outfh, fieldnames=FIELDS,
+                                lineterminator='\n')
+        writer.writerow(dict((f, f) for f in FIELDS))
+        for row in stats.rows():
+            writer.writerow(row)
+    else:
+        raise ValueError('Unknown batch format: %s' % batch_format)
+
+# vi: ts=4 expandtab
@@ -3,6 +3,8 @@
 import calendar
 from datetime import datetime
 import json
+import os
+import re
 import sys
 
 from cloudinit import util
@@ -27,6 +29,17 @@ CLOUD_INIT_JOURNALCTL_FMT = "%b %d %H:%M:%S.%f %Y"
 # other
 DEFAULT_FMT = "%b %d %H:%M:%S %Y"
 
+# Lines that may hold an event, checked before any parsing.
+CI_EVENT_RE = re.compile(r'start:|finish:|Cloud-init v\.')
+
+# Fast path for start and finish events in cloud-init.log, which make up
+# nearly all event lines:
+# 2017-05-22 18:02:01,088 - handlers.py[DEBUG]: start: init-local/x: desc
+CI_LOG_EVENT_RE = re.compile(
+    r'^(?P<timestamp>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d+) - '
+    r'\S+\[\w+\]: (?P<event_type>start|finish): (?P<name>[^:\s]+): ?'
+    r'(?P<description>.*)$')
+
 
 def parse_timestamp(timestampstr):
     # default syslog time does not include the current year
@@ -76,6 +89,12 @@ def parse_ci_logline(line):
     # 2017-05-22 18:02:01,088 - util.py[DEBUG]: Cloud-init v. 0.7.9 running \
     #         'init-local' at Mon, 22 May 2017 18:02:01 +0000. Up 2.0 seconds.
 
+    match = CI_LOG_EVENT_RE.match(line.rstrip('\n'))
+    if match:
+        return _make_event(match.group('name'), match.group('event_type'),
+                           match.group('description').strip(),
+                           parse_timestamp(match.group('timestamp')))
+
     separators = [' - ', ' [CLOUDINIT] ']
     found = False
     for sep in separators:
@@ -116,16 +135,21 @@ def parse_ci_logline(line):
         (pymodloglvl, event_type, event_name) = eventstr.split()[0:3]
         event_description = eventstr.split(event_name)[1].strip()
 
+    return _make_event(event_name.rstrip(":"), event_type.rstrip(":"),
+                       event_description, parse_timestamp(timestampstr))
+
+
+def _make_event(name, event_type, description, timestamp):
     event = {
-        'name': event_name.rstrip(":"),
-        'description': event_description,
-        'timestamp': parse_timestamp(timestampstr),
+        'name': name,
+        'description': description,
+        'timestamp': timestamp,
         'origin': 'cloudinit',
-        'event_type': event_type.rstrip(":"),
+        'event_type': event_type,
     }
-    if event['event_type'] == "finish":
-        result = event_description.split(":")[0]
-        desc = event_description.split(result)[1].lstrip(':').strip()
+    if event_type == "finish":
+        result = description.split(":")[0]
+        desc = description.split(result)[1].lstrip(':').strip()
         event['result'] = result
         event['description'] = desc.strip()
 
@@ -137,11 +161,78 @@ def json_dumps(data):
                       separators=(',', ': '))
 
 
-def dump_events(cisource=None, rawdata=None):
-    events = []
-    event = None
-    CI_EVENT_MATCHES = ['start:', 'finish:', 'Cloud-init v.']
+def iter_events(lines):
+    """Yield the events parsed from an iterable of log lines."""
+    for line in lines:
+        if not CI_EVENT_RE.search(line):
+            continue
+        try:
+            event = parse_ci_logline(line)
+        except ValueError:
+            sys.stderr.write('Skipping invalid entry\n')
+            continue
+        if event:
+            yield event
+
+
+class LogReader(object):
+    """Iterate over the complete lines of a binary log file.
+
+    Reading starts at byte offset, or at the start of the file if it is
+    now shorter than offset (it was rotated).  offset is advanced past
+    each line read, so it can be saved and passed to a later LogReader to
+    only read lines appended since.  When resuming that way, a final line
+    without a newline may still be being written and is left for the next
+    reader; otherwise it is read too.
+    """
+
+    def __init__(self, fh, offset=0, resume=False):
+        self.fh = fh
+        self.resume = resume
+        if offset and os.fstat(fh.fileno()).st_size < offset:
+            offset = 0
+        if offset:
+            fh.seek(offset)
+        self.offset = offset
+
+    def __iter__(self):
+        for line in self.fh:
+            if self.resume and not line.endswith(b'\n'):
+                break
+            self.offset += len(line)
+            yield line.decode('utf-8', 'replace')
+
+
+def write_ndjson(events, outfh):
+    """Write each event to outfh as a line of json as it is produced."""
+    for event in events:
+        outfh.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+def write_json(events, outfh):
+    """Write events to outfh as a json_dumps list, one event at a time."""
+    outfh.write('[')
+    sep = '\n'
+    for event in events:
+        outfh.write(sep + '\n'.join(
+            ' ' + line for line in json_dumps(event).splitlines()))
+        sep = ',\n'
+    outfh.write('\n]\n' if sep != '\n' else ']\n')
+
+
+def load_offset(offset_file):
+    """Return the byte offset saved in offset_file, or 0."""
+    try:
+        return int(util.load_file(offset_file).strip())
+    except (IOError, OSError, ValueError):
+        return 0
+
+
+def save_offset(offset_file, offset):
+    util.write_file(offset_file, '%d\n' % offset)
 
+
+def dump_events(cisource=None, rawdata=None):
     if not any([cisource, rawdata]):
         raise ValueError('Either cisource or rawdata parameters are required')
 
@@ -150,17 +241,7 @@ def dump_events(cisource=None, rawdata=None):
     else:
         data = cisource.readlines()
 
-    for line in data:
-        for match in CI_EVENT_MATCHES:
-            if match in line:
-                try:
-                    event = parse_ci_logline(line)
-                except ValueError:
-                    sys.stderr.write('Skipping invalid entry\n')
-                if event:
-                    events.append(event)
-
-    return events, data
+    return list(iter_events(data)), data
 
 
 def main():
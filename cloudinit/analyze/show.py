@@ -188,6 +188,43 @@ def generate_records(events, blame_sort=False,
     return boot_records
 
 
+def trace_to_events(trace):
+    """Convert a profile trace into start and finish events.
+
+    Events are nested by name, so that each event starts after and
+    finishes before its parent, as generate_records expects.
+    """
+    def finish(start, record):
+        event = start.copy()
+        event.update({
+            'event_type': 'finish',
+            'result': record['result'],
+            'timestamp': (record['timestamp'] +
+                          record['end'] - record['start']),
+        })
+        return event
+
+    events = []
+    stack = []
+    for record in sorted(trace['events'],
+                         key=lambda r: (r['timestamp'], r['name'].count('/'))):
+        while stack and not record['name'].startswith(stack[-1][0]['name'] +
+                                                      '/'):
+            events.append(finish(*stack.pop()))
+        start = {
+            'name': record['name'],
+            'description': record['description'],
+            'event_type': 'start',
+            'origin': 'cloudinit',
+            'timestamp': record['timestamp'],
+        }
+        events.append(start)
+        stack.append((start, record))
+    while stack:
+        events.append(finish(*stack.pop()))
+    return events
+
+
 def show_events(events, print_format):
     return generate_records(events, print_format=print_format)
 
@@ -0,0 +1,141 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import gzip
+import json
+import os
+from textwrap import dedent
+
+from six import StringIO
+
+from cloudinit.analyze import batch
+from cloudinit.reporting import handlers
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import write_file
+
+LOG = dedent("""\
+    2017-08-01 12:00:00,000 - util.py[DEBUG]: Cloud-init v. 17.1 running \
+'init' at Tue, 01 Aug 2017 12:00:00 +0000. Up 1.00 seconds.
+    2017-08-01 12:00:00,500 - handlers.py[DEBUG]: start: \
+init-network/config-ssh: running config-ssh with frequency once-per-instance
+    2017-08-01 12:00:01,500 - handlers.py[DEBUG]: finish: \
+init-network/config-ssh: FAIL: running config-ssh with frequency \
+once-per-instance
+    2017-08-01 12:00:02,000 - handlers.py[DEBUG]: finish: init-network: \
+SUCCESS: searching for network datasources
+""")
+
+
+class TestReadEvents(CiTestCase):
+
+    def test_reads_plain_and_gzipped_logs(self):
+        """Logs are parsed whether or not they are compressed."""
+        tmpd = self.tmp_dir()
+        plain = os.path.join(tmpd, 'cloud-init.log')
+        write_file(plain, LOG)
+        compressed = plain + '.gz'
+        with gzip.open(compressed, 'wb') as fh:
+            fh.write(LOG.encode())
+        expected = list(batch.read_events(plain))
+        self.assertEqual(
+            ['init-network', 'init-network/config-ssh',
+             'init-network/config-ssh', 'init-network'],
+            [e['name'] for e in expected])
+        self.assertEqual(expected, list(batch.read_events(compressed)))
+
+    def test_reads_event_dumps_and_profile_traces(self):
+        """Json inputs are event dumps or profile traces."""
+        tmpd = self.tmp_dir()
+        events = list(batch.read_events(self.write_log(tmpd)))
+        dump = os.path.join(tmpd, 'dump.json')
+        write_file(dump, json.dumps(events))
+        self.assertEqual(events, list(batch.read_events(dump)))
+        profile = os.path.join(tmpd, 'trace.json')
+        write_file(profile, '\n'.join([
+            json.dumps({'version': handlers.TRACE_VERSION}),
+            json.dumps({'name': 'init', 'description': 'd',
+                        'result': 'SUCCESS', 'timestamp': 1.0,
+                        'start': 0.0, 'end': 2.0})]))
+        self.assertEqual(
+            [('start', 1.0), ('finish', 3.0)],
+            [(e['event_type'], e['timestamp'])
+             for e in batch.read_events(profile)])
+
+    def test_logs_are_read_as_events_are_consumed(self):
+        """Log lines are parsed as the events are iterated."""
+        path = self.write_log(self.tmp_dir())
+        with mock.patch.object(batch.dump, 'parse_ci_logline',
+                               wraps=batch.dump.parse_ci_logline) as m_parse:
+            events = batch.read_events(path)
+            self.assertEqual(0, m_parse.call_count)
+            self.assertEqual('init-network', next(events)['name'])
+            self.assertEqual(1, m_parse.call_count)
+
+    def write_log(self, tmpd):
+        path = os.path.join(tmpd, 'cloud-init.log')
+        write_file(path, LOG)
+        return path
+
+
+class TestCollect(CiTestCase):
+
+    def test_percentile_uses_nearest_rank(self):
+        """Percentiles pick the nearest ranked value."""
+        values = list(range(1, 101))
+        self.assertEqual(50, batch.percentile(values, 50))
+        self.assertEqual(99, batch.percentile(values, 99))
+        self.assertEqual(1, batch.percentile([1], 95))
+        self.assertIsNone(batch.percentile([], 50))
+
+    def test_collect_aggregates_stages_and_modules(self):
+        """Durations and failures are aggregated per event name."""
+        tmpd = self.tmp_dir()
+        paths = []
+        for i in range(3):
+            path = os.path.join(tmpd, 'log%d' % i)
+            write_file(path, LOG)
+            paths.append(path)
+        paths.append(os.path.join(tmpd, 'missing'))
+        stats = batch.collect(paths, jobs=2)
+        self.assertEqual(4, stats.inputs)
+        self.assertEqual([paths[-1]], [p for (p, _e) in stats.errors])
+        rows = stats.rows()
+        self.assertEqual(
+            [('init-network', 'stage', 3, 0, 2.0),
+             ('init-network/config-ssh', 'module', 3, 3, 1.0)],
+            [(r['name'], r['kind'], r['count'], r['failures'], r['p95'])
+             for r in rows])
+
+    def test_event_kind_classifies_config_modules(self):
+        """Only config- events are modules, other nested events are not."""
+        self.assertEqual(
+            ['stage', 'module', 'event', 'event'],
+            [batch.event_kind(name) for name in (
+                'init-network', 'init-network/config-ssh',
+                'init-local/search-NoCloud',
+                'modules-final/config-write-files/write-file-1')])
+
+    def test_write_report_csv(self):
+        """The csv report has a header and one row per event name."""
+        stats = batch.BatchStats()
+        stats.add('a', [('init', 'stage', 2.0, False)])
+        stats.add('b', [('init', 'stage', 4.0, True)])
+        out = StringIO()
+        batch.write_report(stats, out, 'csv')
+        self.assertEqual(
+            'name,kind,count,failures,p50,p95,p99\n'
+            'init,stage,2,1,2.0,4.0,4.0\n', out.getvalue())
+
+    def test_write_report_json(self):
+        """The json report includes input and error counts."""
+        stats = batch.BatchStats()
+        stats.add('a', [('init', 'stage', 2.0, False)])
+        stats.add('b', [], 'No such file')
+        out = StringIO()
+        batch.write_report(stats, out, 'json')
+        report = json.loads(out.getvalue())
+        self.assertEqual(2, report['inputs'])
+        self.assertEqual([{'path': 'b', 'error': 'No such file'}],
+                         report['errors'])
+        self.assertEqual(['init'], [r['name'] for r in report['events']])
+
+# vi: ts=4 expandtab
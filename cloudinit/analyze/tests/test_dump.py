@@ -1,10 +1,14 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 from datetime import datetime
+import json
+from six import StringIO
 from textwrap import dedent
 
 from cloudinit.analyze.dump import (
-    dump_events, parse_ci_logline, parse_timestamp)
+    LogReader, dump_events, iter_events, json_dumps, load_offset,
+    parse_ci_logline, parse_timestamp, save_offset, write_json,
+    write_ndjson)
 from cloudinit.util import subp, write_file
 from cloudinit.tests.helpers import CiTestCase
 
@@ -135,6 +139,33 @@ class TestParseCILogLine(CiTestCase):
             'timestamp': timestamp}
         self.assertEqual(expected, parse_ci_logline(line))
 
+    def test_parse_logline_returns_event_for_cloud_init_log_events(self):
+        """Start and finish events in cloud-init.log format are parsed."""
+        dt = datetime.strptime(
+            '2017-08-08 20:05:07,147', '%Y-%m-%d %H:%M:%S,%f')
+        timestamp = float(dt.strftime('%s.%f'))
+        start = ('2017-08-08 20:05:07,147 - handlers.py[DEBUG]: start:'
+                 ' init-network/config-ssh: running config-ssh with'
+                 ' frequency once-per-instance\n')
+        finish = ('2017-08-08 20:05:07,147 - handlers.py[DEBUG]: finish:'
+                  ' init-network/config-ssh: FAIL: running config - ssh')
+        self.assertEqual(
+            {'description': ('running config-ssh with frequency'
+                             ' once-per-instance'),
+             'event_type': 'start',
+             'name': 'init-network/config-ssh',
+             'origin': 'cloudinit',
+             'timestamp': timestamp},
+            parse_ci_logline(start))
+        self.assertEqual(
+            {'description': 'running config - ssh',
+             'event_type': 'finish',
+             'name': 'init-network/config-ssh',
+             'origin': 'cloudinit',
+             'result': 'FAIL',
+             'timestamp': timestamp},
+            parse_ci_logline(finish))
+
     def test_parse_logline_returns_event_for_finish_events(self):
         """parse_ci_logline returns a finish event for a parsed log line."""
         line = ('2016-08-30 21:53:25.972325+00:00 y1 [CLOUDINIT]'
@@ -208,3 +239,69 @@ class TestDumpEvents(CiTestCase):
             'timestamp': 1472594005.972}]
         self.assertEqual(expected_events, events)
         self.assertEqual(SAMPLE_LOGS.splitlines(), [d.strip() for d in data])
+
+
+class TestStreamingDump(CiTestCase):
+
+    def test_iter_events_is_lazy(self):
+        """Events are yielded as lines are consumed."""
+        consumed = []
+
+        def lines():
+            for line in SAMPLE_LOGS.splitlines():
+                consumed.append(line)
+                yield line
+        events = iter_events(lines())
+        self.assertEqual('init-local', next(events)['name'])
+        self.assertEqual(1, len(consumed))
+
+    def test_iter_events_parses_each_line_once(self):
+        """A line matching several event markers yields one event."""
+        line = ('2017-08-08 20:05:07,147 - handlers.py[DEBUG]: start:'
+                ' init-network/config-x: finish: now')
+        self.assertEqual(1, len(list(iter_events([line]))))
+
+    def test_log_reader_resumes_from_offset(self):
+        """Only lines appended after the saved offset are read."""
+        log = self.tmp_path('log')
+        offset_file = self.tmp_path('offset')
+        write_file(log, 'one\ntwo\n')
+        with open(log, 'rb') as fh:
+            reader = LogReader(fh, load_offset(offset_file), resume=True)
+            self.assertEqual(['one\n', 'two\n'], list(reader))
+        save_offset(offset_file, reader.offset)
+        write_file(log, 'three\nfour', omode='ab')
+        with open(log, 'rb') as fh:
+            reader = LogReader(fh, load_offset(offset_file), resume=True)
+            self.assertEqual(['three\n'], list(reader))
+        self.assertEqual(14, reader.offset)
+
+    def test_log_reader_reads_final_line_unless_resuming(self):
+        """A final line without a newline is only held back to resume."""
+        log = self.tmp_path('log')
+        write_file(log, 'one\nlast')
+        with open(log, 'rb') as fh:
+            self.assertEqual(['one\n', 'last'], list(LogReader(fh)))
+
+    def test_log_reader_restarts_rotated_file(self):
+        """A file shorter than the offset is read from the start."""
+        log = self.tmp_path('log')
+        write_file(log, 'new\n')
+        with open(log, 'rb') as fh:
+            self.assertEqual(['new\n'], list(LogReader(fh, 100)))
+
+    def test_write_json_matches_json_dumps(self):
+        """Incremental json output matches json_dumps of the list."""
+        events, _data = dump_events(rawdata=SAMPLE_LOGS)
+        for sample in (events, events[:1], []):
+            out = StringIO()
+            write_json(iter(sample), out)
+            self.assertEqual(json_dumps(sample) + '\n', out.getvalue())
+
+    def test_write_ndjson_writes_an_event_per_line(self):
+        """Each event is a line of json."""
+        events, _data = dump_events(rawdata=SAMPLE_LOGS)
+        out = StringIO()
+        write_ndjson(iter(events), out)
+        self.assertEqual(
+            events, [json.loads(line) for line in out.getvalue().splitlines()])
@@ -0,0 +1,56 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from cloudinit.analyze.show import generate_records, trace_to_events
+from cloudinit.tests.helpers import CiTestCase
+
+
+def _record(name, timestamp, duration, result='SUCCESS'):
+    return {'name': name, 'description': 'running %s' % name,
+            'result': result, 'timestamp': timestamp, 'start': 10.0,
+            'end': 10.0 + duration, 'cpu': 0.0, 'subprocesses': 0,
+            'bytes_fetched': 0}
+
+
+class TestTraceToEvents(CiTestCase):
+
+    # Records are written in the order events finish.
+    trace = {'version': 1, 'events': [
+        _record('init-local/search-NoCloud', 100.5, 0.0),
+        _record('init-local/search-Ec2', 100.5, 1.0, 'FAIL'),
+        _record('init-local', 100.0, 2.0),
+        _record('modules-final/config-scripts-user', 200.25, 0.5),
+        _record('modules-final', 200.0, 1.0)]}
+
+    def test_events_are_nested_by_name(self):
+        """Children start after and finish before their parent."""
+        events = trace_to_events(self.trace)
+        self.assertEqual(
+            [('start', 'init-local'),
+             ('start', 'init-local/search-NoCloud'),
+             ('finish', 'init-local/search-NoCloud'),
+             ('start', 'init-local/search-Ec2'),
+             ('finish', 'init-local/search-Ec2'),
+             ('finish', 'init-local'),
+             ('start', 'modules-final'),
+             ('start', 'modules-final/config-scripts-user'),
+             ('finish', 'modules-final/config-scripts-user'),
+             ('finish', 'modules-final')],
+            [(e['event_type'], e['name']) for e in events])
+
+    def test_finish_events_carry_result_and_duration(self):
+        """Finish timestamps add the monotonic duration to the start."""
+        finishes = dict((e['name'], e) for e in trace_to_events(self.trace)
+                        if e['event_type'] == 'finish')
+        self.assertEqual('FAIL', finishes['init-local/search-Ec2']['result'])
+        self.assertEqual(101.5,
+                         finishes['init-local/search-Ec2']['timestamp'])
+        self.assertEqual(102.0, finishes['init-local']['timestamp'])
+
+    def test_events_generate_show_records(self):
+        """Converted events are usable by analyze show."""
+        [records] = generate_records(trace_to_events(self.trace),
+                                     print_format='%n %d')
+        self.assertIn('init-local/search-Ec2 01.00000', records)
+        self.assertIn('Total Time: 3.00000 seconds\n', records)
+
+# vi: ts=4 expandtab
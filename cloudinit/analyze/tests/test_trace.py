@@ -0,0 +1,122 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import json
+
+from cloudinit.analyze.trace import (
+    build_tree, chrome_trace, folded_stacks, format_trace)
+from cloudinit.tests.helpers import CiTestCase
+
+
+def _start(name, timestamp):
+    return {'event_type': 'start', 'name': name, 'timestamp': timestamp,
+            'description': 'running %s' % name, 'origin': 'cloudinit'}
+
+
+def _finish(name, timestamp, result='SUCCESS'):
+    event = _start(name, timestamp)
+    event.update({'event_type': 'finish', 'result': result})
+    return event
+
+
+EVENTS = [
+    _start('init-network', 10.0),
+    _start('init-network/config-ssh', 10.5),
+    _finish('init-network/config-ssh', 11.5),
+    _start('init-network/config-users-groups', 11.5),
+    _finish('init-network/config-users-groups', 12.0, 'FAIL'),
+    _finish('init-network', 13.0),
+    _start('modules-final', 20.0),
+    _start('modules-final/config-scripts-user', 20.0),
+]
+
+
+class TestBuildTree(CiTestCase):
+
+    def test_children_are_nested_below_parents(self):
+        """Events are nested by name into a tree of stages."""
+        roots = build_tree(EVENTS)
+        self.assertEqual(['init-network', 'modules-final'],
+                         [r.name for r in roots])
+        self.assertEqual(
+            ['init-network/config-ssh', 'init-network/config-users-groups'],
+            [c.name for c in roots[0].children])
+        self.assertEqual(3.0, roots[0].duration)
+        self.assertEqual('FAIL', roots[0].children[1].result)
+
+    def test_unfinished_events_end_with_their_children(self):
+        """Events without a finish are kept with an estimated end."""
+        [_init, final] = build_tree(EVENTS)
+        self.assertIsNone(final.result)
+        self.assertEqual(0.0, final.duration)
+
+    def test_interleaved_events_match_by_name(self):
+        """Events of concurrently run modules may finish in any order."""
+        [final] = build_tree([
+            _start('modules-final', 1.0),
+            _start('modules-final/config-a', 1.0),
+            _start('modules-final/config-b', 1.5),
+            _finish('modules-final/config-a', 3.0, 'FAIL'),
+            _start('modules-final/config-b/write-file-1', 3.5),
+            _finish('modules-final/config-b/write-file-1', 4.0),
+            _finish('modules-final/config-b', 4.0),
+            _finish('modules-final', 5.0)])
+        (config_a, config_b) = final.children
+        self.assertEqual((2.0, 'FAIL'), (config_a.duration, config_a.result))
+        self.assertEqual((2.5, 'SUCCESS'),
+                         (config_b.duration, config_b.result))
+        self.assertEqual(['modules-final/config-b/write-file-1'],
+                         [c.name for c in config_b.children])
+        self.assertEqual(4.0, final.duration)
+
+    def test_unmatched_finish_is_ignored(self):
+        """A finish without a start does not end other events."""
+        roots = build_tree([_start('init', 1.0), _finish('bogus', 2.0),
+                            _finish('init', 3.0)])
+        self.assertEqual(2.0, roots[0].duration)
+
+
+class TestTraceFormats(CiTestCase):
+
+    def test_chrome_trace_has_complete_events_per_stage_thread(self):
+        """Each stage is a thread holding complete ('X') events."""
+        trace = chrome_trace(build_tree(EVENTS))
+        events = trace['traceEvents']
+        self.assertEqual(
+            [('M', 1, 'thread_name'), ('X', 1, 'init-network'),
+             ('X', 1, 'config-ssh'), ('X', 1, 'config-users-groups'),
+             ('M', 2, 'thread_name'), ('X', 2, 'modules-final'),
+             ('X', 2, 'config-scripts-user')],
+            [(e['ph'], e['tid'], e['name']) for e in events])
+        ssh = events[2]
+        self.assertEqual(10500000, ssh['ts'])
+        self.assertEqual(1000000, ssh['dur'])
+        self.assertEqual('init-network/config-ssh', ssh['args']['name'])
+
+    def test_folded_stacks_report_self_time(self):
+        """Folded stacks exclude time spent in children."""
+        self.assertEqual(
+            'init-network 1500000\n'
+            'init-network;config-ssh 1000000\n'
+            'init-network;config-users-groups 500000\n'
+            'modules-final 0\n'
+            'modules-final;config-scripts-user 0\n',
+            folded_stacks(build_tree(EVENTS)))
+
+    def test_folded_stacks_sum_repeated_boots(self):
+        """Stacks seen in several boots are summed."""
+        events = [_start('init', 1.0), _finish('init', 2.0),
+                  _start('init', 5.0), _finish('init', 7.0)]
+        self.assertEqual('init 3000000\n',
+                         folded_stacks(build_tree(events)))
+
+    def test_format_trace_renders_json(self):
+        """The chrome format is serialized as json."""
+        loaded = json.loads(format_trace(EVENTS, 'chrome'))
+        self.assertEqual(7, len(loaded['traceEvents']))
+
+    def test_format_trace_rejects_unknown_format(self):
+        """Unknown formats raise ValueError."""
+        with self.assertRaises(ValueError):
+            format_trace(EVENTS, 'svg')
+
+# vi: ts=4 expandtab
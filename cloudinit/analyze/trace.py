@@ -0,0 +1,145 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Export cloud-init events as Chrome trace-event json or folded stacks."""
+
+import json
+
+from . import show
+
+TRACE_FORMATS = ('chrome', 'folded')
+
+
+class EventNode(object):
+    """An event and the events nested below it."""
+
+    def __init__(self, name, description, start):
+        self.name = name
+        self.description = description
+        self.start = start
+        self.end = None
+        self.result = None
+        self.children = []
+
+    @property
+    def short_name(self):
+        return self.name.split('/')[-1]
+
+    @property
+    def finish(self):
+        """The end of this event, estimated from its children if unknown."""
+        if self.end is not None:
+            return self.end
+        ends = [child.finish for child in self.children]
+        return max(ends + [self.start])
+
+    @property
+    def duration(self):
+        return self.finish - self.start
+
+    def walk(self, parents=()):
+        """Yield (stack, node) for this node and all nodes below it."""
+        stack = parents + (self.short_name,)
+        yield (stack, self)
+        for child in self.children:
+            for item in child.walk(stack):
+                yield item
+
+
+def build_tree(events):
+    """Rebuild the tree of start/finish events.
+
+    Events are nested by name, so 'init-network/config-ssh' is a child of
+    the enclosing 'init-network' event.  Return the list of top level
+    nodes, one per stage run.  Events that never finished are kept, their
+    end is estimated from their children.
+
+    Starts and finishes are matched by full name rather than by order, so
+    that events of modules run concurrently may interleave.
+    """
+    roots = []
+    running = {}
+    for event in events:
+        etype = show.event_type(event)
+        name = show.event_name(event)
+        if etype == 'start':
+            node = EventNode(name, event.get('description'),
+                             float(event['timestamp']))
+            parent = _running_parent(running, name)
+            if parent:
+                parent.children.append(node)
+            else:
+                roots.append(node)
+            running[name] = node
+        elif etype == 'finish':
+            node = running.pop(name, None)
+            if node is None:
+                continue
+            node.end = float(event['timestamp'])
+            node.result = event.get('result')
+    return roots
+
+
+def _running_parent(running, name):
+    """Return the running event nearest above name, or None."""
+    while '/' in name:
+        name = name.rsplit('/', 1)[0]
+        if name in running:
+            return running[name]
+    return None
+
+
+def _usec(seconds):
+    return int(round(seconds * 1000000))
+
+
+def chrome_trace(roots):
+    """Return the event tree as a Chrome trace-event document.
+
+    Each stage run is shown as its own thread so that stages started by
+    separate cloud-init processes do not overlap.
+    """
+    trace_events = []
+    for tid, root in enumerate(roots, 1):
+        trace_events.append({
+            'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+            'args': {'name': root.name}})
+        for (_stack, node) in root.walk():
+            trace_events.append({
+                'name': node.short_name, 'cat': 'cloudinit', 'ph': 'X',
+                'pid': 1, 'tid': tid, 'ts': _usec(node.start),
+                'dur': _usec(node.duration),
+                'args': {'name': node.name, 'description': node.description,
+                         'result': node.result}})
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def folded_stacks(roots):
+    """Return the event tree as folded stacks for flamegraph tools.
+
+    Each line is a ';' separated stack followed by the time in
+    microseconds spent in that event but not in its children.  Identical
+    stacks, such as those of repeated boots, are summed.
+    """
+    totals = {}
+    order = []
+    for root in roots:
+        for (stack, node) in root.walk():
+            own = node.duration - sum(c.duration for c in node.children)
+            key = ';'.join(stack)
+            if key not in totals:
+                totals[key] = 0
+                order.append(key)
+            totals[key] += max(_usec(own), 0)
+    return ''.join('%s %d\n' % (key, totals[key]) for key in order)
+
+
+def format_trace(events, trace_format):
+    """Render events in one of TRACE_FORMATS."""
+    roots = build_tree(events)
+    if trace_format == 'chrome':
+        return json.dumps(chrome_trace(roots), sort_keys=True) + '\n'
+    if trace_format == 'folded':
+        return folded_stacks(roots)
+    raise ValueError('Unknown trace format: %s' % trace_format)
+
+# vi: ts=4 expandtab
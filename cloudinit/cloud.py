@@ -53,6 +53,9 @@ class Cloud(object):
     def run(self, name, functor, args, freq=None, clear_on_fail=False):
         return self._runners.run(name, functor, args, freq, clear_on_fail)
 
+    def has_run(self, name, freq):
+        return self._runners.has_run(name, freq)
+
     def get_template_filename(self, name):
         fn = self.paths.template_tpl % (name)
         if not os.path.isfile(fn):
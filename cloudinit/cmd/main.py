@@ -22,11 +22,9 @@ import traceback
 from cloudinit import patcher
 patcher.patch()  # noqa
 
+from cloudinit import importer
 from cloudinit import log as logging
-from cloudinit import netinfo
 from cloudinit import signal_handler
-from cloudinit import sources
-from cloudinit import stages
 from cloudinit import url_helper
 from cloudinit import util
 from cloudinit import version
@@ -36,11 +34,14 @@ from cloudinit import reporting
 from cloudinit.reporting import events
 
 from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
-                                CLOUD_CONFIG)
+                                BASE_CONFIG_CACHE, CLOUD_CONFIG)
 
 from cloudinit import atomic_helper
 
-from cloudinit.dhclient_hook import LogDhclient
+# Only the init and modules subcommands need these.
+netinfo = importer.lazy_import('cloudinit.netinfo')
+sources = importer.lazy_import('cloudinit.sources')
+stages = importer.lazy_import('cloudinit.stages')
 
 
 # Welcome message template
@@ -239,7 +240,8 @@ def main_init(name, args):
         w_msg = welcome_format(name)
     else:
         w_msg = welcome_format("%s-local" % (name))
-    init = stages.Init(ds_deps=deps, reporter=args.reporter)
+    init = stages.Init(ds_deps=deps, reporter=args.reporter,
+                       base_cfg_cache=BASE_CONFIG_CACHE)
     # Stage 1
     init.read_cfg(extract_fns(args))
     # Stage 2
@@ -465,7 +467,8 @@ def main_modules(action_name, args):
     # 5. Run the modules for the given stage name
     # 6. Done!
     w_msg = welcome_format("%s:%s" % (action_name, name))
-    init = stages.Init(ds_deps=[], reporter=args.reporter)
+    init = stages.Init(ds_deps=[], reporter=args.reporter,
+                       base_cfg_cache=BASE_CONFIG_CACHE)
     # Stage 1
     init.read_cfg(extract_fns(args))
     # Stage 2
@@ -514,7 +517,8 @@ def main_single(name, args):
     # 6. Done!
     mod_name = args.name
     w_msg = welcome_format(name)
-    init = stages.Init(ds_deps=[], reporter=args.reporter)
+    init = stages.Init(ds_deps=[], reporter=args.reporter,
+                       base_cfg_cache=BASE_CONFIG_CACHE)
     # Stage 1
     init.read_cfg(extract_fns(args))
     # Stage 2
@@ -573,6 +577,7 @@ def main_single(name, args):
 
 
 def dhclient_hook(name, args):
+    from cloudinit.dhclient_hook import LogDhclient
     record = LogDhclient(args)
     record.check_hooks_dir()
     record.record()
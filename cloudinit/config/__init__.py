@@ -18,6 +18,10 @@ LOG = logging.getLogger(__name__)
 # name in the lookup path...
 MOD_PREFIX = "cc_"
 
+# Module attributes listing the resources a module reads and writes, see
+# the RES_* constants in cloudinit.settings.
+RESOURCE_ATTRS = ('reads', 'writes')
+
 
 def form_module_name(name):
     canon_name = name.replace("-", "_")
@@ -42,6 +46,40 @@ def fixup_module(mod, def_freq=PER_INSTANCE):
         setattr(mod, 'distros', [])
     if not hasattr(mod, 'osfamilies'):
         setattr(mod, 'osfamilies', [])
+    # A module declaring neither reads nor writes may use anything.
+    if hasattr(mod, 'reads') or hasattr(mod, 'writes'):
+        for attr in RESOURCE_ATTRS:
+            if not hasattr(mod, attr):
+                setattr(mod, attr, [])
+    else:
+        for attr in RESOURCE_ATTRS:
+            setattr(mod, attr, None)
     return mod
 
+
+def _resources_overlap(resources, others):
+    for res in resources:
+        for other in others:
+            if res == other:
+                return True
+            if res.startswith('/') and other.startswith('/'):
+                (shorter, longer) = sorted((res, other), key=len)
+                if longer.startswith(shorter.rstrip('/') + '/'):
+                    return True
+    return False
+
+
+def modules_conflict(mod, other):
+    """Return True if mod and other must not run concurrently.
+
+    They conflict when either writes a resource the other reads or writes,
+    or when either does not declare the resources it uses.  Paths conflict
+    with the paths below them.
+    """
+    if mod.writes is None or other.writes is None:
+        return True
+    return (_resources_overlap(mod.writes,
+                               list(other.reads) + list(other.writes)) or
+            _resources_overlap(other.writes, mod.reads))
+
 # vi: ts=4 expandtab
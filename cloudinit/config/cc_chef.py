@@ -74,12 +74,17 @@ import itertools
 import json
 import os
 
+from cloudinit.settings import RES_NETWORK, RES_PACKAGES
 from cloudinit import templater
 from cloudinit import url_helper
 from cloudinit import util
 
 import six
 
+reads = [RES_NETWORK]
+writes = [RES_PACKAGES, '/etc/chef', '/var/log/chef', '/var/lib/chef',
+          '/var/cache/chef', '/var/backups/chef', '/var/run/chef']
+
 RUBY_VERSION_DEFAULT = "1.8"
 
 CHEF_DIRS = tuple([
@@ -187,6 +192,25 @@ def get_template_params(iid, chef_cfg, log):
     return params
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the packages install_chef installs."""
+    if 'chef' not in cfg:
+        return
+    chef_cfg = cfg['chef']
+    force_install = util.get_cfg_option_bool(chef_cfg,
+                                             'force_install', default=False)
+    if is_installed() and not force_install:
+        return
+    install_type = util.get_cfg_option_str(chef_cfg, 'install_type',
+                                           'packages')
+    if install_type == 'gems':
+        ruby_version = util.get_cfg_option_str(chef_cfg, 'ruby_version',
+                                               RUBY_VERSION_DEFAULT)
+        cloud.distro.queue_packages(get_ruby_packages(ruby_version))
+    elif install_type == 'packages':
+        cloud.distro.queue_packages(('chef',))
+
+
 def handle(name, cfg, cloud, log, _args):
     """Handler method activated by cloud-init."""
 
@@ -687,6 +687,7 @@ def read_parttbl(device):
         util.logexc(LOG, "Failed reading the partition table %s" % e)
 
     udevadm_settle()
+    util.invalidate_blkid_index()
 
 
 def exec_mkpart_mbr(device, layout):
@@ -737,14 +738,18 @@ def exec_mkpart(table_type, device, layout):
     return get_dyn_func("exec_mkpart_%s", table_type, device, layout)
 
 
-def udevadm_settle():
-    util.subp(['udevadm', 'settle'])
+def udevadm_settle(exists=None):
+    """Wait for udev to process its events, or until path exists does."""
+    settle_cmd = ['udevadm', 'settle']
+    if exists:
+        settle_cmd.append('--exit-if-exists=%s' % exists)
+    util.subp(settle_cmd)
 
 
 def assert_and_settle_device(device):
     """Assert that device exists and settle so it is fully recognized."""
     if not os.path.exists(device):
-        udevadm_settle()
+        udevadm_settle(exists=device)
         if not os.path.exists(device):
             raise RuntimeError("Device %s did not exist and was not created "
                                "with a udevamd settle." % device)
@@ -996,5 +1001,7 @@ def mkfs(fs_cfg):
         util.subp(fs_cmd, shell=shell)
     except Exception as e:
         raise Exception("Failed to exec of '%s':\n%s" % (fs_cmd, e))
+    finally:
+        util.invalidate_blkid_index()
 
 # vi: ts=4 expandtab
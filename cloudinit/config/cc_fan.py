@@ -82,6 +82,13 @@ def stop_update_start(service, config_file, content, systemd=False):
     return ret
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the ubuntu-fan package when handle would install it."""
+    cfgin = cfg.get('fan')
+    if cfgin and cfgin.get('config') and not util.which('fanctl'):
+        cloud.distro.queue_packages(['ubuntu-fan'])
+
+
 def handle(name, cfg, cloud, log, args):
     cfgin = cfg.get('fan')
     if not cfgin:
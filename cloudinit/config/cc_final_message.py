@@ -38,6 +38,8 @@ from cloudinit import version
 from cloudinit.settings import PER_ALWAYS
 
 frequency = PER_ALWAYS
+# No reads or writes are declared: the final message reports on every
+# module of the stage, so it runs only once all those before it finished.
 
 # Jinja formated default message
 FINAL_MESSAGE_DEF = (
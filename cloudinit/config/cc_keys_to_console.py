@@ -32,10 +32,12 @@ key can be used. By default ``ssh-dss`` keys are not written to console.
 
 import os
 
-from cloudinit.settings import PER_INSTANCE
+from cloudinit.settings import PER_INSTANCE, RES_CONSOLE
 from cloudinit import util
 
 frequency = PER_INSTANCE
+reads = ['/etc/ssh']
+writes = [RES_CONSOLE]
 
 # This is a tool that cloud init provides
 HELPER_TOOL_TPL = '%s/cloud-init/write-ssh-key-fingerprints'
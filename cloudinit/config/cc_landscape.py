@@ -84,6 +84,13 @@ LSC_BUILTIN_CFG = {
 }
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the landscape-client package handle installs."""
+    ls_cloudcfg = cfg.get("landscape", {})
+    if ls_cloudcfg and isinstance(ls_cloudcfg, dict):
+        cloud.distro.queue_packages(('landscape-client',))
+
+
 def handle(_name, cfg, cloud, log, _args):
     """
     Basically turn a top level 'landscape' entry with a 'client' dict
@@ -53,6 +53,27 @@ import os
 distros = ['ubuntu']
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the packages handle installs."""
+    lxd_cfg = cfg.get('lxd')
+    if lxd_cfg and isinstance(lxd_cfg, dict):
+        init_cfg = lxd_cfg.get('init')
+        if not isinstance(init_cfg, dict):
+            init_cfg = {}
+        cloud.distro.queue_packages(get_required_packages(init_cfg))
+
+
+def get_required_packages(init_cfg):
+    """Return the packages lxd init with init_cfg needs installed."""
+    packages = []
+    if not util.which("lxd"):
+        packages.append('lxd')
+
+    if init_cfg.get("storage_backend") == "zfs" and not util.which('zfs'):
+        packages.append('zfs')
+    return packages
+
+
 def handle(name, cfg, cloud, log, args):
     # Get config
     lxd_cfg = cfg.get('lxd')
@@ -79,13 +100,7 @@ def handle(name, cfg, cloud, log, args):
         bridge_cfg = {}
 
     # Install the needed packages
-    packages = []
-    if not util.which("lxd"):
-        packages.append('lxd')
-
-    if init_cfg.get("storage_backend") == "zfs" and not util.which('zfs'):
-        packages.append('zfs')
-
+    packages = get_required_packages(init_cfg)
     if len(packages):
         try:
             cloud.distro.install_packages(packages)
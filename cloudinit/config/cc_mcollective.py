@@ -58,8 +58,11 @@ from six import BytesIO
 from configobj import ConfigObj
 
 from cloudinit import log as logging
+from cloudinit.settings import RES_PACKAGES
 from cloudinit import util
 
+writes = [RES_PACKAGES, '/etc/mcollective']
+
 PUBCERT_FILE = "/etc/mcollective/ssl/server-public.pem"
 PRICERT_FILE = "/etc/mcollective/ssl/server-private.pem"
 SERVER_CFG = '/etc/mcollective/server.cfg'
@@ -124,6 +127,12 @@ def configure(config, server_cfg=SERVER_CFG,
     util.write_file(server_cfg, contents.getvalue(), mode=0o644)
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the mcollective package handle installs."""
+    if 'mcollective' in cfg:
+        cloud.distro.queue_packages(("mcollective",))
+
+
 def handle(name, cfg, cloud, log, _args):
 
     # If there isn't a mcollective key in the configuration don't do anything
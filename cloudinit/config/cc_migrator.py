@@ -52,6 +52,7 @@ def _migrate_canon_sems(cloud):
                     new_path = os.path.join(sem_path, canon_name + ext)
                     shutil.move(full_path, new_path)
                     am_adjusted += 1
+        helpers.file_semaphores(sem_path).reload()
     return am_adjusted
 
 
@@ -66,7 +67,7 @@ def _migrate_legacy_sems(cloud, log):
     for sem_path in paths:
         if not sem_path or not os.path.exists(sem_path):
             continue
-        sem_helper = helpers.FileSemaphores(sem_path)
+        sem_helper = helpers.file_semaphores(sem_path)
         for (mod_name, migrate_to) in legacy_adjust.items():
             possibles = [mod_name, helpers.canon_sem_name(mod_name)]
             old_exists = []
@@ -94,6 +94,12 @@ schema = {
 __doc__ = get_schema_doc(schema)  # Supplement python help()
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the ntp package when handle would install it."""
+    if 'ntp' in cfg and ntp_installable() and not util.which('ntpd'):
+        cloud.distro.queue_packages(['ntp'])
+
+
 def handle(name, cfg, cloud, log, _args):
     """Enable and configure ntp."""
     if 'ntp' not in cfg:
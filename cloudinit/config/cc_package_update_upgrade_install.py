@@ -71,6 +71,12 @@ def _fire_reboot(log, wait_attempts=6, initial_sleep=1, backoff=2):
                         " after %s seconds!") % (int(elapsed)))
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the configured packages, others' are installed with them."""
+    cloud.distro.queue_packages(
+        util.get_cfg_option_list(cfg, 'packages', []))
+
+
 def handle(_name, cfg, cloud, log, _args):
     # Handle the old style + new config names
     update = _multi_cfg_bool_get(cfg, 'apt_update', 'package_update')
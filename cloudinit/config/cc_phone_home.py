@@ -43,9 +43,11 @@ keys to post. Available keys are:
 from cloudinit import templater
 from cloudinit import util
 
-from cloudinit.settings import PER_INSTANCE
+from cloudinit.settings import PER_INSTANCE, RES_NETWORK
 
 frequency = PER_INSTANCE
+reads = [RES_NETWORK, '/etc/ssh']
+writes = []
 
 POST_LIST_ALL = [
     'pub_key_dsa',
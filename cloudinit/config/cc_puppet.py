@@ -60,8 +60,13 @@ import os
 import socket
 
 from cloudinit import helpers
+from cloudinit.settings import RES_NETWORK, RES_PACKAGES
 from cloudinit import util
 
+reads = [RES_NETWORK]
+writes = [RES_PACKAGES, '/etc/puppet', '/etc/default/puppet',
+          '/var/lib/puppet']
+
 PUPPET_CONF_PATH = '/etc/puppet/puppet.conf'
 PUPPET_SSL_CERT_DIR = '/var/lib/puppet/ssl/certs/'
 PUPPET_SSL_DIR = '/var/lib/puppet/ssl'
@@ -84,6 +89,16 @@ def _autostart_puppet(log):
                   " puppet services on this system"))
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the puppet package handle installs."""
+    if 'puppet' not in cfg:
+        return
+    puppet_cfg = cfg['puppet']
+    if util.get_cfg_option_bool(puppet_cfg, 'install', True):
+        version = util.get_cfg_option_str(puppet_cfg, 'version', None)
+        cloud.distro.queue_packages(('puppet', version))
+
+
 def handle(name, cfg, cloud, log, _args):
     # If there isn't a puppet key in the configuration don't do anything
     if 'puppet' not in cfg:
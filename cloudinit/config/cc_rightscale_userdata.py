@@ -51,13 +51,15 @@ user scripts configuration directory, to be run later by ``cc_scripts_user``.
 
 import os
 
-from cloudinit.settings import PER_INSTANCE
+from cloudinit.settings import PER_INSTANCE, RES_NETWORK
 from cloudinit import url_helper as uhelp
 from cloudinit import util
 
 from six.moves.urllib_parse import parse_qs
 
 frequency = PER_INSTANCE
+reads = [RES_NETWORK]
+writes = ['/var/lib/cloud']
 
 MY_NAME = "cc_rightscale_userdata"
 MY_HOOKNAME = 'CLOUD_INIT_REMOTE_HOOK'
@@ -37,11 +37,20 @@ specified with ``public_key`` and ``private_key`` respectively.
 
 import os
 
+from cloudinit.settings import RES_PACKAGES
 from cloudinit import util
 
+writes = [RES_PACKAGES, '/etc/salt']
+
 # Note: see http://saltstack.org/topics/installation/
 
 
+def queue_packages(_name, cfg, cloud, _log, _args):
+    """Queue the salt package handle installs."""
+    if 'salt_minion' in cfg:
+        cloud.distro.queue_packages(('salt-minion',))
+
+
 def handle(name, cfg, cloud, log, _args):
     # If there isn't a salt key in the configuration don't do anything
     if 'salt_minion' not in cfg:
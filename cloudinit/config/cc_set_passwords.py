@@ -123,30 +123,28 @@ def handle(_name, cfg, cloud, log, args):
         for line in plist:
             u, p = line.split(':', 1)
             if prog.match(p) is not None and ":" not in p:
-                hashed_plist_in.append("%s:%s" % (u, p))
+                hashed_plist_in.append((u, p))
                 hashed_users.append(u)
             else:
                 if p == "R" or p == "RANDOM":
                     p = rand_user_password()
                     randlist.append("%s:%s" % (u, p))
-                plist_in.append("%s:%s" % (u, p))
+                plist_in.append((u, p))
                 users.append(u)
 
-        ch_in = '\n'.join(plist_in) + '\n'
         if users:
             try:
                 log.debug("Changing password for %s:", users)
-                util.subp(['chpasswd'], ch_in)
+                cloud.distro.set_passwds(plist_in)
             except Exception as e:
                 errors.append(e)
                 util.logexc(
                     log, "Failed to set passwords with chpasswd for %s", users)
 
-        hashed_ch_in = '\n'.join(hashed_plist_in) + '\n'
         if hashed_users:
             try:
                 log.debug("Setting hashed password for %s:", hashed_users)
-                util.subp(['chpasswd', '-e'], hashed_ch_in)
+                cloud.distro.set_passwds(hashed_plist_in, hashed=True)
             except Exception as e:
                 errors.append(e)
                 util.logexc(
@@ -37,7 +37,9 @@ will be generated. The key types to generate can be specified using the
 ``ssh_genkeytypes`` config flag, which accepts a list of key types to use. For
 each key type for which this module has been instructed to create a keypair, if
 a key of the same type is already present on the system (i.e. if
-``ssh_deletekeys`` was false), no key will be generated.
+``ssh_deletekeys`` was false), no key will be generated. The key types are
+generated concurrently and the output of ``ssh-keygen`` is written in the order
+they are listed.
 
 Supported key types for the ``ssh_keys`` and the ``ssh_genkeytypes`` config
 flags are:
@@ -98,6 +100,7 @@ import os
 import sys
 
 from cloudinit.distros import ug_util
+from cloudinit import parallel
 from cloudinit import ssh_util
 from cloudinit import util
 
@@ -107,6 +110,8 @@ DISABLE_ROOT_OPTS = (
     " rather than the user \\\"root\\\".\';echo;sleep 10\"")
 
 GENERATE_KEY_NAMES = ['rsa', 'dsa', 'ecdsa', 'ed25519']
+# Key types generated at the same time, ssh-keygen is mostly cpu bound.
+GENERATE_KEY_WORKERS = 4
 KEY_FILE_TPL = '/etc/ssh/ssh_host_%s_key'
 
 CONFIG_KEY_TO_FILE = {}
@@ -159,26 +164,38 @@ def handle(_name, cfg, cloud, log, _args):
                                            GENERATE_KEY_NAMES)
         lang_c = os.environ.copy()
         lang_c['LANG'] = 'C'
+        to_generate = []
         for keytype in genkeys:
             keyfile = KEY_FILE_TPL % (keytype)
             if os.path.exists(keyfile):
                 continue
             util.ensure_dir(os.path.dirname(keyfile))
+            to_generate.append((keytype, keyfile))
+
+        def keygen(item):
+            (keytype, keyfile) = item
             cmd = ['ssh-keygen', '-t', keytype, '-N', '', '-f', keyfile]
+            return util.subp(cmd, capture=True, env=lang_c)[0]
+
+        # TODO(harlowja): Is this guard needed?
+        with util.SeLinuxGuard("/etc/ssh", recursive=True):
+            results = parallel.map_completed(
+                keygen, to_generate, max_workers=GENERATE_KEY_WORKERS)
 
-            # TODO(harlowja): Is this guard needed?
-            with util.SeLinuxGuard("/etc/ssh", recursive=True):
-                try:
-                    out, err = util.subp(cmd, capture=True, env=lang_c)
-                    sys.stdout.write(util.decode_binary(out))
-                except util.ProcessExecutionError as e:
-                    err = util.decode_binary(e.stderr).lower()
-                    if (e.exit_code == 1 and
-                            err.lower().startswith("unknown key")):
-                        log.debug("ssh-keygen: unknown key type '%s'", keytype)
-                    else:
-                        util.logexc(log, "Failed generating key type %s to "
-                                    "file %s", keytype, keyfile)
+        # Report in ssh_genkeytypes order, whichever key finished first.
+        for ((keytype, keyfile), (out, exc)) in zip(to_generate, results):
+            try:
+                if exc is not None:
+                    raise exc
+                sys.stdout.write(util.decode_binary(out))
+            except util.ProcessExecutionError as e:
+                err = util.decode_binary(e.stderr).lower()
+                if (e.exit_code == 1 and
+                        err.lower().startswith("unknown key")):
+                    log.debug("ssh-keygen: unknown key type '%s'", keytype)
+                else:
+                    util.logexc(log, "Failed generating key type %s to "
+                                "file %s", keytype, keyfile)
 
     try:
         (users, _groups) = ug_util.normalize_users_groups(cfg, cloud.distro)
@@ -31,9 +31,13 @@ import hashlib
 from cloudinit.simpletable import SimpleTable
 
 from cloudinit.distros import ug_util
+from cloudinit.settings import RES_CONSOLE, RES_USERS
 from cloudinit import ssh_util
 from cloudinit import util
 
+reads = [RES_USERS, '/etc/ssh']
+writes = [RES_CONSOLE]
+
 
 def _split_hash(bin_hash):
     split_up = []
@@ -105,7 +109,7 @@ def handle(name, cfg, cloud, log, _args):
     hash_meth = util.get_cfg_option_str(cfg, "authkey_hash", "md5")
     (users, _groups) = ug_util.normalize_users_groups(cfg, cloud.distro)
     for (user_name, _cfg) in users.items():
-        (key_fn, key_entries) = ssh_util.extract_authorized_keys(user_name)
+        (key_fn, key_entries) = ssh_util.load_authorized_keys(user_name)
         _pprint_key_entries(user_name, key_fn,
                             key_entries, hash_meth)
 
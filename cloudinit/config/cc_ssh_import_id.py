@@ -31,6 +31,7 @@ either ``lp:`` for launchpad or ``gh:`` for github to the username.
 """
 
 from cloudinit.distros import ug_util
+from cloudinit import ssh_util
 from cloudinit import util
 import pwd
 
@@ -105,5 +106,8 @@ def import_ssh_ids(ids, user, log):
     except util.ProcessExecutionError as exc:
         util.logexc(log, "Failed to run command to import %s ssh ids", user)
         raise exc
+    finally:
+        # ssh-import-id wrote the keys, cloud-init's parse of them is stale.
+        ssh_util.forget_authorized_keys(user)
 
 # vi: ts=4 expandtab
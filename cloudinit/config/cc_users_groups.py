@@ -15,8 +15,10 @@ options, see the ``Including users and groups`` config example.
 Groups to add to the system can be specified as a list under the ``groups``
 key. Each entry in the list should either contain a the group name as a string,
 or a dictionary with the group name as the key and a list of users who should
-be members of the group as the value. **Note**: Groups are added before users,
-so any users in a group list must already exist on the system.
+be members of the group as the value. **Note**: Groups are added before users
+and their members once the users are created, so any users in a group list must
+already exist on the system or be in the ``users`` list. On FreeBSD members are
+added before users and must already exist.
 
 The ``users`` config key takes a list of users to configure. The first entry in
 this list is used as the default user for the system. To preserve the standard
@@ -118,9 +120,6 @@ frequency = PER_INSTANCE
 
 def handle(name, cfg, cloud, _log, _args):
     (users, groups) = ug_util.normalize_users_groups(cfg, cloud.distro)
-    for (name, members) in groups.items():
-        cloud.distro.create_group(name, members)
-    for (user, config) in users.items():
-        cloud.distro.create_user(user, **config)
+    cloud.distro.create_users(users, groups)
 
 # vi: ts=4 expandtab
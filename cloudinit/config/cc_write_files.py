@@ -12,6 +12,11 @@ Write Files
 Write out arbitrary content to files, optionally setting permissions. Content
 can be specified in plain text or binary. Data encoded with either base64 or
 binary gzip data can be specified and will be decoded before being written.
+Content is decoded a chunk at a time into a temporary file which then replaces
+the target path, so large files neither take much memory nor appear partially
+written. Setting ``write_files_workers`` to more than 1 writes that many files
+at once; entries for the same path are still written in order. The time taken
+to write each file and its throughput are reported as events.
 
 .. note::
     if multiline data is provided, care should be taken to ensure that it
@@ -44,13 +49,20 @@ binary gzip data can be specified and will be decoded before being written.
             ...
           path: /bin/arch
           permissions: '0555'
+    write_files_workers: <number of files to write at once>
 """
 
 import base64
+import functools
 import os
+import re
 import six
+import time
+import zlib
 
 from cloudinit import log as logging
+from cloudinit import parallel
+from cloudinit.reporting import events
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import util
 
@@ -61,16 +73,26 @@ DEFAULT_OWNER = "root:root"
 DEFAULT_PERMS = 0o644
 UNKNOWN_ENC = 'text/plain'
 
+# Content is decoded this many bytes at a time, which bounds the memory
+# each file takes beyond its content in the config.
+CHUNK_SIZE = 64 * 1024
+
+# b64decode ignores characters outside of the alphabet, such as the
+# newlines of yaml block scalars.
+B64_IGNORED = re.compile(b'[^A-Za-z0-9+/=]')
+
 LOG = logging.getLogger(__name__)
 
 
-def handle(name, cfg, _cloud, log, _args):
+def handle(name, cfg, cloud, log, _args):
     files = cfg.get('write_files')
     if not files:
         log.debug(("Skipping module named %s,"
                    " no/empty 'write_files' key in configuration"), name)
         return
-    write_files(name, files)
+    write_files(name, files, reporter=cloud.reporter,
+                max_workers=util.get_cfg_option_int(
+                    cfg, 'write_files_workers', 1))
 
 
 def canonicalize_extraction(encoding_type):
@@ -93,10 +115,13 @@ def canonicalize_extraction(encoding_type):
     return [UNKNOWN_ENC]
 
 
-def write_files(name, files):
+def write_files(name, files, reporter=None, max_workers=1):
     if not files:
         return
 
+    writes = []
+    depends = []
+    last_write = {}
     for (i, f_info) in enumerate(files):
         path = f_info.get('path')
         if not path:
@@ -104,12 +129,47 @@ def write_files(name, files):
                         i + 1, name)
             continue
         path = os.path.abspath(path)
+        # Later entries for a path replace what earlier ones wrote.
+        depends.append([last_write[path]] if path in last_write else [])
+        last_write[path] = len(writes)
+        writes.append((i, path, f_info))
+
+    # Each file is reported as a child of reporter, the module's event, as
+    # it is written.
+    errors = {}
+    for (index, failure, exc) in parallel.iter_dependent(
+            functools.partial(_write_file, reporter), writes, depends,
+            max_workers):
+        if failure or exc:
+            errors[index] = failure or exc
+    if errors:
+        # The error of the first entry, whichever failed first.
+        raise errors[min(errors)]
+
+
+def _write_file(reporter, write):
+    (i, path, f_info) = write
+    with events.ReportEventStack(
+            name="write-file-%d" % (i + 1), description="writing %s" % path,
+            parent=reporter,
+            reporting_enabled=None if reporter else False) as myrep:
+        start = time.time()
         extractions = canonicalize_extraction(f_info.get('encoding'))
-        contents = extract_contents(f_info.get('content', ''), extractions)
+        chunks = extract_chunks(f_info.get('content', ''), extractions)
         (u, g) = util.extract_usergroup(f_info.get('owner', DEFAULT_OWNER))
         perms = decode_perms(f_info.get('permissions'), DEFAULT_PERMS)
-        util.write_file(path, contents, mode=perms)
-        util.chownbyname(path, u, g)
+        try:
+            size = util.write_file_chunks(path, chunks, mode=perms)
+            util.chownbyname(path, u, g)
+        except Exception as e:
+            util.logexc(LOG, "Failed writing %s", path)
+            myrep.result = events.status.FAIL
+            return e
+        elapsed = max(time.time() - start, 0.000001)
+        myrep.message = (
+            "wrote %s bytes to %s in %.3f seconds (%.1f KiB/s)"
+            % (size, path, elapsed, size / elapsed / 1024))
+    return None
 
 
 def decode_perms(perm, default):
@@ -134,15 +194,63 @@ def decode_perms(perm, default):
         return default
 
 
-def extract_contents(contents, extraction_types):
-    result = contents
+def extract_chunks(contents, extraction_types):
+    """Return an iterator of the decoded contents, a chunk at a time."""
+    result = _chunks(contents)
     for t in extraction_types:
         if t == 'application/x-gzip':
-            result = util.decomp_gzip(result, quiet=False, decode=False)
+            result = _gunzip_chunks(result)
         elif t == 'application/base64':
-            result = base64.b64decode(result)
+            result = _b64decode_chunks(result)
         elif t == UNKNOWN_ENC:
             pass
     return result
 
+
+def _chunks(contents, size=CHUNK_SIZE):
+    for start in range(0, len(contents), size):
+        yield util.encode_text(contents[start:start + size])
+
+
+def _b64decode_chunks(chunks):
+    pending = b''
+    for chunk in chunks:
+        pending += B64_IGNORED.sub(b'', chunk)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield base64.b64decode(pending[:usable])
+            pending = pending[usable:]
+    if pending:
+        yield base64.b64decode(pending)
+
+
+def _gunzip_chunks(chunks, size=CHUNK_SIZE):
+    # As gzip.GzipFile, read concatenated gzip members as one stream and
+    # skip the NUL padding that may follow a member.
+    decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    between = False
+    try:
+        for chunk in chunks:
+            while chunk:
+                if between:
+                    chunk = chunk.lstrip(b'\0')
+                    if not chunk:
+                        break
+                    decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    between = False
+                yield decomp.decompress(chunk, size)
+                chunk = decomp.unconsumed_tail
+                if not chunk and decomp.unused_data:
+                    chunk = decomp.unused_data
+                    yield decomp.flush()
+                    between = True
+        if not between:
+            yield decomp.flush()
+    except zlib.error as e:
+        raise util.DecompressionError(six.text_type(e))
+    if not between and not getattr(decomp, 'eof', True):
+        raise util.DecompressionError(
+            "Compressed file ended before the end-of-stream marker was "
+            "reached")
+
 # vi: ts=4 expandtab
@@ -0,0 +1,174 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Index of the config modules shipped in cloudinit.config.
+
+The index maps each cc_* module name to the frequency, distros,
+osfamilies and resources it declares, read from its source without
+importing it.
+Modules whose metadata is not a plain literal (or a constant imported
+from cloudinit.settings or cloudinit.distros), or that do not define a
+top level handle function, are indexed as None and are imported as
+before.  The index is cached as json and rebuilt when any module file
+changes.
+"""
+
+import ast
+import json
+import os
+
+from cloudinit import config
+from cloudinit import config_cache
+from cloudinit import importer
+from cloudinit import log as logging
+from cloudinit import settings
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+METADATA = ('frequency', 'distros', 'osfamilies') + config.RESOURCE_ATTRS
+DEFAULTS = {'frequency': settings.PER_INSTANCE, 'distros': [],
+            'osfamilies': [], 'reads': None, 'writes': None}
+PACKAGE = 'cloudinit.config'
+PACKAGE_DIR = os.path.dirname(os.path.abspath(config.__file__))
+
+# Constants config modules may import for their metadata.
+KNOWN_CONSTANTS = {
+    'cloudinit.settings': settings,
+    'cloudinit.distros': {'ALL_DISTROS': 'all'},
+}
+
+
+class _Dynamic(Exception):
+    pass
+
+
+def _constant(source, name):
+    if isinstance(source, dict):
+        return source[name]
+    return getattr(source, name)
+
+
+def _static_value(node, names):
+    if isinstance(node, ast.Name) and node.id in names:
+        return names[node.id]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_static_value(elt, names) for elt in node.elts]
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        raise _Dynamic()
+
+
+def _assigned_names(node):
+    return set(n.id for n in ast.walk(node)
+               if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store))
+
+
+def scan_module(path):
+    """Return the metadata declared by the config module at path.
+
+    Return None when the module must be imported to know it.
+    """
+    tree = ast.parse(util.load_file(path, decode=False))
+    names = {}
+    found = {}
+    has_handle = False
+    for stmt in tree.body:
+        if isinstance(stmt, ast.ImportFrom) and stmt.level == 0:
+            source = KNOWN_CONSTANTS.get(stmt.module)
+            for alias in stmt.names:
+                try:
+                    value = _constant(source, alias.name)
+                except (AttributeError, KeyError, TypeError):
+                    continue
+                names[alias.asname or alias.name] = value
+        elif isinstance(stmt, ast.FunctionDef):
+            if stmt.name == 'handle':
+                has_handle = True
+        elif (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and
+                isinstance(stmt.targets[0], ast.Name) and
+                stmt.targets[0].id in METADATA):
+            if stmt.targets[0].id in found:
+                return None
+            try:
+                found[stmt.targets[0].id] = _static_value(stmt.value, names)
+            except _Dynamic:
+                return None
+        elif isinstance(stmt, ast.ClassDef):
+            continue
+        elif _assigned_names(stmt) & set(METADATA + ('handle',)):
+            # Set conditionally or in some other way, only an import can
+            # tell what the module ends up with.
+            return None
+    if not has_handle:
+        return None
+    metadata = dict(DEFAULTS)
+    if set(found).intersection(config.RESOURCE_ATTRS):
+        # As config.fixup_module, declaring either defaults the other.
+        for attr in config.RESOURCE_ATTRS:
+            metadata[attr] = []
+    metadata.update(found)
+    return metadata
+
+
+def _module_files(package_dir):
+    return sorted(f for f in os.listdir(package_dir)
+                  if f.startswith(config.MOD_PREFIX) and f.endswith('.py'))
+
+
+def build_index(package_dir=PACKAGE_DIR):
+    """Return {module name: metadata or None} for package_dir."""
+    modules = {}
+    for fname in _module_files(package_dir):
+        try:
+            metadata = scan_module(os.path.join(package_dir, fname))
+        except (IOError, SyntaxError, ValueError) as e:
+            LOG.debug("Not indexing config module %s: %s", fname, e)
+            metadata = None
+        modules[fname[:-len('.py')]] = metadata
+    return modules
+
+
+def load_index(cache_file, package_dir=PACKAGE_DIR):
+    """Return the module index, rebuilding cache_file if it is stale."""
+    key = [[fname, config_cache.stat_key(os.path.join(package_dir, fname))]
+           for fname in _module_files(package_dir)]
+    try:
+        cached = json.loads(util.load_file(cache_file))
+    except (IOError, ValueError):
+        cached = {}
+    if (isinstance(cached, dict) and
+            cached.get('version') == INDEX_VERSION and
+            cached.get('package_dir') == package_dir and
+            cached.get('key') == key):
+        return cached['modules']
+    modules = build_index(package_dir)
+    try:
+        util.write_file(cache_file, json.dumps(
+            {'version': INDEX_VERSION, 'package_dir': package_dir,
+             'key': key, 'modules': modules}, sort_keys=True), mode=0o644)
+    except (IOError, OSError) as e:
+        LOG.debug("Failed writing config module index %s: %s",
+                  cache_file, e)
+    return modules
+
+
+def lookup(index, mod_name):
+    """Return a module stand-in for mod_name from index, or None.
+
+    The stand-in carries the indexed metadata and imports the module
+    when anything else, such as handle, is first used.  None is returned
+    for modules not in the index, or when a top level module of the same
+    name would be found first by importer.find_module.
+    """
+    metadata = index.get(mod_name)
+    if not metadata or importer.is_importable(mod_name):
+        return None
+    mod = importer.lazy_import('%s.%s' % (PACKAGE, mod_name))
+    if isinstance(mod, importer.LazyModule):
+        for name in METADATA:
+            setattr(mod, name, metadata[name])
+    return config.fixup_module(mod)
+
+# vi: ts=4 expandtab
@@ -0,0 +1,64 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.config."""
+
+import types
+
+from cloudinit import config
+from cloudinit.settings import RES_CONSOLE, RES_PACKAGES
+from cloudinit.tests.helpers import CiTestCase
+
+
+def make_module(**attrs):
+    mod = types.ModuleType('cc_example')
+    for (name, value) in attrs.items():
+        setattr(mod, name, value)
+    return config.fixup_module(mod)
+
+
+class TestFixupModule(CiTestCase):
+
+    def test_undeclared_resources(self):
+        """Modules declaring no resources have None for both."""
+        mod = make_module()
+        self.assertEqual((None, None), (mod.reads, mod.writes))
+
+    def test_declaring_either_resource_list(self):
+        """Declaring reads or writes defaults the other to nothing."""
+        mod = make_module(writes=[RES_CONSOLE])
+        self.assertEqual(([], [RES_CONSOLE]), (mod.reads, mod.writes))
+
+
+class TestModulesConflict(CiTestCase):
+
+    def assertConflict(self, expected, mod, other):
+        self.assertEqual(expected, config.modules_conflict(mod, other))
+        self.assertEqual(expected, config.modules_conflict(other, mod))
+
+    def test_undeclared_modules_conflict_with_all(self):
+        """A module not declaring its resources runs on its own."""
+        self.assertConflict(True, make_module(), make_module(reads=[]))
+
+    def test_readers_do_not_conflict(self):
+        """Modules only reading the same resources run together."""
+        self.assertConflict(False, make_module(reads=['/etc/ssh']),
+                            make_module(reads=['/etc/ssh']))
+
+    def test_writers_conflict_with_readers_and_writers(self):
+        """Writing a resource excludes any other use of it."""
+        writer = make_module(writes=[RES_PACKAGES])
+        self.assertConflict(True, writer, make_module(reads=[RES_PACKAGES]))
+        self.assertConflict(True, writer, make_module(writes=[RES_PACKAGES]))
+        self.assertConflict(False, writer, make_module(writes=[RES_CONSOLE]))
+
+    def test_paths_conflict_with_paths_below_them(self):
+        """Paths overlap when one is the other or contains it."""
+        writer = make_module(writes=['/etc/salt/'])
+        self.assertConflict(True, writer, make_module(reads=['/etc/salt']))
+        self.assertConflict(True, writer,
+                            make_module(reads=['/etc/salt/minion']))
+        self.assertConflict(False, writer,
+                            make_module(reads=['/etc/saltstack']))
+        self.assertConflict(False, writer, make_module(reads=['/etc/ssh']))
+
+# vi: ts=4 expandtab
@@ -0,0 +1,149 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.config.registry."""
+
+import importlib
+import json
+import os
+import sys
+
+from cloudinit import config
+from cloudinit.config import registry
+from cloudinit import importer
+from cloudinit.settings import PER_ALWAYS, PER_INSTANCE
+from cloudinit import stages
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit import util
+
+MODULE_TPL = """\
+from cloudinit.settings import PER_ALWAYS
+from cloudinit.distros import ALL_DISTROS
+%s
+
+def handle(name, cfg, cloud, log, args):
+    pass
+"""
+
+
+class TestScanModule(CiTestCase):
+
+    def scan(self, body, template=MODULE_TPL):
+        path = self.tmp_path('cc_example.py')
+        util.write_file(path, template % body)
+        return registry.scan_module(path)
+
+    def test_literals_and_known_constants(self):
+        """Literals and constants from settings and distros are read."""
+        self.assertEqual(
+            {'frequency': PER_ALWAYS, 'distros': ['all'],
+             'osfamilies': ['debian'], 'reads': None, 'writes': None},
+            self.scan("frequency = PER_ALWAYS\ndistros = [ALL_DISTROS]\n"
+                      "osfamilies = ('debian',)"))
+
+    def test_defaults(self):
+        """Metadata a module does not declare gets fixup_module defaults."""
+        self.assertEqual(
+            {'frequency': PER_INSTANCE, 'distros': [], 'osfamilies': [],
+             'reads': None, 'writes': None},
+            self.scan(''))
+        self.assertEqual(
+            {'frequency': PER_INSTANCE, 'distros': [], 'osfamilies': [],
+             'reads': [], 'writes': ['/etc/example']},
+            self.scan("writes = ['/etc/example']"))
+
+    def test_dynamic_metadata_is_not_indexed(self):
+        """Metadata computed or set conditionally needs an import."""
+        for body in ("distros = sorted(['a'])",
+                     "if True:\n    distros = ['a']",
+                     "distros = ['a']\ndistros = ['b']",
+                     "frequency = UNKNOWN_NAME"):
+            self.assertIsNone(self.scan(body), body)
+
+    def test_modules_without_handle_are_not_indexed(self):
+        """importer.find_module requires a handle attribute."""
+        self.assertIsNone(self.scan('', template='%sfrequency = "always"\n'))
+
+    def test_index_matches_imported_modules(self):
+        """The shipped modules' indexed metadata is what they declare."""
+        index = registry.build_index()
+        self.assertIn('cc_runcmd', index)
+        for (name, metadata) in index.items():
+            if metadata is None:
+                continue
+            mod = config.fixup_module(
+                importlib.import_module('cloudinit.config.%s' % name))
+            for attr in registry.METADATA:
+                value = getattr(mod, attr)
+                if isinstance(value, tuple):
+                    value = list(value)
+                self.assertEqual(metadata[attr], value, name)
+
+
+class TestLoadIndex(CiTestCase):
+
+    def setUp(self):
+        super(TestLoadIndex, self).setUp()
+        self.package_dir = self.tmp_dir()
+        self.cache_file = self.tmp_path('module-index.json')
+        self.mod_file = os.path.join(self.package_dir, 'cc_example.py')
+        util.write_file(self.mod_file, MODULE_TPL % 'frequency = "always"')
+
+    def test_index_is_cached_until_a_module_changes(self):
+        """The cached index is used while module files are unchanged."""
+        index = registry.load_index(self.cache_file, self.package_dir)
+        self.assertEqual('always', index['cc_example']['frequency'])
+        with mock.patch.object(registry, 'build_index') as m_build:
+            self.assertEqual(index, registry.load_index(self.cache_file,
+                                                        self.package_dir))
+        self.assertEqual(0, m_build.call_count)
+        util.write_file(self.mod_file, MODULE_TPL % 'frequency = "once"')
+        index = registry.load_index(self.cache_file, self.package_dir)
+        self.assertEqual('once', index['cc_example']['frequency'])
+        cached = json.loads(util.load_file(self.cache_file))
+        self.assertEqual(index, cached['modules'])
+
+
+class TestLookup(CiTestCase):
+
+    INDEX = {'cc_spacewalk': {'frequency': PER_INSTANCE,
+                              'distros': ['redhat', 'fedora'],
+                              'osfamilies': [], 'reads': None,
+                              'writes': None},
+             'cc_dynamic': None}
+
+    def setUp(self):
+        super(TestLookup, self).setUp()
+        patcher = mock.patch.dict(sys.modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sys.modules.pop('cloudinit.config.cc_spacewalk', None)
+
+    def test_indexed_modules_are_not_imported(self):
+        """The stand-in has the metadata and imports on other access."""
+        mod = registry.lookup(self.INDEX, 'cc_spacewalk')
+        self.assertIsInstance(mod, importer.LazyModule)
+        self.assertEqual(['redhat', 'fedora'], mod.distros)
+        self.assertNotIn('cloudinit.config.cc_spacewalk', sys.modules)
+        self.assertTrue(callable(mod.handle))
+        self.assertIn('cloudinit.config.cc_spacewalk', sys.modules)
+
+    def test_unindexed_and_shadowed_modules_are_not_looked_up(self):
+        """Modules not indexed or shadowed by a top level module are not."""
+        self.assertIsNone(registry.lookup(self.INDEX, 'cc_dynamic'))
+        self.assertIsNone(registry.lookup(self.INDEX, 'cc_missing'))
+        with mock.patch('cloudinit.importer.is_importable',
+                        return_value=True):
+            self.assertIsNone(registry.lookup(self.INDEX, 'cc_spacewalk'))
+
+    def test_run_section_skips_modules_without_importing(self):
+        """Modules skipped for the distro are never imported."""
+        init = mock.Mock()
+        init.distro.name = 'ubuntu'
+        mods = stages.Modules(init)
+        mods._module_index = self.INDEX
+        mods._cached_cfg = {'cloud_config_modules': ['spacewalk']}
+        (which_ran, failures) = mods.run_section('cloud_config_modules')
+        self.assertEqual(([], []), (which_ran, failures))
+        self.assertNotIn('cloudinit.config.cc_spacewalk', sys.modules)
+
+# vi: ts=4 expandtab
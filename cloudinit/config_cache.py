@@ -0,0 +1,129 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Base configuration cache shared by the boot stages.
+
+Each stage merges the builtin configuration, /etc/cloud/cloud.cfg and its
+conf.d fragments, the runtime configuration and the kernel command line.
+The cache keeps every parsed input file, keyed by its path, mtime, size
+and inode, and the merged result.  When no input changed a stage loads
+the merged result; otherwise only the changed files are parsed again
+before merging.
+"""
+
+import copy
+import json
+import os
+
+from cloudinit import log as logging
+from cloudinit import util
+from cloudinit import version
+
+LOG = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def stat_key(path):
+    """Return the [mtime, size, inode] of path or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, st.st_ino]
+
+
+def _json_safe(obj):
+    """Return obj serialized to json if it survives a round trip."""
+    try:
+        content = json.dumps(obj, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    if json.loads(content) != obj:
+        # such as integer keys or tuples, which json would change
+        return None
+    return content
+
+
+class ConfigCache(object):
+    """Parsed configuration files remembered across processes."""
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.parsed = 0
+        self._cached = {}
+        self._merged = (None, None)
+        self._inputs = {}
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(util.load_file(self.cache_file))
+        except IOError:
+            return
+        except ValueError as e:
+            LOG.debug("Ignoring unreadable config cache %s: %s",
+                      self.cache_file, e)
+            return
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return
+        self._cached = data.get('files', {})
+        self._merged = (data.get('key'), data.get('merged'))
+
+    def read_conf(self, path):
+        """Return the parsed contents of path, as util.read_conf would."""
+        key = stat_key(path)
+        cached = self._inputs.get(path) or self._cached.get(path)
+        if key is not None and cached and cached[0] == key:
+            cfg = cached[1]
+        else:
+            cfg = util.read_conf(path)
+            self.parsed += 1
+        self._inputs[path] = [key, cfg]
+        return copy.deepcopy(cfg)
+
+    def _key(self, cloud_config, runtime_config):
+        """Return the key of all base config inputs.
+
+        Only cloud_config is parsed, and only if it changed, to find its
+        conf.d directory.
+        """
+        paths = [cloud_config]
+        confd = util.get_conf_d(cloud_config, self.read_conf(cloud_config))
+        if confd:
+            paths.extend(util.list_conf_d(confd))
+        paths.append(runtime_config)
+        return {'version': version.version_string(),
+                'cmdline': util.get_cmdline(),
+                'files': [[p, stat_key(p)] for p in paths]}
+
+    def fetch_base_config(self, cloud_config, runtime_config):
+        """Return the merged base config, see stages.fetch_base_config."""
+        key = self._key(cloud_config, runtime_config)
+        if key == self._merged[0] and isinstance(self._merged[1], dict):
+            LOG.debug("Using cached base config from %s", self.cache_file)
+            return self._merged[1]
+        merged = util.mergemanydict(
+            [
+                util.get_builtin_cfg(),
+                util.read_conf_with_confd(cloud_config,
+                                          reader=self.read_conf),
+                self.read_conf(runtime_config),
+                util.read_conf_from_cmdline(),
+            ], reverse=True)
+        LOG.debug("Merged base config parsing %d changed files", self.parsed)
+        self._save(key, merged)
+        return merged
+
+    def _save(self, key, merged):
+        content = _json_safe({'version': CACHE_VERSION, 'key': key,
+                              'files': self._inputs, 'merged': merged})
+        if content is None:
+            LOG.debug("Base config can not be cached as json")
+            return
+        try:
+            util.write_file(self.cache_file, content, mode=0o600)
+        except (IOError, OSError) as e:
+            LOG.debug("Failed writing config cache %s: %s",
+                      self.cache_file, e)
+
+# vi: ts=4 expandtab
@@ -13,9 +13,12 @@ import six
 from six import StringIO
 
 import abc
+import grp
 import os
+import pwd
 import re
 import stat
+import threading
 
 from cloudinit import importer
 from cloudinit import log as logging
@@ -61,9 +64,68 @@ class Distro(object):
         self._paths = paths
         self._cfg = cfg
         self.name = name
+        self._init_package_queue()
+
+    def _init_package_queue(self):
+        self._package_lock = threading.Lock()
+        self._queued_packages = []
+        self._installed_packages = set()
+
+    def __getstate__(self):
+        # The package queue only applies to this process.
+        state = self.__dict__.copy()
+        for attr in ('_package_lock', '_queued_packages',
+                     '_installed_packages'):
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_package_queue()
+
+    def queue_packages(self, pkglist):
+        """Queue packages to install with install_queued_packages."""
+        with self._package_lock:
+            for pkg in _package_specs(pkglist):
+                if pkg not in self._queued_packages:
+                    self._queued_packages.append(pkg)
+
+    def discard_queued_packages(self):
+        """Forget queued packages that were not installed."""
+        with self._package_lock:
+            if self._queued_packages:
+                LOG.debug("Not installing queued packages %s",
+                          self._queued_packages)
+            self._queued_packages = []
+
+    def install_queued_packages(self):
+        """Install all queued packages with a single package command.
+
+        The queue is emptied even if that fails; the modules which queued
+        the packages then install their own.
+        """
+        with self._package_lock:
+            batch = [pkg for pkg in self._queued_packages
+                     if pkg not in self._installed_packages]
+            self._queued_packages = []
+            if batch:
+                self._install_packages(batch)
+                self._installed_packages.update(batch)
 
-    @abc.abstractmethod
     def install_packages(self, pkglist):
+        """Install pkglist, skipping packages this distro installed before.
+        """
+        with self._package_lock:
+            pending = [pkg for pkg in _package_specs(pkglist)
+                       if pkg not in self._installed_packages]
+            if not pending:
+                LOG.debug("Packages %s already installed", pkglist)
+                return
+            self._install_packages(pending)
+            self._installed_packages.update(pending)
+
+    @abc.abstractmethod
+    def _install_packages(self, pkglist):
         raise NotImplementedError()
 
     @abc.abstractmethod
@@ -407,24 +469,7 @@ class Distro(object):
 
         redact_opts = ['passwd']
 
-        # support kwargs having groups=[list] or groups="g1,g2"
-        groups = kwargs.get('groups')
-        if groups:
-            if isinstance(groups, six.string_types):
-                groups = groups.split(",")
-
-            # remove any white spaces in group names, most likely
-            # that came in as a string like: groups: group1, group2
-            groups = [g.strip() for g in groups]
-
-            # kwargs.items loop below wants a comma delimeted string
-            # that can go right through to the command.
-            kwargs['groups'] = ",".join(groups)
-
-            primary_group = kwargs.get('primary_group')
-            if primary_group:
-                groups.append(primary_group)
-
+        groups = _user_groups(kwargs)
         if create_groups and groups:
             for group in groups:
                 if not util.is_group(group):
@@ -523,23 +568,138 @@ class Distro(object):
 
         # Import SSH keys
         if 'ssh_authorized_keys' in kwargs:
-            # Try to handle this in a smart manner.
-            keys = kwargs['ssh_authorized_keys']
-            if isinstance(keys, six.string_types):
-                keys = [keys]
-            elif isinstance(keys, dict):
-                keys = list(keys.values())
-            if keys is not None:
-                if not isinstance(keys, (tuple, list, set)):
-                    LOG.warning("Invalid type '%s' detected for"
-                                " 'ssh_authorized_keys', expected list,"
-                                " string, dict, or set.", type(keys))
-                else:
-                    keys = set(keys) or []
-                    ssh_util.setup_user_keys(keys, name, options=None)
+            self._setup_user_keys(name, kwargs['ssh_authorized_keys'])
 
         return True
 
+    def create_users(self, users, groups=None):
+        """
+        Create the groups and users normalize_users_groups returned,
+        as create_group and create_user would, in bulk.
+
+        The user and group databases are read once, passwords are set
+        with one chpasswd per kind, passwords are locked and group
+        members added in bulk and all sudoers rules are written at once.
+        A failing step is logged and the others still run, the first
+        error is raised once all are done.
+        """
+        known_users = set(ent.pw_name for ent in pwd.getpwall())
+        known_groups = dict((ent.gr_name, set(ent.gr_mem))
+                            for ent in grp.getgrall())
+        memberships = {}
+        for (name, members) in (groups or {}).items():
+            self._create_missing_group(name, known_groups)
+            for member in members or []:
+                memberships.setdefault(member, []).append(name)
+
+        passwds = {False: [], True: []}
+        to_lock = []
+        sudo_rules = []
+        user_keys = []
+        errors = []
+
+        def bulk_step(msg, func, *args, **kwargs):
+            # A failing step does not stop those of other users or kinds.
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                util.logexc(LOG, msg)
+                errors.append(e)
+
+        for (name, kwargs) in users.items():
+            if 'snapuser' in kwargs:
+                bulk_step("Failed to create snap user %s" % name,
+                          self.add_snap_user, name, **kwargs)
+                continue
+            if name in known_users:
+                LOG.info("User %s already exists, skipping.", name)
+            else:
+                kwargs = dict(kwargs)
+                try:
+                    if kwargs.pop('create_groups', True):
+                        for group in _user_groups(kwargs):
+                            if self._create_missing_group(group,
+                                                          known_groups):
+                                LOG.debug("created group '%s' for user '%s'",
+                                          group, name)
+                    self.add_user(name, create_groups=False, **kwargs)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                known_users.add(name)
+            if kwargs.get('plain_text_passwd'):
+                passwds[False].append((name, kwargs['plain_text_passwd']))
+            if kwargs.get('hashed_passwd'):
+                passwds[True].append((name, kwargs['hashed_passwd']))
+            if kwargs.get('lock_passwd', True):
+                to_lock.append(name)
+            if 'sudo' in kwargs:
+                sudo_rules.append((name, kwargs['sudo']))
+            if 'ssh_authorized_keys' in kwargs:
+                user_keys.append((name, kwargs['ssh_authorized_keys']))
+
+        for hashed in (False, True):
+            if passwds[hashed]:
+                bulk_step("Failed to set passwords of users %s" %
+                          [n for (n, _p) in passwds[hashed]],
+                          self.set_passwds, passwds[hashed], hashed)
+        if to_lock:
+            bulk_step("Failed to lock passwords of users %s" % to_lock,
+                      self.lock_passwds, to_lock)
+        for (member, names) in sorted(memberships.items()):
+            bulk_step("Failed to add user '%s' to groups %s" % (member, names),
+                      self._add_group_members, member, names, known_users,
+                      known_groups)
+        if sudo_rules:
+            bulk_step("Failed to write sudo rules of users %s" %
+                      [n for (n, _r) in sudo_rules],
+                      self.write_users_sudo_rules, sudo_rules)
+        for (name, keys) in user_keys:
+            bulk_step("Failed to set up ssh keys of user %s" % name,
+                      self._setup_user_keys, name, keys)
+        if errors:
+            raise errors[0]
+
+    def _create_missing_group(self, name, known_groups):
+        """Create group name unless known_groups has it, True if created."""
+        if name in known_groups:
+            return False
+        self.create_group(name)
+        known_groups[name] = set()
+        return True
+
+    def _add_group_members(self, member, names, known_users, known_groups):
+        """Add user member to the groups names with one usermod."""
+        # getpwall does not list users of NSS sources that are not
+        # enumerated, such as LDAP, look those up by name.
+        if member not in known_users and not util.is_user(member):
+            for name in names:
+                LOG.warning("Unable to add group member '%s' to group "
+                            "'%s'; user does not exist.", member, name)
+            return
+        names = [n for n in names if member not in known_groups[n]]
+        if not names:
+            return
+        util.subp(['usermod', '-a', '-G', ','.join(names), member])
+        for name in names:
+            known_groups[name].add(member)
+        LOG.info("Added user '%s' to groups %s", member, names)
+
+    def _setup_user_keys(self, name, keys):
+        # Try to handle this in a smart manner.
+        if isinstance(keys, six.string_types):
+            keys = [keys]
+        elif isinstance(keys, dict):
+            keys = list(keys.values())
+        if keys is not None:
+            if not isinstance(keys, (tuple, list, set)):
+                LOG.warning("Invalid type '%s' detected for"
+                            " 'ssh_authorized_keys', expected list,"
+                            " string, dict, or set.", type(keys))
+            else:
+                keys = set(keys) or []
+                ssh_util.setup_user_keys(keys, name, options=None)
+
     def lock_passwd(self, name):
         """
         Lock the password of a user, i.e., disable password logins
@@ -553,8 +713,32 @@ class Distro(object):
             util.logexc(LOG, 'Failed to disable password for user %s', name)
             raise e
 
+    def lock_passwds(self, names):
+        """
+        Lock the passwords of users names, each with lock_passwd.
+
+        Rewriting the hashes, even all with one chpasswd, would reset the
+        last password change of the users and with it their password
+        aging, such as a forced change (chage -d 0).  Every user is tried;
+        the first failure is raised at the end.
+        """
+        error = None
+        for name in names:
+            try:
+                self.lock_passwd(name)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
     def set_passwd(self, user, passwd, hashed=False):
-        pass_string = '%s:%s' % (user, passwd)
+        return self.set_passwds([(user, passwd)], hashed=hashed)
+
+    def set_passwds(self, plist, hashed=False):
+        """Set the passwords of the (user, passwd) pairs in plist at once."""
+        users = [user for (user, _passwd) in plist]
+        pass_string = ''.join('%s:%s\n' % ent for ent in plist)
         cmd = ['chpasswd']
 
         if hashed:
@@ -564,9 +748,11 @@ class Distro(object):
             cmd.append('-e')
 
         try:
-            util.subp(cmd, pass_string, logstring="chpasswd for %s" % user)
+            util.subp(cmd, pass_string,
+                      logstring="chpasswd for %s" % ', '.join(users))
         except Exception as e:
-            util.logexc(LOG, "Failed to set password for %s", user)
+            util.logexc(LOG, "Failed to set password for %s",
+                        ', '.join(users))
             raise e
 
         return True
@@ -613,21 +799,39 @@ class Distro(object):
         util.ensure_dir(path, 0o750)
 
     def write_sudo_rules(self, user, rules, sudo_file=None):
+        self.write_users_sudo_rules([(user, rules)], sudo_file)
+
+    def write_users_sudo_rules(self, user_rules, sudo_file=None):
+        """Write the rules of each (user, rules) in user_rules at once.
+
+        Rules of an invalid type raise TypeError once the rules of the
+        other users are written.
+        """
         if not sudo_file:
             sudo_file = self.ci_sudoers_fn
 
-        lines = [
-            '',
-            "# User rules for %s" % user,
-        ]
-        if isinstance(rules, (list, tuple)):
+        lines = []
+        invalid = None
+        for (user, rules) in user_rules:
+            if isinstance(rules, (list, tuple)):
+                rules = list(rules)
+            elif isinstance(rules, six.string_types):
+                rules = [rules]
+            else:
+                msg = "Can not create sudoers rule addition with type %r"
+                invalid = invalid or TypeError(
+                    msg % (type_utils.obj_name(rules)))
+                continue
+            lines.extend([
+                '',
+                "# User rules for %s" % user,
+            ])
             for rule in rules:
                 lines.append("%s %s" % (user, rule))
-        elif isinstance(rules, six.string_types):
-            lines.append("%s %s" % (user, rules))
-        else:
-            msg = "Can not create sudoers rule addition with type %r"
-            raise TypeError(msg % (type_utils.obj_name(rules)))
+        if not lines:
+            if invalid:
+                raise invalid
+            return
         content = "\n".join(lines)
         content += "\n"  # trailing newline
 
@@ -648,6 +852,8 @@ class Distro(object):
             except IOError as e:
                 util.logexc(LOG, "Failed to append sudoers file %s", sudo_file)
                 raise e
+        if invalid:
+            raise invalid
 
     def create_group(self, name, members=None):
         group_add_cmd = ['groupadd', name]
@@ -678,6 +884,53 @@ class Distro(object):
                 LOG.info("Added user '%s' to group '%s'", member, name)
 
 
+def _user_groups(kwargs):
+    """Return the groups, with the primary one, add_user puts a user in.
+
+    kwargs having groups=[list] or groups="g1,g2" is supported and
+    kwargs['groups'] is normalized to the comma delimited string useradd
+    takes.
+    """
+    groups = kwargs.get('groups')
+    if not groups:
+        return []
+    if isinstance(groups, six.string_types):
+        groups = groups.split(",")
+
+    # remove any white spaces in group names, most likely
+    # that came in as a string like: groups: group1, group2
+    groups = [g.strip() for g in groups]
+
+    # kwargs.items loop in add_user wants a comma delimeted string
+    # that can go right through to the command.
+    kwargs['groups'] = ",".join(groups)
+
+    primary_group = kwargs.get('primary_group')
+    if primary_group:
+        groups.append(primary_group)
+    return groups
+
+
+def _package_specs(pkglist):
+    """Return pkglist, as install_packages takes it, as a list of specs.
+
+    Each spec is a package name or a (name, version) tuple.
+    """
+    if not isinstance(pkglist, list):
+        pkglist = [pkglist]
+    specs = []
+    for pkg in pkglist:
+        if isinstance(pkg, (tuple, list)):
+            if len(pkg) == 2 and pkg[1]:
+                pkg = tuple(pkg)
+            elif len(pkg) in (1, 2):
+                pkg = pkg[0]
+            else:
+                raise RuntimeError("Invalid package & version tuple.")
+        specs.append(pkg)
+    return specs
+
+
 def _get_package_mirror_info(mirror_info, data_source=None,
                              mirror_filter=util.search_for_mirror):
     # given a arch specific 'mirror_info' entry (from package_mirrors)
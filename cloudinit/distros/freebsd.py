@@ -239,6 +239,12 @@ class Distro(distros.Distro):
             util.logexc(LOG, "Failed to set password for %s", user)
             raise e
 
+    def set_passwds(self, plist, hashed=False):
+        # pw sets one password per command.
+        for (user, passwd) in plist:
+            self.set_passwd(user, passwd, hashed=hashed)
+        return True
+
     def lock_passwd(self, name):
         try:
             util.subp(['pw', 'usermod', name, '-h', '-'])
@@ -267,6 +273,13 @@ class Distro(distros.Distro):
             keys = set(kwargs['ssh_authorized_keys']) or []
             ssh_util.setup_user_keys(keys, name, options=None)
 
+    def create_users(self, users, groups=None):
+        # pw has no bulk interface, create them one at a time.
+        for (name, members) in (groups or {}).items():
+            self.create_group(name, members)
+        for (name, kwargs) in users.items():
+            self.create_user(name, **kwargs)
+
     @staticmethod
     def get_ifconfig_list():
         cmd = ['ifconfig', '-l']
@@ -616,7 +629,7 @@ class Distro(distros.Distro):
         if len(err):
             LOG.warning("Error running %s: %s", cmd, err)
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.update_package_sources()
         self.package_command('install', pkgs=pkglist)
 
@@ -49,7 +49,7 @@ class Distro(distros.Distro):
         self.osfamily = 'redhat'
         cfg['ssh_svcname'] = 'sshd'
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.package_command('install', pkgs=pkglist)
 
     def _write_network_config(self, netconfig):
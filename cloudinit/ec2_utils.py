@@ -8,6 +8,7 @@ import functools
 import json
 
 from cloudinit import log as logging
+from cloudinit import parallel
 from cloudinit import url_helper
 from cloudinit import util
 
@@ -48,7 +49,8 @@ class MetadataLeafDecoder(object):
 # See: http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/
 #         ec2-instance-metadata.html
 class MetadataMaterializer(object):
-    def __init__(self, blob, base_url, caller, leaf_decoder=None):
+    def __init__(self, blob, base_url, caller, leaf_decoder=None,
+                 max_workers=1):
         self._blob = blob
         self._md = None
         self._base_url = base_url
@@ -57,6 +59,7 @@ class MetadataMaterializer(object):
             self._leaf_decoder = MetadataLeafDecoder()
         else:
             self._leaf_decoder = leaf_decoder
+        self._max_workers = max_workers
 
     def _parse(self, blob):
         leaves = {}
@@ -104,22 +107,80 @@ class MetadataMaterializer(object):
     def materialize(self):
         if self._md is not None:
             return self._md
-        self._md = self._materialize(self._blob, self._base_url)
+        if self._max_workers > 1:
+            self._md = self._materialize_concurrently(self._blob,
+                                                      self._base_url)
+        else:
+            self._md = self._materialize(self._blob, self._base_url)
         return self._md
 
+    def _child_url(self, base_url, child):
+        child_url = url_helper.combine_url(base_url, child)
+        if not child_url.endswith("/"):
+            child_url += "/"
+        return child_url
+
     def _materialize(self, blob, base_url):
         (leaves, children) = self._parse(blob)
         child_contents = {}
         for c in children:
-            child_url = url_helper.combine_url(base_url, c)
-            if not child_url.endswith("/"):
-                child_url += "/"
+            child_url = self._child_url(base_url, c)
             child_blob = self._caller(child_url)
             child_contents[c] = self._materialize(child_blob, child_url)
-        leaf_contents = {}
+        leaf_blobs = {}
         for (field, resource) in leaves.items():
             leaf_url = url_helper.combine_url(base_url, resource)
-            leaf_blob = self._caller(leaf_url)
+            leaf_blobs[field] = self._caller(leaf_url)
+        return self._join(base_url, child_contents, leaf_blobs)
+
+    def _materialize_concurrently(self, blob, base_url):
+        """Crawl the tree breadth first, fetching each level concurrently.
+
+        The result is the same as that of _materialize.  Fetches of all
+        siblings (and cousins) are issued together, bounded by max_workers.
+        """
+        parsed = {}
+        fetched = {}
+        level = [(base_url, blob)]
+        while level:
+            urls = []
+            child_urls = []
+            for (url, url_blob) in level:
+                (leaves, children) = self._parse(url_blob)
+                parsed[url] = (leaves, children)
+                for c in children:
+                    child_urls.append(self._child_url(url, c))
+                for resource in leaves.values():
+                    urls.append(url_helper.combine_url(url, resource))
+            to_fetch = []
+            for url in urls + child_urls:
+                if url not in fetched:
+                    fetched[url] = None
+                    to_fetch.append(url)
+            results = parallel.map_completed(self._caller, to_fetch,
+                                             self._max_workers)
+            for (url, (url_blob, exc)) in zip(to_fetch, results):
+                if exc is not None:
+                    raise exc
+                fetched[url] = url_blob
+            level = [(url, fetched[url]) for url in child_urls]
+
+        def assemble(url):
+            (leaves, children) = parsed[url]
+            child_contents = {}
+            for c in children:
+                child_contents[c] = assemble(self._child_url(url, c))
+            leaf_blobs = {}
+            for (field, resource) in leaves.items():
+                leaf_blobs[field] = fetched[
+                    url_helper.combine_url(url, resource)]
+            return self._join(url, child_contents, leaf_blobs)
+
+        return assemble(base_url)
+
+    def _join(self, base_url, child_contents, leaf_blobs):
+        leaf_contents = {}
+        for (field, leaf_blob) in leaf_blobs.items():
             leaf_contents[field] = self._leaf_decoder(field, leaf_blob)
         joined = {}
         joined.update(child_contents)
@@ -167,7 +228,7 @@ def get_instance_userdata(api_version='latest',
 def get_instance_metadata(api_version='latest',
                           metadata_address='http://169.254.169.254',
                           ssl_details=None, timeout=5, retries=5,
-                          leaf_decoder=None):
+                          leaf_decoder=None, max_workers=1):
     md_url = url_helper.combine_url(metadata_address, api_version)
     # Note, 'meta-data' explicitly has trailing /.
     # this is required for CloudStack (LP: #1356855)
@@ -183,7 +244,8 @@ def get_instance_metadata(api_version='latest',
         response = caller(md_url)
         materializer = MetadataMaterializer(response.contents,
                                             md_url, mcaller,
-                                            leaf_decoder=leaf_decoder)
+                                            leaf_decoder=leaf_decoder,
+                                            max_workers=max_workers)
         md = materializer.materialize()
         if not isinstance(md, (dict)):
             md = {}
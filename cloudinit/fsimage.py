@@ -0,0 +1,474 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Read-only access to small iso9660 and vfat filesystem images.
+
+Seed devices (NoCloud's cidata, ConfigDrive's config-2) only hold a
+handful of small files.  Reading them straight from the block device
+avoids forking mount and umount for every candidate device.  Anything
+unexpected raises ImageError so callers can fall back to mounting.
+Only the paths a caller asks for are read.
+
+Supported are iso9660 with Rock Ridge or Joliet names, and FAT12, FAT16
+and FAT32 with long file names.  Rock Ridge symbolic links are not
+followed; asking for one raises ImageError.
+"""
+
+import os
+import struct
+
+from cloudinit import log as logging
+
+LOG = logging.getLogger(__name__)
+
+ISO_SECTOR = 2048
+ISO_FIRST_DESCRIPTOR = 16
+JOLIET_ESCAPES = (b'%/@', b'%/C', b'%/E')
+
+# Upper bound on the bytes extracted from a single image.
+DEF_MAX_BYTES = 64 * 1024 * 1024
+
+# Directories nested deeper than this are taken to be a corrupt image.
+MAX_DEPTH = 32
+
+
+class ImageError(Exception):
+    """The image can not be read without mounting it."""
+
+
+class _Entry(object):
+    """A file or directory found in an image."""
+
+    def __init__(self, name, is_dir, location, size, is_link=False):
+        self.name = name
+        self.is_dir = is_dir
+        self.location = location
+        self.size = size
+        self.is_link = is_link
+
+
+def _u16(data, offset):
+    return struct.unpack_from('<H', data, offset)[0]
+
+
+def _u32(data, offset):
+    return struct.unpack_from('<I', data, offset)[0]
+
+
+class Iso9660Image(object):
+    """An iso9660 image, preferring Rock Ridge then Joliet names."""
+
+    fstype = 'iso9660'
+
+    def __init__(self, fh):
+        self.fh = fh
+        primary = joliet = None
+        for sector in range(ISO_FIRST_DESCRIPTOR, ISO_FIRST_DESCRIPTOR + 64):
+            desc = self._read(sector * ISO_SECTOR, ISO_SECTOR)
+            if desc[1:6] != b'CD001':
+                raise ImageError('not an iso9660 image')
+            dtype = bytearray(desc[0:1])[0]
+            if dtype == 255:
+                break
+            if dtype == 1 and primary is None:
+                primary = desc
+            elif dtype == 2 and desc[88:91] in JOLIET_ESCAPES:
+                joliet = desc
+        if primary is None:
+            raise ImageError('no primary volume descriptor')
+        self.root = self._root_entry(primary)
+        self.susp_skip = self._susp_skip(self.root)
+        self.rock_ridge = self.susp_skip is not None
+        self.joliet = False
+        if not self.rock_ridge and joliet is not None:
+            self.root = self._root_entry(joliet)
+            self.joliet = True
+
+    def _read(self, offset, length):
+        self.fh.seek(offset)
+        data = self.fh.read(length)
+        if len(data) != length:
+            raise ImageError('short read at offset %d' % offset)
+        return data
+
+    def _root_entry(self, desc):
+        record = desc[156:156 + 34]
+        return _Entry('', True, _u32(record, 2) * ISO_SECTOR,
+                      _u32(record, 10))
+
+    def _records(self, entry):
+        """Yield the raw directory records of directory entry."""
+        data = self._read(entry.location, entry.size)
+        pos = 0
+        while pos < len(data):
+            length = bytearray(data[pos:pos + 1])[0]
+            if length == 0:
+                # records do not span sectors, continue in the next one
+                pos = (pos // ISO_SECTOR + 1) * ISO_SECTOR
+                continue
+            if length < 34 or pos + length > len(data):
+                raise ImageError('corrupt directory record')
+            yield data[pos:pos + length]
+            pos += length
+
+    def _susp_skip(self, root):
+        """Return the SUSP skip length if Rock Ridge is in use, or None."""
+        for record in self._records(root):
+            system_use = self._system_use(record, 0)
+            if system_use[0:2] == b'SP' and system_use[4:6] == b'\xbe\xef':
+                return bytearray(system_use[6:7])[0]
+            return None
+        return None
+
+    def _system_use(self, record, skip):
+        name_len = bytearray(record[32:33])[0]
+        start = 33 + name_len + (1 - name_len % 2)
+        return record[start + skip:]
+
+    def _rock_ridge(self, system_use):
+        """Return the Rock Ridge name (None if absent) and whether the
+        entry is a symbolic link."""
+        name = b''
+        found = False
+        is_link = False
+        areas = [system_use]
+        seen = 0
+        while areas:
+            seen += 1
+            if seen > 16:
+                raise ImageError('too many continuation areas')
+            area = areas.pop(0)
+            pos = 0
+            while pos + 4 <= len(area):
+                sig = area[pos:pos + 2]
+                length = bytearray(area[pos + 2:pos + 3])[0]
+                if length < 4:
+                    break
+                if sig == b'NM':
+                    flags = bytearray(area[pos + 4:pos + 5])[0]
+                    if not flags & 0x06:
+                        # not a '.' or '..' entry
+                        name += area[pos + 5:pos + length]
+                        found = True
+                elif sig == b'SL':
+                    is_link = True
+                elif sig == b'CE':
+                    offset = (_u32(area, pos + 4) * ISO_SECTOR +
+                              _u32(area, pos + 12))
+                    areas.append(self._read(offset, _u32(area, pos + 20)))
+                elif sig == b'ST':
+                    break
+                pos += length
+        if not found:
+            return None, is_link
+        return name.decode('utf-8', 'replace'), is_link
+
+    def _name(self, record):
+        name_len = bytearray(record[32:33])[0]
+        raw = record[33:33 + name_len]
+        if self.joliet:
+            name = raw.decode('utf-16-be', 'replace')
+        else:
+            # as mounted with the default map=normal
+            name = raw.decode('ascii', 'replace').lower()
+        name = name.split(';')[0]
+        if name.endswith('.'):
+            name = name[:-1]
+        return name
+
+    def listdir(self, entry):
+        entries = []
+        for record in self._records(entry):
+            name_len = bytearray(record[32:33])[0]
+            if name_len == 1 and record[33:34] in (b'\x00', b'\x01'):
+                continue
+            flags = bytearray(record[25:26])[0]
+            if flags & 0x80:
+                raise ImageError('multi-extent files are not supported')
+            name, is_link = None, False
+            if self.rock_ridge:
+                name, is_link = self._rock_ridge(
+                    self._system_use(record, self.susp_skip))
+            if name is None:
+                name = self._name(record)
+            entries.append(_Entry(
+                name, bool(flags & 0x02), _u32(record, 2) * ISO_SECTOR,
+                _u32(record, 10), is_link))
+        return entries
+
+    def read(self, entry):
+        return self._read(entry.location, entry.size)
+
+
+class FatImage(object):
+    """A FAT12, FAT16 or FAT32 image.
+
+    Files with only a short (8.3) name are given that name in lower case.
+    """
+
+    fstype = 'vfat'
+
+    def __init__(self, fh):
+        self.fh = fh
+        boot = self._read(0, 512)
+        if boot[510:512] != b'\x55\xaa':
+            raise ImageError('not a FAT image')
+        if boot[54:57] != b'FAT' and boot[82:87] != b'FAT32':
+            raise ImageError('not a FAT image')
+        self.sector_size = _u16(boot, 11)
+        sectors_per_cluster = bytearray(boot[13:14])[0]
+        reserved = _u16(boot, 14)
+        num_fats = bytearray(boot[16:17])[0]
+        root_entries = _u16(boot, 17)
+        total = _u16(boot, 19) or _u32(boot, 32)
+        fat_sectors = _u16(boot, 22) or _u32(boot, 36)
+        if (self.sector_size not in (512, 1024, 2048, 4096) or
+                sectors_per_cluster not in (1, 2, 4, 8, 16, 32, 64, 128) or
+                not reserved or not num_fats or not fat_sectors):
+            raise ImageError('invalid FAT boot sector')
+        self.cluster_size = self.sector_size * sectors_per_cluster
+        root_sectors = ((root_entries * 32 + self.sector_size - 1) //
+                        self.sector_size)
+        root_start = reserved + num_fats * fat_sectors
+        self.data_start = (root_start + root_sectors) * self.sector_size
+        self.clusters = ((total - root_start - root_sectors) //
+                         sectors_per_cluster)
+        if self.clusters < 4085:
+            self.bits = 12
+        elif self.clusters < 65525:
+            self.bits = 16
+        else:
+            self.bits = 32
+        fat_bytes = fat_sectors * self.sector_size
+        if fat_bytes > DEF_MAX_BYTES:
+            raise ImageError('FAT too large')
+        self.fat = self._read(reserved * self.sector_size, fat_bytes)
+        if self.bits == 32:
+            self.root = _Entry('', True, _u32(boot, 44), None)
+        else:
+            self.root = _Entry('', True, None, root_entries * 32)
+            self.root_offset = root_start * self.sector_size
+
+    def _read(self, offset, length):
+        self.fh.seek(offset)
+        data = self.fh.read(length)
+        if len(data) != length:
+            raise ImageError('short read at offset %d' % offset)
+        return data
+
+    def _next_cluster(self, cluster):
+        if self.bits == 12:
+            value = _u16(self.fat, cluster + cluster // 2)
+            value = value >> 4 if cluster & 1 else value & 0xfff
+            return None if value >= 0xff8 else value
+        if self.bits == 16:
+            value = _u16(self.fat, cluster * 2)
+            return None if value >= 0xfff8 else value
+        value = _u32(self.fat, cluster * 4) & 0x0fffffff
+        return None if value >= 0x0ffffff8 else value
+
+    def _chain(self, cluster):
+        chain = []
+        while cluster is not None:
+            if cluster < 2 or cluster >= self.clusters + 2:
+                raise ImageError('invalid cluster %d' % cluster)
+            if len(chain) > self.clusters:
+                raise ImageError('cluster chain loops')
+            chain.append(cluster)
+            cluster = self._next_cluster(cluster)
+        return chain
+
+    def _read_chain(self, cluster, size=None):
+        data = []
+        remaining = size
+        for cluster in self._chain(cluster):
+            data.append(self._read(
+                self.data_start + (cluster - 2) * self.cluster_size,
+                self.cluster_size))
+            if remaining is not None:
+                remaining -= self.cluster_size
+                if remaining <= 0:
+                    break
+        data = b''.join(data)
+        if size is not None:
+            if len(data) < size:
+                raise ImageError('file shorter than its size')
+            data = data[:size]
+        return data
+
+    def listdir(self, entry):
+        if entry.location is None:
+            data = self._read(self.root_offset, entry.size)
+        else:
+            data = self._read_chain(entry.location)
+        entries = []
+        long_name = {}
+        for pos in range(0, len(data) - 31, 32):
+            record = data[pos:pos + 32]
+            first = bytearray(record[0:1])[0]
+            if first == 0:
+                break
+            if first == 0xe5:
+                long_name = {}
+                continue
+            attr = bytearray(record[11:12])[0]
+            if attr == 0x0f:
+                seq = first & 0x1f
+                long_name[seq] = (record[1:11] + record[14:26] +
+                                  record[28:32], bytearray(record[13:14])[0])
+                continue
+            short = record[0:11]
+            name = self._long_name(long_name, short)
+            long_name = {}
+            if attr & 0x08:
+                # volume label
+                continue
+            if name is None:
+                name = self._short_name(short)
+            if name in ('.', '..'):
+                continue
+            cluster = _u16(record, 26)
+            if self.bits == 32:
+                cluster |= _u16(record, 20) << 16
+            is_dir = bool(attr & 0x10)
+            size = None if is_dir else _u32(record, 28)
+            entries.append(_Entry(name, is_dir, cluster or None, size))
+        return entries
+
+    @staticmethod
+    def _checksum(short):
+        total = 0
+        for char in bytearray(short):
+            total = (((total & 1) << 7) + (total >> 1) + char) & 0xff
+        return total
+
+    def _long_name(self, parts, short):
+        if not parts:
+            return None
+        checksum = self._checksum(short)
+        raw = b''
+        for seq in range(1, len(parts) + 1):
+            if seq not in parts or parts[seq][1] != checksum:
+                return None
+            raw += parts[seq][0]
+        name = raw.decode('utf-16-le', 'replace')
+        return name.split(u'\x00')[0]
+
+    @staticmethod
+    def _short_name(short):
+        short = bytearray(short)
+        if short[0] == 0x05:
+            short[0] = 0xe5
+        base = bytes(short[0:8]).decode('latin-1').rstrip()
+        ext = bytes(short[8:11]).decode('latin-1').rstrip()
+        name = base + '.' + ext if ext else base
+        return name.lower()
+
+    def read(self, entry):
+        if not entry.size:
+            return b''
+        if entry.location is None:
+            raise ImageError('file without clusters')
+        return self._read_chain(entry.location, entry.size)
+
+
+IMAGE_TYPES = (Iso9660Image, FatImage)
+
+FSTYPE_ALIASES = {'cd9660': 'iso9660', 'msdos': 'vfat', 'vfat': 'vfat',
+                  'iso9660': 'iso9660'}
+
+
+def open_image(fh, fstypes=None):
+    """Return the image for the filesystem in binary file fh.
+
+    fstypes optionally limits the accepted filesystem types, with the
+    same names as mount -t.
+    """
+    for image_type in IMAGE_TYPES:
+        if fstypes and image_type.fstype not in fstypes:
+            continue
+        try:
+            return image_type(fh)
+        except ImageError:
+            pass
+        except (struct.error, IndexError) as e:
+            raise ImageError('corrupt %s image: %s' %
+                             (image_type.fstype, e))
+    raise ImageError('no supported filesystem found')
+
+
+def _safe_name(name):
+    return (name and name not in ('.', '..') and '/' not in name and
+            '\x00' not in name)
+
+
+def _wanted_tree(paths):
+    """Return nested dicts for relative paths; None stands for a whole
+    file or directory."""
+    if paths is None:
+        return None
+    tree = {}
+    for path in paths:
+        parts = [p for p in path.split('/') if p]
+        if not parts:
+            return None
+        node = tree
+        for part in parts[:-1]:
+            if node.get(part, {}) is None:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def extract(device, target, fstypes=None, max_bytes=DEF_MAX_BYTES,
+            paths=None):
+    """Copy files of the filesystem on device into directory target.
+
+    paths optionally lists the files and directories (relative to the
+    image root) to copy; those missing from the image are skipped.
+    Raise ImageError if the filesystem is not supported, is corrupt,
+    a wanted path is a symbolic link or the copied files exceed
+    max_bytes.
+    """
+    if fstypes:
+        fstypes = [FSTYPE_ALIASES.get(t, t) for t in fstypes]
+    wanted = _wanted_tree(paths)
+    with open(device, 'rb') as fh:
+        try:
+            image = open_image(fh, fstypes)
+            _extract_dir(image, image.root, target, [max_bytes], 0, wanted)
+        except (struct.error, IndexError, UnicodeError) as e:
+            raise ImageError('corrupt image on %s: %s' % (device, e))
+    LOG.debug("Read %s filesystem from %s without mounting",
+              image.fstype, device)
+    return image.fstype
+
+
+def _extract_dir(image, entry, target, budget, depth, wanted):
+    if depth > MAX_DEPTH:
+        raise ImageError('directories nested too deep')
+    for child in image.listdir(entry):
+        if wanted is not None and child.name not in wanted:
+            continue
+        if not _safe_name(child.name):
+            raise ImageError('unsafe file name %r' % child.name)
+        if child.is_link:
+            raise ImageError('symbolic link %r is not supported' %
+                             child.name)
+        subtree = None if wanted is None else wanted[child.name]
+        path = os.path.join(target, child.name)
+        if child.is_dir:
+            os.mkdir(path)
+            _extract_dir(image, child, path, budget, depth + 1, subtree)
+            continue
+        if subtree is not None:
+            # wanted as a directory
+            continue
+        budget[0] -= child.size
+        if budget[0] < 0:
+            raise ImageError('image holds too much data')
+        with open(path, 'wb') as fh:
+            fh.write(image.read(child))
+
+# vi: ts=4 expandtab
@@ -11,7 +11,9 @@
 from time import time
 
 import contextlib
+import errno
 import os
+import threading
 
 from six import StringIO
 from six.moves.configparser import (
@@ -20,12 +22,19 @@ from six.moves.configparser import (
 from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
                                 CFG_ENV_NAME)
 
+from cloudinit import config_cache
 from cloudinit import log as logging
 from cloudinit import type_utils
 from cloudinit import util
 
 LOG = logging.getLogger(__name__)
 
+# Journal of the semaphores in each semaphore directory.
+SEM_JOURNAL = '.journal'
+
+# FileSemaphores by directory, so each journal is read once per process.
+_FILE_SEMAPHORES = {}
+
 
 class LockFailure(Exception):
     pass
@@ -61,13 +70,46 @@ class FileLock(object):
         return "<%s using file %r>" % (type_utils.obj_name(self), self.fn)
 
 
+class JournalLock(object):
+    def __init__(self, journal, name):
+        self.journal = journal
+        self.name = name
+
+    def __str__(self):
+        return "<%s %r in journal %r>" % (
+            type_utils.obj_name(self), self.name, self.journal)
+
+
 def canon_sem_name(name):
     return name.replace("-", "_")
 
 
 class FileSemaphores(object):
+    """Semaphores recorded in a journal file in sem_path.
+
+    Each line of the journal is "<op>\t<name>\t<pid>\t<time>" where op is
+    '+' when name ran and '-' when it was cleared, the last record for a
+    name wins.  A file in sem_path named as the semaphore, as written by
+    older versions and by cloud-init-per, also means it has run.  The
+    directory and journal are read again when their stat changes, so
+    changes made through another object or process are seen; records are
+    appended holding an exclusive flock on the journal, after reading what
+    other processes appended.
+    """
+
     def __init__(self, sem_path):
         self.sem_path = sem_path
+        self.journal = os.path.join(sem_path, SEM_JOURNAL)
+        self._mutex = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Forget what was read, sem_path is read again on next use."""
+        self._ran = None
+        self._files = None
+        self._offset = 0
+        self._dir_key = None
+        self._journal_key = None
 
     @contextlib.contextmanager
     def lock(self, name, freq, clear_on_fail=False):
@@ -81,51 +123,64 @@ class FileSemaphores(object):
 
     def clear(self, name, freq):
         name = canon_sem_name(name)
-        sem_file = self._get_path(name, freq)
-        try:
-            util.del_file(sem_file)
-        except (IOError, OSError):
-            util.logexc(LOG, "Failed deleting semaphore %s", sem_file)
-            return False
+        sem_name = self._get_name(name, freq)
+        with self._mutex:
+            try:
+                self._load()
+                if sem_name in self._files:
+                    util.del_file(os.path.join(self.sem_path, sem_name))
+                    self._files.discard(sem_name)
+                if sem_name in self._ran:
+                    with self._journal_lock() as fd:
+                        if sem_name in self._ran:
+                            self._append(fd, '-', sem_name)
+            except (IOError, OSError):
+                util.logexc(LOG, "Failed deleting semaphore %s", sem_name)
+                return False
         return True
 
     def clear_all(self):
-        try:
-            util.del_dir(self.sem_path)
-        except (IOError, OSError):
-            util.logexc(LOG, "Failed deleting semaphore directory %s",
-                        self.sem_path)
+        with self._mutex:
+            try:
+                util.del_dir(self.sem_path)
+            except (IOError, OSError):
+                util.logexc(LOG, "Failed deleting semaphore directory %s",
+                            self.sem_path)
+            self.reload()
 
     def _acquire(self, name, freq):
-        # Check again if its been already gotten
-        if self.has_run(name, freq):
-            return None
-        # This is a race condition since nothing atomic is happening
-        # here, but this should be ok due to the nature of when
-        # and where cloud-init runs... (file writing is not a lock...)
-        sem_file = self._get_path(name, freq)
-        contents = "%s: %s\n" % (os.getpid(), time())
-        try:
-            util.write_file(sem_file, contents)
-        except (IOError, OSError):
-            util.logexc(LOG, "Failed writing semaphore file %s", sem_file)
-            return None
-        return FileLock(sem_file)
+        with self._mutex:
+            try:
+                self._load()
+                with self._journal_lock() as fd:
+                    # Check again if its been already gotten, now that no
+                    # other process can append.
+                    if self._has_run(name, freq):
+                        return None
+                    sem_name = self._get_name(name, freq)
+                    self._append(fd, '+', sem_name)
+            except (IOError, OSError):
+                util.logexc(LOG, "Failed writing semaphore journal %s",
+                            self.journal)
+                return None
+        return JournalLock(self.journal, sem_name)
 
     def has_run(self, name, freq):
+        with self._mutex:
+            self._load()
+            return self._has_run(name, freq)
+
+    def _has_run(self, name, freq):
         if not freq or freq == PER_ALWAYS:
             return False
 
         cname = canon_sem_name(name)
-        sem_file = self._get_path(cname, freq)
-        # This isn't really a good atomic check
-        # but it suffices for where and when cloudinit runs
-        if os.path.exists(sem_file):
+        if self._ran_as(cname, freq):
             return True
 
         # this case could happen if the migrator module hadn't run yet
         # but the item had run before we did canon_sem_name.
-        if cname != name and os.path.exists(self._get_path(name, freq)):
+        if cname != name and self._ran_as(name, freq):
             LOG.warning("%s has run without canonicalized name [%s].\n"
                         "likely the migrator has not yet run. "
                         "It will run next boot.\n"
@@ -135,12 +190,91 @@ class FileSemaphores(object):
 
         return False
 
-    def _get_path(self, name, freq):
-        sem_path = self.sem_path
+    def _ran_as(self, name, freq):
+        sem_name = self._get_name(name, freq)
+        return sem_name in self._ran or sem_name in self._files
+
+    def _load(self):
+        dir_key = config_cache.stat_key(self.sem_path)
+        if self._files is None or dir_key != self._dir_key:
+            try:
+                self._files = set(f for f in os.listdir(self.sem_path)
+                                  if not f.startswith('.'))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                self._files = set()
+            self._dir_key = dir_key
+        journal_key = config_cache.stat_key(self.journal)
+        if self._ran is None or journal_key != self._journal_key:
+            if (self._ran is None or journal_key is None or
+                    self._journal_key is None or
+                    journal_key[2] != self._journal_key[2]):
+                # A new journal, apply it all.
+                self._ran = set()
+                self._offset = 0
+            self._replay()
+            self._journal_key = journal_key
+
+    def _replay(self):
+        """Apply the records appended to the journal since last read."""
+        try:
+            data = util.load_file(self.journal, decode=False)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            data = b''
+        if len(data) < self._offset:
+            # Truncated or replaced, apply it all again.
+            self._offset = 0
+            self._ran = set()
+        # A record is only complete once its newline is written.
+        data = data[self._offset:data.rfind(b'\n') + 1]
+        self._offset += len(data)
+        for line in data.decode('utf-8').splitlines():
+            self._apply(line.split('\t'))
+
+    def _apply(self, record):
+        if len(record) < 2:
+            return
+        if record[0] == '+':
+            self._ran.add(record[1])
+        elif record[0] == '-':
+            self._ran.discard(record[1])
+
+    @contextlib.contextmanager
+    def _journal_lock(self):
+        with util.append_locked(self.journal) as fd:
+            self._replay()
+            yield fd
+
+    def _append(self, fd, op, sem_name):
+        record = (op, sem_name, str(os.getpid()), str(time()))
+        line = ('\t'.join(record) + '\n').encode('utf-8')
+        os.write(fd, line)
+        self._offset += len(line)
+        self._apply(record)
+
+    def _get_name(self, name, freq):
         if not freq or freq == PER_INSTANCE:
-            return os.path.join(sem_path, name)
+            return name
         else:
-            return os.path.join(sem_path, "%s.%s" % (name, freq))
+            return "%s.%s" % (name, freq)
+
+    def _get_path(self, name, freq):
+        return os.path.join(self.sem_path, self._get_name(name, freq))
+
+
+def file_semaphores(sem_path):
+    """Return the FileSemaphores for sem_path shared by this process.
+
+    Paths reaching the same directory, such as through the instance
+    symlink, share one.
+    """
+    key = os.path.realpath(sem_path)
+    if key not in _FILE_SEMAPHORES:
+        _FILE_SEMAPHORES[key] = FileSemaphores(sem_path)
+    return _FILE_SEMAPHORES[key]
 
 
 class Runners(object):
@@ -164,9 +298,15 @@ class Runners(object):
         if not sem_path:
             return None
         if sem_path not in self.sems:
-            self.sems[sem_path] = FileSemaphores(sem_path)
+            self.sems[sem_path] = file_semaphores(sem_path)
         return self.sems[sem_path]
 
+    def has_run(self, name, freq):
+        sem = self._get_sem(freq)
+        if not sem:
+            return False
+        return sem.has_run(name, freq)
+
     def run(self, name, functor, args, freq=None, clear_on_fail=False):
         sem = self._get_sem(freq)
         if not sem:
@@ -333,6 +473,8 @@ class Paths(object):
             "userdata_raw": "user-data.txt",
             "userdata": "user-data.txt.i",
             "obj_pkl": "obj.pkl",
+            "obj_json": "obj.json",
+            "obj_blobs": "obj-blobs",
             "cloud_config": "cloud-config.txt",
             "vendor_cloud_config": "vendor-cloud-config.txt",
             "data": "data",
@@ -341,6 +483,8 @@ class Paths(object):
             "instance_id": ".instance-id",
             "manual_clean_marker": "manual-clean",
             "warnings": "warnings",
+            "platform_facts": "platform-facts.json",
+            "module_index": "module-index.json",
         }
         # Set when a datasource becomes active
         self.datasource = ds
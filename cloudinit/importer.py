@@ -9,6 +9,14 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import sys
+import types
+
+import six
+
+if six.PY2:
+    import imp
+else:
+    import importlib.util
 
 
 def import_module(module_name):
@@ -16,6 +24,59 @@ def import_module(module_name):
     return sys.modules[module_name]
 
 
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, module_name):
+        super(LazyModule, self).__init__(module_name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        mod = self.__dict__['_lazy_module']
+        if mod is None:
+            mod = import_module(self.__name__)
+            self.__dict__['_lazy_module'] = mod
+        return mod
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.__dict__['_lazy_module'] is None:
+            return "<lazy module '%s'>" % self.__name__
+        return repr(self.__dict__['_lazy_module'])
+
+
+def lazy_import(module_name):
+    """Return module_name, or a stand-in importing it when first used.
+
+    Heavy dependencies used only by some code paths are imported this way
+    so that short lived commands do not pay for them.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    return LazyModule(module_name)
+
+
+def is_importable(module_name):
+    """Return True if the top level module_name can be found on sys.path.
+
+    The module is located but not imported.
+    """
+    if module_name in sys.modules:
+        return True
+    try:
+        if six.PY2:
+            imp.find_module(module_name)
+            return True
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
 def find_module(base_name, search_paths, required_attrs=None):
     if not required_attrs:
         required_attrs = []
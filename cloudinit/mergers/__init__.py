@@ -49,16 +49,62 @@ class UnknownMerger(object):
 
 
 class LookupMerger(UnknownMerger):
-    def __init__(self, lookups=None):
+    def __init__(self, lookups=None, owned=None, methods=None):
         UnknownMerger.__init__(self)
         if lookups is None:
             self._lookups = []
         else:
             self._lookups = lookups
+        # Containers created by this merge (by id), which the mergers may
+        # change in place instead of copying again.  None disables this.
+        self._owned = owned
+        # Which of the lookups handles each method, shared by the mergers
+        # constructed from the same plan.
+        if methods is None:
+            self._methods = {}
+        else:
+            self._methods = methods
 
     def __str__(self):
         return 'LookupMerger: (%s)' % (len(self._lookups))
 
+    def owns(self, obj):
+        """Return True if obj was created by this merge."""
+        return self._owned is not None and id(obj) in self._owned
+
+    def own(self, obj):
+        """Mark obj, a copy made by this merge, as changeable in place."""
+        if self._owned is not None:
+            self._owned[id(obj)] = obj
+        return obj
+
+    def _find_method(self, source):
+        """Return (method name, index of the lookup handling it or None)."""
+        # Classes, modules and functions are named by their own name
+        # rather than by their type's, so only cache other values by type.
+        key = type(source)
+        if hasattr(source, '__name__'):
+            key = None
+        found = self._methods.get(key) if key is not None else None
+        if found is None:
+            method_name = "_on_%s" % (type_utils.obj_name(source).lower())
+            index = None
+            for (i, merger) in enumerate(self._lookups):
+                if hasattr(merger, method_name):
+                    index = i
+                    break
+            found = (method_name, index)
+            if key is not None:
+                self._methods[key] = found
+        return found
+
+    def merge(self, source, merge_with):
+        (method_name, index) = self._find_method(source)
+        if index is None:
+            return UnknownMerger._handle_unknown(self, method_name,
+                                                 source, merge_with)
+        return getattr(self._lookups[index], method_name)(source, merge_with)
+
     # For items which can not be merged by the parent this object
     # will lookup in a internally maintained set of objects and
     # find which one of those objects can perform the merge. If
@@ -128,27 +174,67 @@ def default_mergers():
     return tuple(string_extract_mergers(DEF_MERGE_TYPE))
 
 
-def construct(parsed_mergers):
-    mergers_to_be = []
+def _find_merger(m_name):
+    if not m_name.startswith(MERGER_PREFIX):
+        m_name = MERGER_PREFIX + str(m_name)
+    merger_locs, looked_locs = importer.find_module(m_name,
+                                                    [__name__],
+                                                    [MERGER_ATTR])
+    if not merger_locs:
+        msg = ("Could not find merger module named '%s' "
+               "with attribute '%s' (searched %s)") % (m_name,
+                                                       MERGER_ATTR,
+                                                       looked_locs)
+        raise ImportError(msg)
+    mod = importer.import_module(merger_locs[0])
+    return getattr(mod, MERGER_ATTR)
+
+
+def _plan_key(parsed_mergers):
+    key = []
     for (m_name, m_ops) in parsed_mergers:
-        if not m_name.startswith(MERGER_PREFIX):
-            m_name = MERGER_PREFIX + str(m_name)
-        merger_locs, looked_locs = importer.find_module(m_name,
-                                                        [__name__],
-                                                        [MERGER_ATTR])
-        if not merger_locs:
-            msg = ("Could not find merger module named '%s' "
-                   "with attribute '%s' (searched %s)") % (m_name,
-                                                           MERGER_ATTR,
-                                                           looked_locs)
-            raise ImportError(msg)
-        else:
-            mod = importer.import_module(merger_locs[0])
-            mod_attr = getattr(mod, MERGER_ATTR)
-            mergers_to_be.append((mod_attr, m_ops))
+        if isinstance(m_ops, (list, tuple)):
+            m_ops = tuple(m_ops)
+        key.append((m_name, m_ops))
+    key = tuple(key)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+# Compiled plans by their parsed merge_how, see compile_plan.
+_PLANS = {}
+
+
+def compile_plan(parsed_mergers):
+    """Return the merger classes and options for parsed_mergers.
+
+    Plans are compiled once per distinct merge_how and shared, along with
+    the method lookups of the mergers constructed from them.
+    """
+    key = _plan_key(parsed_mergers)
+    plan = _PLANS.get(key) if key is not None else None
+    if plan is None:
+        plan = ([(_find_merger(m_name), m_ops)
+                 for (m_name, m_ops) in parsed_mergers], {})
+        if key is not None:
+            _PLANS[key] = plan
+    return plan
+
+
+def construct(parsed_mergers, owned=None):
+    """Return a merger for parsed_mergers.
+
+    If owned is a dict, containers the merger copies are recorded there
+    and changed in place by later merges given the same owned dict; only
+    pass one when the merged results are not shared until merging ends.
+    """
+    (mergers_to_be, methods) = compile_plan(parsed_mergers)
     # Now form them...
     mergers = []
-    root = LookupMerger(mergers)
+    root = LookupMerger(mergers, owned=owned, methods=methods)
     for (attr, opts) in mergers_to_be:
         mergers.append(attr(root, opts))
     return root
@@ -32,6 +32,9 @@ class Merger(object):
         self._allow_delete = 'allow_delete' in opts
         # Backwards compat require this to be on.
         self._recurse_dict = True
+        # Copy-on-write support of the root merger, if any.
+        self._owns = getattr(merger, 'owns', None)
+        self._own = getattr(merger, 'own', None)
 
     def __str__(self):
         s = ('DictMerger: (method=%s,recurse_str=%s,'
@@ -64,13 +67,24 @@ class Merger(object):
                 value[k] = v
         return value
 
+    def _writable(self, value):
+        # Copy value unless it is a copy this same merge already made.
+        if self._owns and self._owns(value):
+            return value
+        copied = dict(value)
+        if self._own:
+            self._own(copied)
+        return copied
+
     def _on_dict(self, value, merge_with):
         if not isinstance(merge_with, (dict)):
             return value
         if self._method == 'replace':
-            merged = self._do_dict_replace(dict(value), merge_with, True)
+            merged = self._do_dict_replace(self._writable(value),
+                                           merge_with, True)
         elif self._method == 'no_replace':
-            merged = self._do_dict_replace(dict(value), merge_with, False)
+            merged = self._do_dict_replace(self._writable(value),
+                                           merge_with, False)
         else:
             raise NotImplementedError("Unknown merge type %s" % (self._method))
         return merged
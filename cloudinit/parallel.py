@@ -0,0 +1,183 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Minimal thread pool helpers usable on python 2.6+ and python 3.
+
+concurrent.futures is not available on every python cloud-init supports,
+so this provides just enough of a worker pool for cloud-init's needs.
+"""
+
+import threading
+
+from six.moves import queue
+
+DEF_MAX_WORKERS = 8
+
+
+class Counter(object):
+    """A running total that may be added to from several threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _call(completed, func, index, item):
+    """Put (index, result, exc) of func(item) on completed.
+
+    Return False if func raised an exception that is not an Exception,
+    such as SystemExit, after which the worker should stop.
+    """
+    try:
+        completed.put((index, func(item), None))
+    except Exception as e:
+        completed.put((index, None, e))
+    except BaseException as e:
+        completed.put((index, None, e))
+        return False
+    return True
+
+
+def _get_completed(completed):
+    """Return the next (index, result, exc) from completed.
+
+    Exceptions that are not an Exception are raised, as they would be
+    when calling func directly.
+    """
+    (index, result, exc) = completed.get()
+    if exc is not None and not isinstance(exc, Exception):
+        raise exc
+    return (index, result, exc)
+
+
+def iter_completed(func, items, max_workers=DEF_MAX_WORKERS):
+    """Call func(item) for each of items on a pool of worker threads.
+
+    Yields (index, result, exc) tuples in completion order, where index is
+    the position of the item in items.  If func raised, result is None and
+    exc is the raised exception, otherwise exc is None.  Exceptions that
+    are not an Exception, such as SystemExit or KeyboardInterrupt, are
+    raised from the iteration instead.
+
+    Worker threads are daemons.  If the caller stops iterating before all
+    items completed, items that were not yet started are dropped and calls
+    already in flight finish in the background with results discarded.
+
+    @param func: callable taking a single item.
+    @param items: iterable of items to call func with.
+    @param max_workers: upper bound on concurrently running calls.
+    """
+    items = list(items)
+    if not items:
+        return
+    if not max_workers or max_workers < 1:
+        max_workers = DEF_MAX_WORKERS
+    max_workers = min(max_workers, len(items))
+
+    pending = queue.Queue()
+    for index, item in enumerate(items):
+        pending.put((index, item))
+    completed = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                index, item = pending.get_nowait()
+            except queue.Empty:
+                return
+            if not _call(completed, func, index, item):
+                return
+
+    for _ in range(max_workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for _ in range(len(items)):
+            yield _get_completed(completed)
+    finally:
+        stop.set()
+
+
+def iter_dependent(func, items, depends, max_workers=DEF_MAX_WORKERS):
+    """Call func(item) for items on worker threads, respecting depends.
+
+    Like iter_completed, but items[index] is only started once every
+    index in depends[index] has completed (whether or not it raised).
+    Items that are ready start in the order they appear in items.
+
+    @param func: callable taking a single item.
+    @param items: iterable of items to call func with.
+    @param depends: for each item, the indexes of items it must follow.
+        These must be lower than the item's own index.
+    @param max_workers: upper bound on concurrently running calls.
+    """
+    items = list(items)
+    if not items:
+        return
+    if not max_workers or max_workers < 1:
+        max_workers = DEF_MAX_WORKERS
+    max_workers = min(max_workers, len(items))
+
+    waiting = [set(deps) for deps in depends]
+    dependents = [[] for _ in items]
+    for (index, deps) in enumerate(waiting):
+        for dep in deps:
+            if dep >= index:
+                raise ValueError("Item %s depends on later item %s" %
+                                 (index, dep))
+            dependents[dep].append(index)
+    ready = queue.Queue()
+    for (index, deps) in enumerate(waiting):
+        if not deps:
+            ready.put(index)
+    completed = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        while True:
+            index = ready.get()
+            if index is None or stop.is_set():
+                return
+            if not _call(completed, func, index, items[index]):
+                return
+
+    threads = []
+    for _ in range(max_workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for _ in range(len(items)):
+            (index, result, exc) = _get_completed(completed)
+            for dependent in dependents[index]:
+                waiting[dependent].discard(index)
+                if not waiting[dependent]:
+                    ready.put(dependent)
+            yield (index, result, exc)
+    finally:
+        stop.set()
+        for _ in threads:
+            ready.put(None)
+
+
+def map_completed(func, items, max_workers=DEF_MAX_WORKERS):
+    """Call func(item) for each of items concurrently and wait for all.
+
+    Return a list of (result, exc) tuples in the same order as items, see
+    iter_completed for their meaning.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    for index, result, exc in iter_completed(func, items, max_workers):
+        results[index] = (result, exc)
+    return results
+
+# vi: ts=4 expandtab
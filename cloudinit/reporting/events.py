@@ -10,6 +10,7 @@ They can be published to registered handlers with report_event.
 """
 import base64
 import os.path
+import threading
 import time
 
 from . import instantiated_handler_registry
@@ -19,6 +20,10 @@ START_EVENT_TYPE = 'start'
 
 DEFAULT_EVENT_ORIGIN = 'cloudinit'
 
+# Events of modules run concurrently are reported from several threads,
+# handlers are called one event at a time.
+_REPORT_LOCK = threading.RLock()
+
 
 class _nameset(set):
     def __getattr__(self, name):
@@ -91,8 +96,10 @@ def report_event(event):
         The type of the event; this should be a constant from the
         reporting module.
     """
-    for _, handler in instantiated_handler_registry.registered_items.items():
-        handler.publish_event(event)
+    with _REPORT_LOCK:
+        for _, handler in (
+                instantiated_handler_registry.registered_items.items()):
+            handler.publish_event(event)
 
 
 def report_finish_event(event_name, event_description,
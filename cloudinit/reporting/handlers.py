@@ -2,7 +2,10 @@
 
 import abc
 import json
+import os
 import six
+import threading
+import time
 
 from cloudinit import log as logging
 from cloudinit.registry import DictRegistry
@@ -11,6 +14,12 @@ from cloudinit import (url_helper, util)
 
 LOG = logging.getLogger(__name__)
 
+DEFAULT_TRACE_FILE = '/run/cloud-init/boot-trace.json'
+TRACE_VERSION = 2
+
+# time.monotonic is not available on python 2.
+_monotonic = getattr(time, 'monotonic', time.time)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class ReportingHandler(object):
@@ -85,9 +94,155 @@ class WebHookHandler(ReportingHandler):
             LOG.warning("failed posting event: %s", event.as_string())
 
 
+class ProfileHandler(ReportingHandler):
+    """Record the resources used by each event into a json trace file.
+
+    For every finished event the trace holds its wall clock start time,
+    monotonic start and end times, the cpu time used by cloud-init and its
+    subprocesses, the number of subprocesses started and the bytes fetched
+    by url_helper.readurl.  Counts for an event include those of its
+    children.
+
+    The trace file is a header line with the trace version followed by
+    one json record per line.  Records are kept in memory and appended
+    whenever a top level event (a cloud-init stage) finishes, after those
+    of earlier stages of this boot.
+    """
+
+    def __init__(self, trace_file=DEFAULT_TRACE_FILE):
+        super(ProfileHandler, self).__init__()
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+        self._started = {}
+        self._records = []
+        self._header_checked = False
+
+    @staticmethod
+    def _sample():
+        times = os.times()
+        return {'monotonic': _monotonic(),
+                'cpu': sum(times[0:4]),
+                'subprocesses': util.SUBP_COUNT.value,
+                'bytes_fetched': url_helper.BYTES_FETCHED.value}
+
+    def publish_event(self, event):
+        sample = self._sample()
+        with self._lock:
+            if event.event_type == 'start':
+                self._started[event.name] = (event.timestamp, sample)
+                return
+            if event.event_type != 'finish':
+                return
+            try:
+                (timestamp, start) = self._started.pop(event.name)
+            except KeyError:
+                return
+            self._records.append({
+                'name': event.name,
+                'description': event.description,
+                'result': event.result,
+                'timestamp': timestamp,
+                'start': start['monotonic'],
+                'end': sample['monotonic'],
+                'cpu': round(sample['cpu'] - start['cpu'], 3),
+                'subprocesses': (sample['subprocesses'] -
+                                 start['subprocesses']),
+                'bytes_fetched': (sample['bytes_fetched'] -
+                                  start['bytes_fetched']),
+            })
+            if '/' not in event.name:
+                self._flush()
+
+    def _flush(self):
+        content = ''.join(json.dumps(r, separators=(',', ':')) + '\n'
+                          for r in self._records)
+        try:
+            with util.append_locked(self.trace_file) as fd:
+                if not self._header_checked:
+                    # Only the header of a trace left by earlier stages is
+                    # read, one of another version is replaced.
+                    if load_trace_header(self.trace_file) is None:
+                        os.ftruncate(fd, 0)
+                        content = _trace_header() + content
+                    self._header_checked = True
+                os.write(fd, util.encode_text(content))
+        except (IOError, OSError) as e:
+            LOG.warning("failed writing profile trace %s: %s",
+                        self.trace_file, e)
+            return
+        self._records = []
+
+
+def _trace_header():
+    return json.dumps({'version': TRACE_VERSION}) + '\n'
+
+
+def load_trace_header(trace_file):
+    """Return the header of the profile trace in trace_file or None."""
+    try:
+        with open(trace_file, 'r') as fh:
+            line = fh.readline()
+    except (IOError, OSError):
+        return None
+    return _parse_header(line)
+
+
+def _parse_header(line):
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(header, dict) or header.get('version') != TRACE_VERSION:
+        return None
+    return header
+
+
+def parse_trace(lines):
+    """Return the profile trace in lines as {'version', 'events'} or None.
+
+    A line that is not valid json, such as the last one of a stage that
+    was killed while writing, is skipped.
+    """
+    lines = iter(lines)
+    for line in lines:
+        if line.strip():
+            break
+    else:
+        return None
+    header = _parse_header(line)
+    if header is None:
+        return None
+    events = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict):
+            events.append(record)
+    return {'version': header['version'], 'events': events}
+
+
+def load_trace(trace_file):
+    """Return the profile trace in trace_file or None if not usable."""
+    try:
+        with open(trace_file, 'r') as fh:
+            return parse_trace(fh)
+    except (IOError, OSError):
+        return None
+
+
+def is_trace(data):
+    """Return True if data is a profile trace as parse_trace returns it."""
+    return (isinstance(data, dict) and
+            data.get('version') == TRACE_VERSION and
+            isinstance(data.get('events'), list))
+
+
 available_handlers = DictRegistry()
 available_handlers.register_item('log', LogHandler)
 available_handlers.register_item('print', PrintHandler)
+available_handlers.register_item('profile', ProfileHandler)
 available_handlers.register_item('webhook', WebHookHandler)
 
 # vi: ts=4 expandtab
@@ -4,6 +4,11 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import copy
+import hashlib
+import threading
+
+import six
 import yaml
 
 
@@ -17,7 +22,63 @@ _CustomSafeLoader.add_constructor(
     _CustomSafeLoader.construct_python_unicode)
 
 
-def load(blob):
-    return(yaml.load(blob, Loader=_CustomSafeLoader))
+if hasattr(yaml, 'CSafeLoader'):
+    # The same constructors on top of the LibYAML parser.
+    class _CustomCSafeLoader(yaml.CSafeLoader):
+        def construct_python_unicode(self, node):
+            return self.construct_scalar(node)
+
+    _CustomCSafeLoader.add_constructor(
+        u'tag:yaml.org,2002:python/unicode',
+        _CustomCSafeLoader.construct_python_unicode)
+
+    _FastLoader = _CustomCSafeLoader
+else:
+    _FastLoader = _CustomSafeLoader
+
+# Parsed documents by the sha256 of their contents.  Callers get deep
+# copies so they may modify what they are handed.
+CACHE_MAX_ENTRIES = 64
+_CACHE = {}
+_CACHE_ORDER = []
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_key(blob):
+    if isinstance(blob, six.text_type):
+        blob = blob.encode('utf-8')
+    elif not isinstance(blob, six.binary_type):
+        # a stream, which can only be read once
+        return None
+    return hashlib.sha256(blob).hexdigest()
+
+
+def clear_cache():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+        del _CACHE_ORDER[:]
+
+
+def load(blob, cached=True):
+    """Load the yaml in blob, reusing an earlier parse of the same blob."""
+    key = _cache_key(blob) if cached else None
+    if key is not None:
+        with _CACHE_LOCK:
+            if key in _CACHE:
+                return copy.deepcopy(_CACHE[key])
+    loaded = yaml.load(blob, Loader=_FastLoader)
+    if key is not None:
+        with _CACHE_LOCK:
+            if key not in _CACHE:
+                if len(_CACHE_ORDER) >= CACHE_MAX_ENTRIES:
+                    del _CACHE[_CACHE_ORDER.pop(0)]
+                _CACHE_ORDER.append(key)
+            _CACHE[key] = copy.deepcopy(loaded)
+    return loaded
+
+
+def load_pure(blob):
+    """Load the yaml in blob with the pure python parser."""
+    return yaml.load(blob, Loader=_CustomSafeLoader)
 
 # vi: ts=4 expandtab
@@ -16,6 +16,9 @@ CLOUD_CONFIG = '/etc/cloud/cloud.cfg'
 
 RUN_CLOUD_CONFIG = '/run/cloud-init/cloud.cfg'
 
+# Parsed and merged base config shared by the boot stages
+BASE_CONFIG_CACHE = '/run/cloud-init/base-config.json'
+
 # What u get if no config is provided
 CFG_BUILTIN = {
     'datasource_list': [
@@ -61,4 +64,12 @@ PER_ONCE = "once"
 # Used to sanity check incoming handlers/modules frequencies
 FREQUENCIES = [PER_INSTANCE, PER_ALWAYS, PER_ONCE]
 
+# Shared resources modules declare they read or write, besides absolute
+# paths of the files and directories they use.  Modules in a section only
+# run concurrently when neither writes what the other uses.
+RES_CONSOLE = "console"
+RES_NETWORK = "network"
+RES_PACKAGES = "packages"
+RES_USERS = "users"
+
 # vi: ts=4 expandtab
@@ -15,11 +15,14 @@ import time
 from xml.dom import minidom
 import xml.etree.ElementTree as ET
 
+from cloudinit import helpers
 from cloudinit import log as logging
 from cloudinit import net
+from cloudinit.settings import PER_INSTANCE
 from cloudinit import sources
 from cloudinit.sources.helpers.azure import get_metadata_from_fabric
 from cloudinit import util
+from cloudinit import wait_helper
 
 LOG = logging.getLogger(__name__)
 
@@ -455,7 +458,11 @@ class DataSourceAzure(sources.DataSource):
         return fabric_data
 
     def activate(self, cfg, is_new_instance):
-        address_ephemeral_resize(is_new_instance=is_new_instance)
+        # self.paths was made before this datasource was found.
+        sem_path = helpers.Paths(
+            {'cloud_dir': self.paths.cloud_dir}, self).get_ipath('sem')
+        address_ephemeral_resize(is_new_instance=is_new_instance,
+                                 sem_path=sem_path)
         return
 
     @property
@@ -574,7 +581,7 @@ def can_dev_be_reformatted(devpath):
 
 
 def address_ephemeral_resize(devpath=RESOURCE_DISK_PATH, maxwait=120,
-                             is_new_instance=False):
+                             is_new_instance=False, sem_path=None):
     # wait for ephemeral disk to come up
     naplen = .2
     missing = wait_for_files([devpath], maxwait=maxwait, naplen=naplen,
@@ -596,16 +603,19 @@ def address_ephemeral_resize(devpath=RESOURCE_DISK_PATH, maxwait=120,
     if not result:
         return
 
+    if not sem_path:
+        LOG.warning("No instance semaphore path, disk_setup and mounts "
+                    "will not run again")
+        return
+    sems = helpers.file_semaphores(sem_path)
     for mod in ['disk_setup', 'mounts']:
-        sempath = '/var/lib/cloud/instance/sem/config_' + mod
-        bmsg = 'Marker "%s" for module "%s"' % (sempath, mod)
-        if os.path.exists(sempath):
-            try:
-                os.unlink(sempath)
+        sem_name = 'config_' + mod
+        bmsg = 'Marker "%s" for module "%s"' % (sem_name, mod)
+        if sems.has_run(sem_name, PER_INSTANCE):
+            if sems.clear(sem_name, PER_INSTANCE):
                 LOG.debug(bmsg + " removed.")
-            except Exception as e:
-                # python3 throws FileNotFoundError, python2 throws OSError
-                LOG.warning(bmsg + ": remove failed! (%s)", e)
+            else:
+                LOG.warning(bmsg + ": remove failed!")
         else:
             LOG.debug(bmsg + " did not exist.")
     return
@@ -661,21 +671,16 @@ def pubkeys_from_crt_files(flist):
 
 
 def wait_for_files(flist, maxwait, naplen=.5, log_pre=""):
-    need = set(flist)
-    waited = 0
-    while True:
-        need -= set([f for f in need if os.path.exists(f)])
-        if len(need) == 0:
-            LOG.debug("%sAll files appeared after %s seconds: %s",
-                      log_pre, waited, flist)
-            return []
-        if waited == 0:
-            LOG.info("%sWaiting up to %s seconds for the following files: %s",
-                     log_pre, maxwait, flist)
-        if waited + naplen > maxwait:
-            break
-        time.sleep(naplen)
-        waited += naplen
+    need = set([f for f in flist if not os.path.exists(f)])
+    start = time.time()
+    if need:
+        LOG.info("%sWaiting up to %s seconds for the following files: %s",
+                 log_pre, maxwait, flist)
+        need = wait_helper.wait_for_paths(need, maxwait, naplen)
+    if len(need) == 0:
+        LOG.debug("%sAll files appeared after %s seconds: %s",
+                  log_pre, round(time.time() - start, 3), flist)
+        return []
 
     LOG.warning("%sStill missing files after %s seconds: %s",
                 log_pre, maxwait, need)
@@ -29,6 +29,8 @@ LABEL_TYPES = ('config-2',)
 POSSIBLE_MOUNTS = ('sr', 'cd')
 OPTICAL_DEVICES = tuple(('/dev/%s%s' % (z, i) for z in POSSIBLE_MOUNTS
                         for i in range(0, 2)))
+# Files and directories read_config_drive looks at
+CONFIG_DRIVE_PATHS = ('openstack', 'ec2') + tuple(sorted(openstack.FILES_V1))
 
 
 class DataSourceConfigDrive(openstack.SourceMixin, sources.DataSource):
@@ -74,8 +76,9 @@ class DataSourceConfigDrive(openstack.SourceMixin, sources.DataSource):
                     else:
                         mtype = None
                         sync = True
-                    results = util.mount_cb(dev, read_config_drive,
-                                            mtype=mtype, sync=sync)
+                    results = util.read_image_cb(
+                        dev, read_config_drive, mtype=mtype, sync=sync,
+                        paths=CONFIG_DRIVE_PATHS)
                     found = dev
                 except openstack.NonReadable:
                     pass
@@ -64,6 +64,10 @@ class DataSourceEc2(sources.DataSource):
     # Whether we want to get network configuration from the metadata service.
     get_network_metadata = False
 
+    # Default number of concurrent requests used to crawl the metadata tree.
+    # Set datasource Ec2 crawl_max_workers to 1 to crawl sequentially.
+    crawl_max_workers = 4
+
     def __init__(self, sys_cfg, distro, paths):
         sources.DataSource.__init__(self, sys_cfg, distro, paths)
         self.metadata_address = None
@@ -162,6 +166,16 @@ class DataSourceEc2(sources.DataSource):
 
         return (max_wait, timeout)
 
+    def _get_crawl_max_workers(self):
+        max_workers = self.crawl_max_workers
+        try:
+            max_workers = max(1, int(
+                self.ds_cfg.get("crawl_max_workers", max_workers)))
+        except Exception:
+            util.logexc(LOG, "Failed to get crawl_max_workers, using %s",
+                        max_workers)
+        return max_workers
+
     def wait_for_metadata_service(self):
         mcfg = self.ds_cfg
 
@@ -318,7 +332,8 @@ class DataSourceEc2(sources.DataSource):
             self.userdata_raw = ec2.get_instance_userdata(
                 api_version, self.metadata_address)
             self.metadata = ec2.get_instance_metadata(
-                api_version, self.metadata_address)
+                api_version, self.metadata_address,
+                max_workers=self._get_crawl_max_workers())
         except Exception:
             util.logexc(
                 LOG, "Failed reading from metadata address %s",
@@ -112,8 +112,10 @@ class DataSourceNoCloud(sources.DataSource):
                     LOG.debug("Attempting to use data from %s", dev)
 
                     try:
-                        seeded = util.mount_cb(dev, _pp2d_callback,
-                                               pp2d_kwargs)
+                        seeded = util.read_image_cb(
+                            dev, _pp2d_callback, pp2d_kwargs,
+                            paths=(pp2d_kwargs['required'] +
+                                   pp2d_kwargs['optional']))
                     except ValueError as e:
                         if dev in label_list:
                             LOG.warning("device %s with label=%s not a"
@@ -13,11 +13,11 @@ from xml.dom import minidom
 import base64
 import os
 import re
-import time
 
 from cloudinit import log as logging
 from cloudinit import sources
 from cloudinit import util
+from cloudinit import wait_helper
 
 from cloudinit.sources.helpers.vmware.imc.config \
     import Config
@@ -283,16 +283,15 @@ def get_max_wait_from_cfg(cfg):
 
 def wait_for_imc_cfg_file(filename, maxwait=180, naplen=5,
                           dirpath="/var/run/vmware-imc"):
-    waited = 0
-
-    while waited < maxwait:
-        fileFullPath = os.path.join(dirpath, filename)
-        if os.path.isfile(fileFullPath):
-            return fileFullPath
+    fileFullPath = os.path.join(dirpath, filename)
+    if maxwait <= 0:
+        return None
+    if not os.path.isfile(fileFullPath):
         LOG.debug("Waiting for VMware Customization Config File")
-        time.sleep(naplen)
-        waited += naplen
-    return None
+        if wait_helper.wait_for_paths([fileFullPath], maxwait, naplen,
+                                      exists=os.path.isfile):
+            return None
+    return fileFullPath
 
 
 def get_network_config_from_conf(config, use_system_devices=True,
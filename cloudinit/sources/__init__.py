@@ -15,6 +15,7 @@ import six
 
 from cloudinit import importer
 from cloudinit import log as logging
+from cloudinit import parallel
 from cloudinit import type_utils
 from cloudinit import user_data as ud
 from cloudinit import util
@@ -33,6 +34,10 @@ DEP_FILESYSTEM = "FILESYSTEM"
 DEP_NETWORK = "NETWORK"
 DS_PREFIX = 'DataSource'
 
+# Valid values for the 'mode' key of the datasource_discovery config
+DISCOVERY_SERIAL = "serial"
+DISCOVERY_PARALLEL = "parallel"
+
 LOG = logging.getLogger(__name__)
 
 
@@ -78,6 +83,21 @@ class DataSource(object):
     def __str__(self):
         return type_utils.obj_name(self)
 
+    def __getattr__(self, name):
+        # Attributes restored from the instance cache are read on first use.
+        lazy = self.__dict__.get('_lazy_attrs')
+        if lazy and name in lazy:
+            value = lazy.pop(name)()
+            setattr(self, name, value)
+            return value
+        raise AttributeError("'%s' object has no attribute '%s'" %
+                             (type(self).__name__, name))
+
+    def load_lazy_attrs(self):
+        """Read all attributes not yet read from the instance cache."""
+        for name in list(self.__dict__.get('_lazy_attrs') or []):
+            getattr(self, name)
+
     def get_userdata(self, apply_filter=False):
         if self.userdata is None:
             self.userdata = self.ud_proc.process(self.get_userdata_raw())
@@ -319,27 +339,77 @@ def find_source(sys_cfg, distro, paths, ds_deps, cfg_list, pkg_list, reporter):
     mode = "network" if DEP_NETWORK in ds_deps else "local"
     LOG.debug("Searching for %s data source in: %s", mode, ds_names)
 
-    for name, cls in zip(ds_names, ds_list):
-        myrep = events.ReportEventStack(
-            name="search-%s" % name.replace("DataSource", ""),
-            description="searching for %s data from %s" % (mode, name),
-            message="no %s data found from %s" % (mode, name),
-            parent=reporter)
-        try:
-            with myrep:
-                LOG.debug("Seeing if we can get any data from %s", cls)
-                s = cls(sys_cfg, distro, paths)
-                if s.get_data():
-                    myrep.message = "found %s data from %s" % (mode, name)
-                    return (s, type_utils.obj_name(cls))
-        except Exception:
-            util.logexc(LOG, "Getting data from %s failed", cls)
+    def search(candidate):
+        (name, cls) = candidate
+        return _search_source(name, cls, mode, sys_cfg, distro, paths,
+                              reporter)
+
+    candidates = list(zip(ds_names, ds_list))
+    discovery_cfg = sys_cfg.get('datasource_discovery') or {}
+    if discovery_cfg.get('mode', DISCOVERY_SERIAL) == DISCOVERY_PARALLEL:
+        max_workers = util.get_cfg_option_int(
+            discovery_cfg, 'max_workers', parallel.DEF_MAX_WORKERS)
+        LOG.debug("Searching %s data sources in parallel (max_workers=%s)",
+                  mode, max_workers)
+        found = _search_parallel(search, candidates, max_workers)
+    else:
+        found = _search_serial(search, candidates)
+
+    if found:
+        (s, cls) = found
+        return (s, type_utils.obj_name(cls))
 
     msg = ("Did not find any data source,"
            " searched classes: (%s)") % (", ".join(ds_names))
     raise DataSourceNotFoundException(msg)
 
 
+def _search_source(name, cls, mode, sys_cfg, distro, paths, reporter):
+    """Instantiate cls and return it if get_data succeeds, else None."""
+    myrep = events.ReportEventStack(
+        name="search-%s" % name.replace("DataSource", ""),
+        description="searching for %s data from %s" % (mode, name),
+        message="no %s data found from %s" % (mode, name),
+        parent=reporter)
+    try:
+        with myrep:
+            LOG.debug("Seeing if we can get any data from %s", cls)
+            s = cls(sys_cfg, distro, paths)
+            if s.get_data():
+                myrep.message = "found %s data from %s" % (mode, name)
+                return s
+    except Exception:
+        util.logexc(LOG, "Getting data from %s failed", cls)
+    return None
+
+
+def _search_serial(search, candidates):
+    for candidate in candidates:
+        s = search(candidate)
+        if s:
+            return (s, candidate[1])
+    return None
+
+
+def _search_parallel(search, candidates, max_workers):
+    """Search all candidates concurrently, preferring earlier candidates.
+
+    Return as soon as the first candidate in list order whose search
+    succeeded is known, that is once it and all candidates before it have
+    completed.  Searches still running at that point are ignored.
+    """
+    found = {}
+    best = 0
+    for index, s, _exc in parallel.iter_completed(search, candidates,
+                                                  max_workers):
+        found[index] = s
+        while best in found:
+            if found[best]:
+                return (found[best], candidates[best][1])
+            best += 1
+    return None
+
+
 # Return a list of classes that have the same depends as 'depends'
 # iterate through cfg_list, loading "DataSource*" modules
 # and calling their "get_datasource_list".
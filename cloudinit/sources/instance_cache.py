@@ -0,0 +1,217 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Versioned on-disk cache of the active datasource.
+
+The cache is a json document describing the datasource class and its
+instance attributes, plus one blob file per large attribute (raw and
+processed user-data and vendor-data).  Blobs are only read from disk when
+the restored datasource first accesses them.
+
+Datasources holding attributes that can not be represented in json (such
+as client objects) can not be cached this way; store returns False for
+them so the caller can fall back to pickling.
+"""
+
+import base64
+import email
+import json
+import os
+
+import six
+
+from cloudinit import importer
+from cloudinit import log as logging
+from cloudinit import user_data as ud
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+# Attributes recreated from the restoring Init rather than cached.
+RUNTIME_ATTRS = ('sys_cfg', 'distro', 'paths', 'ud_proc', '_lazy_attrs')
+
+# Attributes written to their own blob file and loaded on first access.
+BLOB_ATTRS = ('userdata_raw', 'vendordata_raw', 'userdata', 'vendordata')
+
+# Key marking a json object as an encoded non-json python value.
+TYPE_KEY = '__ci_type__'
+
+
+class UnencodableError(TypeError):
+    pass
+
+
+def _encode(value):
+    if value is None or isinstance(value, (bool, float) + six.integer_types):
+        return value
+    if isinstance(value, six.text_type):
+        return value
+    if isinstance(value, six.binary_type):
+        return {TYPE_KEY: 'bytes',
+                'value': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, tuple):
+        return {TYPE_KEY: 'tuple', 'value': [_encode(v) for v in value]}
+    if isinstance(value, dict):
+        encoded = {}
+        for (k, v) in value.items():
+            if not isinstance(k, six.string_types) or k == TYPE_KEY:
+                raise UnencodableError("unsupported key %r" % (k,))
+            encoded[k] = _encode(v)
+        return encoded
+    raise UnencodableError("unsupported type %s" % type(value))
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        vtype = value.get(TYPE_KEY)
+        if vtype == 'bytes':
+            return base64.b64decode(value['value'].encode('ascii'))
+        if vtype == 'tuple':
+            return tuple(_decode(v) for v in value['value'])
+        return dict((k, _decode(v)) for (k, v) in value.items())
+    return value
+
+
+def _encode_blob(value):
+    """Return (blob type, bytes to write) for a blob attribute value."""
+    if isinstance(value, six.binary_type):
+        return ('bytes', value)
+    if isinstance(value, six.text_type):
+        return ('text', value.encode('utf-8'))
+    if hasattr(value, 'as_string') and hasattr(value, 'walk'):
+        # processed user-data and vendor-data are email.Message objects
+        return ('mime', value.as_string().encode('utf-8'))
+    return ('json', json.dumps(_encode(value)).encode('utf-8'))
+
+
+def _decode_blob(btype, contents):
+    if btype == 'bytes':
+        return contents
+    text = contents.decode('utf-8')
+    if btype == 'text':
+        return text
+    if btype == 'mime':
+        return email.message_from_string(text)
+    return _decode(json.loads(text))
+
+
+def _blob_loader(path, btype):
+    def load():
+        return _decode_blob(btype, util.load_file(path, decode=False))
+    return load
+
+
+def store(ds, cache_file, blob_dir):
+    """Write datasource ds to cache_file and blob_dir.
+
+    Return True on success, or False if ds can not be represented in the
+    cache format.
+    """
+    ds.load_lazy_attrs()
+    attrs = {}
+    blob_values = {}
+    try:
+        for (name, value) in ds.__dict__.items():
+            if name in RUNTIME_ATTRS:
+                continue
+            if name in BLOB_ATTRS:
+                if value is not None:
+                    blob_values[name] = _encode_blob(value)
+                continue
+            attrs[name] = _encode(value)
+        iid = ds.get_instance_id()
+    except Exception as e:
+        LOG.debug("Datasource %s can not be cached as json: %s", ds, e)
+        return False
+
+    # Without a header the blobs are not used, so an interrupted store
+    # leaves no cache rather than a header and blobs that do not match.
+    util.del_file(cache_file)
+    util.ensure_dir(blob_dir, mode=0o700)
+    util.delete_dir_contents(blob_dir)
+    blobs = {}
+    for (name, (btype, contents)) in blob_values.items():
+        util.write_file_chunks(os.path.join(blob_dir, name), [contents],
+                               mode=0o600)
+        blobs[name] = btype
+    cls = type(ds)
+    header = {'version': CACHE_VERSION, 'module': cls.__module__,
+              'class': cls.__name__, 'instance_id': iid,
+              'attributes': attrs, 'blobs': blobs}
+    util.write_file_chunks(
+        cache_file, [util.encode_text(json.dumps(header, sort_keys=True))],
+        mode=0o600)
+    return True
+
+
+def read_header(cache_file):
+    """Return the cache document in cache_file or None if not usable."""
+    try:
+        contents = util.load_file(cache_file)
+    except IOError:
+        return None
+    try:
+        header = json.loads(contents)
+    except ValueError as e:
+        LOG.warning("Failed loading instance cache %s: %s", cache_file, e)
+        return None
+    if not isinstance(header, dict):
+        return None
+    if header.get('version') != CACHE_VERSION:
+        LOG.debug("Ignoring instance cache %s with version %s (want %s)",
+                  cache_file, header.get('version'), CACHE_VERSION)
+        return None
+    return header
+
+
+def load(cache_file, blob_dir, sys_cfg, distro, paths, header=None):
+    """Restore the datasource cached in cache_file and blob_dir.
+
+    Like unpickling, the datasource's __init__ is not called.  sys_cfg,
+    distro and paths are those of the caller.  Return None if there is
+    no usable cache, including one whose datasource does not report the
+    instance-id the cache was stored with.
+    """
+    if header is None:
+        header = read_header(cache_file)
+    if header is None:
+        return None
+    try:
+        mod = importer.import_module(header['module'])
+        cls = getattr(mod, header['class'])
+        attrs = _decode(header['attributes'])
+    except Exception as e:
+        LOG.warning("Failed restoring datasource from %s: %s", cache_file, e)
+        return None
+
+    ds = cls.__new__(cls)
+    ds.__dict__.update(attrs)
+    ds.sys_cfg = sys_cfg
+    ds.distro = distro
+    ds.paths = paths
+    ds.ud_proc = ud.UserDataProcessor(paths)
+    lazy = {}
+    for name in BLOB_ATTRS:
+        btype = header['blobs'].get(name)
+        if btype is None:
+            setattr(ds, name, None)
+        else:
+            lazy[name] = _blob_loader(os.path.join(blob_dir, name), btype)
+    ds._lazy_attrs = lazy
+    try:
+        iid = ds.get_instance_id()
+    except Exception as e:
+        LOG.warning("Failed restoring datasource from %s: %s", cache_file, e)
+        return None
+    if iid != header.get('instance_id'):
+        LOG.warning("Ignoring instance cache %s: instance-id %s is not the "
+                    "stored %s", cache_file, iid, header.get('instance_id'))
+        return None
+    return ds
+
+# vi: ts=4 expandtab
@@ -0,0 +1,172 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.sources.instance_cache"""
+
+import json
+import os
+
+from cloudinit import helpers
+from cloudinit import sources
+from cloudinit.sources import instance_cache
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit import user_data as ud
+from cloudinit import util
+
+
+class DataSourceCacheTest(sources.DataSource):
+
+    def __init__(self, sys_cfg, distro, paths):
+        super(DataSourceCacheTest, self).__init__(sys_cfg, distro, paths)
+        self.seed_dirs = ('/seed/a', '/seed/b')
+
+    def get_data(self):
+        self.metadata = {'instance-id': 'iid-cache-test',
+                         'keys': [b'\x00binary', u'text'],
+                         'nested': {'empty': {}}}
+        self.userdata_raw = b'#cloud-config\nruncmd: [ls]\n'
+        self.vendordata_raw = {'cloud-init': '#cloud-config\n{}\n'}
+        return True
+
+
+class DataSourceUnencodable(DataSourceCacheTest):
+
+    def get_data(self):
+        super(DataSourceUnencodable, self).get_data()
+        self.client = object()
+        return True
+
+
+class TestInstanceCache(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestInstanceCache, self).setUp()
+        tmp = self.tmp_dir()
+        self.paths = helpers.Paths({'cloud_dir': tmp})
+        self.cache_file = os.path.join(tmp, 'obj.json')
+        self.blob_dir = os.path.join(tmp, 'obj-blobs')
+
+    def _stored(self, cls=DataSourceCacheTest):
+        ds = cls({}, None, self.paths)
+        ds.get_data()
+        self.assertTrue(
+            instance_cache.store(ds, self.cache_file, self.blob_dir))
+        return ds
+
+    def _load(self, **kwargs):
+        return instance_cache.load(
+            self.cache_file, self.blob_dir, {'sys': 'cfg'}, 'distro',
+            self.paths, **kwargs)
+
+    def test_store_writes_versioned_header(self):
+        """The cache header records version, class and instance-id."""
+        self._stored()
+        header = json.loads(util.load_file(self.cache_file))
+        self.assertEqual(instance_cache.CACHE_VERSION, header['version'])
+        self.assertEqual('DataSourceCacheTest', header['class'])
+        self.assertEqual('iid-cache-test', header['instance_id'])
+        self.assertEqual({'userdata_raw': 'bytes', 'vendordata_raw': 'json'},
+                         header['blobs'])
+        self.assertNotIn('userdata_raw', header['attributes'])
+
+    def test_load_round_trips_attributes(self):
+        """Restored datasource has the stored attributes and types."""
+        orig = self._stored()
+        ds = self._load()
+        self.assertIsInstance(ds, DataSourceCacheTest)
+        self.assertEqual(orig.metadata, ds.metadata)
+        self.assertEqual(('/seed/a', '/seed/b'), ds.seed_dirs)
+        self.assertEqual(orig.ds_cfg, ds.ds_cfg)
+        self.assertEqual(orig.userdata_raw, ds.get_userdata_raw())
+        self.assertEqual(orig.vendordata_raw, ds.get_vendordata_raw())
+
+    def test_load_uses_callers_runtime_objects(self):
+        """sys_cfg, distro and paths come from the caller, not the cache."""
+        self._stored()
+        ds = self._load()
+        self.assertEqual({'sys': 'cfg'}, ds.sys_cfg)
+        self.assertEqual('distro', ds.distro)
+        self.assertIs(self.paths, ds.paths)
+        self.assertIsInstance(ds.ud_proc, ud.UserDataProcessor)
+
+    def test_blobs_are_read_on_first_access(self):
+        """Blob files are not read until their attribute is used."""
+        self._stored()
+        with mock.patch('cloudinit.sources.instance_cache.util.load_file',
+                        wraps=util.load_file) as m_load:
+            ds = self._load()
+            self.assertEqual(1, m_load.call_count)
+            ds.get_userdata_raw()
+            self.assertEqual(2, m_load.call_count)
+            ds.get_userdata_raw()
+            self.assertEqual(2, m_load.call_count)
+
+    def test_processed_userdata_round_trips(self):
+        """Processed user-data is cached and not processed again."""
+        orig = self._stored()
+        processed = orig.get_userdata()
+        self.assertTrue(
+            instance_cache.store(orig, self.cache_file, self.blob_dir))
+        ds = self._load()
+        with mock.patch.object(ds.ud_proc, 'process') as m_process:
+            restored = ds.get_userdata()
+        self.assertEqual([], m_process.call_args_list)
+        self.assertEqual(processed.as_string(), restored.as_string())
+
+    def test_store_restored_datasource_keeps_blobs(self):
+        """Storing a restored datasource again loads its blobs first."""
+        orig = self._stored()
+        self.assertTrue(instance_cache.store(
+            self._load(), self.cache_file, self.blob_dir))
+        self.assertEqual(orig.userdata_raw, self._load().userdata_raw)
+
+    def test_unencodable_datasource_is_not_stored(self):
+        """store returns False for attributes json can not represent."""
+        ds = DataSourceUnencodable({}, None, self.paths)
+        ds.get_data()
+        self.assertFalse(
+            instance_cache.store(ds, self.cache_file, self.blob_dir))
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_other_version_is_ignored(self):
+        """A cache written with a different format version is not used."""
+        self._stored()
+        header = json.loads(util.load_file(self.cache_file))
+        header['version'] = instance_cache.CACHE_VERSION + 1
+        util.write_file(self.cache_file, json.dumps(header))
+        self.assertIsNone(self._load())
+
+    def test_missing_class_is_ignored(self):
+        """A cache naming a class that no longer exists is not used."""
+        self._stored()
+        header = json.loads(util.load_file(self.cache_file))
+        header['class'] = 'DataSourceRemoved'
+        self.assertIsNone(self._load(header=header))
+
+    def test_mismatched_instance_id_is_ignored(self):
+        """A cache whose attributes give another instance-id is not used."""
+        self._stored()
+        header = json.loads(util.load_file(self.cache_file))
+        header['attributes']['metadata']['instance-id'] = 'iid-other'
+        self.assertIsNone(self._load(header=header))
+        self.assertIn('is not the stored iid-cache-test',
+                      self.logs.getvalue())
+
+    def test_store_replaces_files_atomically(self):
+        """The header and blobs are renamed into place."""
+        self._stored()
+        with mock.patch('cloudinit.util.os.rename',
+                        side_effect=OSError('no rename')):
+            with self.assertRaises(OSError):
+                self._stored()
+        # The previous header is gone with the blobs it pointed to.
+        self.assertFalse(os.path.exists(self.cache_file))
+        self.assertIsNone(self._load())
+        self.assertEqual([], os.listdir(self.blob_dir))
+
+    def test_no_cache_file_loads_nothing(self):
+        """load returns None when there is no cache."""
+        self.assertIsNone(self._load())
+
+# vi: ts=4 expandtab
@@ -8,7 +8,10 @@
 
 import os
 import pwd
+import threading
 
+from cloudinit import atomic_helper
+from cloudinit import config_cache
 from cloudinit import log as logging
 from cloudinit import util
 
@@ -17,6 +20,10 @@ LOG = logging.getLogger(__name__)
 # See: man sshd_config
 DEF_SSHD_CFG = "/etc/ssh/sshd_config"
 
+# {username: (authorized keys file, its stat key, AuthorizedKeys)}
+_AUTH_KEYS = {}
+_AUTH_KEYS_LOCK = threading.Lock()
+
 # taken from openssh source openssh-7.3p1/sshkey.c:
 # static const struct keytype keytypes[] = { ... }
 VALID_KEY_TYPES = (
@@ -154,51 +161,84 @@ class AuthKeyLineParser(object):
                            comment=comment, options=options)
 
 
+class AuthorizedKeys(object):
+    """The entries of an authorized_keys file indexed by key.
+
+    Entries keep their order, comments and unparsable lines.  Keys are
+    indexed by (keytype, base64), with every position they appear at, so
+    merging new keys takes linear time.
+    """
+
+    def __init__(self, entries=None, content=None):
+        self.entries = []
+        self.content = content
+        self._index = {}
+        for ent in entries or []:
+            self._append(ent)
+
+    @staticmethod
+    def key(ent):
+        return (ent.keytype, ent.base64)
+
+    def _append(self, ent):
+        if ent.valid():
+            self._index.setdefault(self.key(ent), []).append(
+                len(self.entries))
+        self.entries.append(ent)
+
+    def __contains__(self, ent):
+        return self.key(ent) in self._index
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        # Ensure it ends with a newline
+        return '\n'.join([str(ent) for ent in self.entries] + [''])
+
+    def merge(self, keys):
+        """Replace entries with the same key as one of keys, append others.
+
+        Every entry with the key is replaced, and the last of several keys
+        with the same key wins.  Return True if the rendered file changed.
+        """
+        for k in keys:
+            positions = self._index.get(self.key(k)) if k.valid() else None
+            if not positions:
+                self._append(k)
+            else:
+                for pos in positions:
+                    self.entries[pos] = k
+        return self.changed()
+
+    def changed(self):
+        return self.content != str(self)
+
+
 def parse_authorized_keys(fname):
-    lines = []
+    return load_authorized_keys_file(fname).entries
+
+
+def load_authorized_keys_file(fname):
+    content = None
     try:
         if os.path.isfile(fname):
-            lines = util.load_file(fname).splitlines()
+            content = util.load_file(fname)
     except (IOError, OSError):
         util.logexc(LOG, "Error reading lines from %s", fname)
-        lines = []
 
     parser = AuthKeyLineParser()
-    contents = []
-    for line in lines:
-        contents.append(parser.parse(line))
-    return contents
+    lines = content.splitlines() if content else []
+    return AuthorizedKeys([parser.parse(line) for line in lines], content)
 
 
 def update_authorized_keys(old_entries, keys):
-    to_add = list(keys)
-
-    for i in range(0, len(old_entries)):
-        ent = old_entries[i]
-        if not ent.valid():
-            continue
-        # Replace those with the same base64
-        for k in keys:
-            if not ent.valid():
-                continue
-            if k.base64 == ent.base64:
-                # Replace it with our better one
-                ent = k
-                # Don't add it later
-                if k in to_add:
-                    to_add.remove(k)
-        old_entries[i] = ent
-
-    # Now append any entries we did not match above
-    for key in to_add:
-        old_entries.append(key)
-
-    # Now format them back to strings...
-    lines = [str(b) for b in old_entries]
-
-    # Ensure it ends with a newline
-    lines.append('')
-    return '\n'.join(lines)
+    auth_keys = AuthorizedKeys(old_entries)
+    auth_keys.merge(keys)
+    return str(auth_keys)
 
 
 def users_ssh_info(username):
@@ -208,7 +248,7 @@ def users_ssh_info(username):
     return (os.path.join(pw_ent.pw_dir, '.ssh'), pw_ent)
 
 
-def extract_authorized_keys(username):
+def _authorized_keys_file(username):
     (ssh_dir, pw_ent) = users_ssh_info(username)
     auth_key_fn = None
     with util.SeLinuxGuard(ssh_dir, recursive=True):
@@ -233,7 +273,43 @@ def extract_authorized_keys(username):
             util.logexc(LOG, "Failed extracting 'AuthorizedKeysFile' in ssh "
                         "config from %r, using 'AuthorizedKeysFile' file "
                         "%r instead", DEF_SSHD_CFG, auth_key_fn)
-    return (auth_key_fn, parse_authorized_keys(auth_key_fn))
+    return auth_key_fn
+
+
+def load_authorized_keys(username):
+    """Return (filename, AuthorizedKeys) for username's authorized keys.
+
+    The parse is shared by all callers until the file changes on disk or
+    forget_authorized_keys is called for the user.
+    """
+    with _AUTH_KEYS_LOCK:
+        cached = _AUTH_KEYS.get(username)
+        if cached:
+            (auth_key_fn, key, auth_keys) = cached
+            if key is not None and key == config_cache.stat_key(auth_key_fn):
+                return (auth_key_fn, auth_keys)
+        auth_key_fn = _authorized_keys_file(username)
+        auth_keys = load_authorized_keys_file(auth_key_fn)
+        _AUTH_KEYS[username] = (
+            auth_key_fn, config_cache.stat_key(auth_key_fn), auth_keys)
+        return (auth_key_fn, auth_keys)
+
+
+def forget_authorized_keys(username=None):
+    """Drop the shared parse of username's (or everyone's) authorized keys.
+
+    Call this after something other than setup_user_keys writes them.
+    """
+    with _AUTH_KEYS_LOCK:
+        if username is None:
+            _AUTH_KEYS.clear()
+        else:
+            _AUTH_KEYS.pop(username, None)
+
+
+def extract_authorized_keys(username):
+    (auth_key_fn, auth_keys) = load_authorized_keys(username)
+    return (auth_key_fn, list(auth_keys.entries))
 
 
 def setup_user_keys(keys, username, options=None):
@@ -249,13 +325,33 @@ def setup_user_keys(keys, username, options=None):
     for k in keys:
         key_entries.append(parser.parse(str(k), options=options))
 
-    # Extract the old and make the new
-    (auth_key_fn, auth_key_entries) = extract_authorized_keys(username)
+    # Merge into the old and only rewrite the file if that changed it
+    (auth_key_fn, auth_keys) = load_authorized_keys(username)
     with util.SeLinuxGuard(ssh_dir, recursive=True):
-        content = update_authorized_keys(auth_key_entries, key_entries)
-        util.ensure_dir(os.path.dirname(auth_key_fn), mode=0o700)
-        util.write_file(auth_key_fn, content, mode=0o600)
-        util.chownbyid(auth_key_fn, pwent.pw_uid, pwent.pw_gid)
+        with _AUTH_KEYS_LOCK:
+            changed = auth_keys.merge(key_entries)
+            content = str(auth_keys)
+            try:
+                util.ensure_dir(os.path.dirname(auth_key_fn), mode=0o700)
+                if changed:
+                    # Replace what a symlinked file points to, not the link.
+                    atomic_helper.write_file(os.path.realpath(auth_key_fn),
+                                             content, mode=0o600, omode="w")
+                else:
+                    LOG.debug("Authorized keys %s for %s are unchanged",
+                              auth_key_fn, username)
+                    util.chmod(auth_key_fn, 0o600)
+                util.chownbyid(auth_key_fn, pwent.pw_uid, pwent.pw_gid)
+            except Exception:
+                # The shared parse no longer matches the file.
+                _AUTH_KEYS.pop(username, None)
+                raise
+            if not changed:
+                return
+            auth_keys.content = content
+            _AUTH_KEYS[username] = (auth_key_fn,
+                                    config_cache.stat_key(auth_key_fn),
+                                    auth_keys)
 
 
 class SshdConfigLine(object):
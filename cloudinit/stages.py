@@ -24,14 +24,18 @@ from cloudinit.handlers import upstart_job as up_part
 
 from cloudinit import cloud
 from cloudinit import config
+from cloudinit.config import registry
+from cloudinit import config_cache
 from cloudinit import distros
 from cloudinit import helpers
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import net
+from cloudinit import parallel
 from cloudinit.net import cmdline
 from cloudinit.reporting import events
 from cloudinit import sources
+from cloudinit.sources import instance_cache
 from cloudinit import type_utils
 from cloudinit import util
 
@@ -40,13 +44,25 @@ LOG = logging.getLogger(__name__)
 NULL_DATA_SOURCE = None
 NO_PREVIOUS_INSTANCE_ID = "NO_PREVIOUS_INSTANCE_ID"
 
+# Default modules run concurrently in each section, see module_workers.
+# Sections not listed run their modules one at a time.
+MODULE_WORKERS = {}
+
+# Modules setting up package sources.  Packages queued by the modules of
+# a section are installed once the last of these has run.
+PACKAGE_SOURCE_MODULES = frozenset([
+    'cc_apt_configure', 'cc_rh_subscription', 'cc_spacewalk',
+    'cc_yum_add_repo', 'cc_zypper_add_repo'])
+
 
 class Init(object):
-    def __init__(self, ds_deps=None, reporter=None):
+    def __init__(self, ds_deps=None, reporter=None, base_cfg_cache=None):
         if ds_deps is not None:
             self.ds_deps = ds_deps
         else:
             self.ds_deps = [sources.DEP_FILESYSTEM, sources.DEP_NETWORK]
+        # Where the base config is cached between stages, if anywhere
+        self.base_cfg_cache = base_cfg_cache
         # Created on first use
         self._cfg = None
         self._paths = None
@@ -177,13 +193,21 @@ class Init(object):
         merger = helpers.ConfigMerger(paths=no_cfg_paths,
                                       datasource=self.datasource,
                                       additional_fns=extra_fns,
-                                      base_cfg=fetch_base_config())
+                                      base_cfg=fetch_base_config(
+                                          self.base_cfg_cache))
         return merger.cfg
 
     def _restore_from_cache(self):
         # We try to restore from a current link and static path
         # by using the instance link, if purge_cache was called
         # the file wont exist.
+        ds = instance_cache.load(self.paths.get_ipath_cur('obj_json'),
+                                 self.paths.get_ipath_cur('obj_blobs'),
+                                 self.cfg, self.distro, self.paths)
+        if ds:
+            return ds
+        # Datasources that can not be cached as json, and caches written
+        # by older versions, are pickled.
         return _pkl_load(self.paths.get_ipath_cur('obj_pkl'))
 
     def _write_to_cache(self):
@@ -195,7 +219,21 @@ class Init(object):
             util.write_file(
                 self.paths.get_ipath_cur("manual_clean_marker"),
                 omode="w", content="")
-        return _pkl_store(self.datasource, self.paths.get_ipath_cur("obj_pkl"))
+        obj_json = self.paths.get_ipath_cur("obj_json")
+        pkl_fn = self.paths.get_ipath_cur("obj_pkl")
+        try:
+            stored = instance_cache.store(
+                self.datasource, obj_json,
+                self.paths.get_ipath_cur("obj_blobs"))
+        except Exception:
+            util.logexc(LOG, "Failed writing instance cache %s", obj_json)
+            stored = False
+        if stored:
+            # Migrated, drop any pickle written by older versions.
+            util.del_file(pkl_fn)
+            return True
+        util.del_file(obj_json)
+        return _pkl_store(self.datasource, pkl_fn)
 
     def _get_datasources(self):
         # Any config provided???
@@ -236,6 +274,10 @@ class Init(object):
         if self.datasource is not NULL_DATA_SOURCE:
             return self.datasource
 
+        # DMI and container facts collected by earlier stages of this boot.
+        facts_fn = self.paths.get_runpath('platform_facts')
+        util.load_platform_facts(facts_fn)
+
         with events.ReportEventStack(
                 name="check-cache",
                 description="attempting to read from cache [%s]" % existing,
@@ -258,6 +300,7 @@ class Init(object):
                                                cfg_list,
                                                pkg_list, self.reporter)
             LOG.info("Loaded datasource %s - %s", dsname, ds)
+            util.save_platform_facts(facts_fn)
         self.datasource = ds
         # Ensure we adjust our path members datasource
         # now that we have one (thus allowing ipath to be used)
@@ -669,6 +712,7 @@ class Modules(object):
         self.cfg_files = cfg_files
         # Created on first use
         self._cached_cfg = None
+        self._module_index = None
         if reporter is None:
             reporter = events.ReportEventStack(
                 name="module-reporter", description="module-desc",
@@ -688,6 +732,18 @@ class Modules(object):
         # Only give out a copy so that others can't modify this...
         return copy.deepcopy(self._cached_cfg)
 
+    @property
+    def module_index(self):
+        """The index of cloudinit.config modules, see config.registry."""
+        if self._module_index is None:
+            try:
+                self._module_index = registry.load_index(
+                    self.init.paths.get_runpath('module_index'))
+            except Exception:
+                util.logexc(LOG, "Failed loading the config module index")
+                self._module_index = {}
+        return self._module_index
+
     def _read_modules(self, name):
         module_list = []
         if name not in self.cfg:
@@ -747,49 +803,99 @@ class Modules(object):
                              " has an unknown frequency %s"), raw_name, freq)
                 # Reset it so when ran it will get set to a known value
                 freq = None
-            mod_locs, looked_locs = importer.find_module(
-                mod_name, ['', type_utils.obj_name(config)], ['handle'])
-            if not mod_locs:
-                LOG.warning("Could not find module named %s (searched %s)",
-                            mod_name, looked_locs)
-                continue
-            mod = config.fixup_module(importer.import_module(mod_locs[0]))
+            # Modules in the index are only imported once they run
+            mod = registry.lookup(self.module_index, mod_name)
+            if mod is None:
+                mod_locs, looked_locs = importer.find_module(
+                    mod_name, ['', type_utils.obj_name(config)], ['handle'])
+                if not mod_locs:
+                    LOG.warning("Could not find module named %s "
+                                "(searched %s)", mod_name, looked_locs)
+                    continue
+                mod = config.fixup_module(
+                    importer.import_module(mod_locs[0]))
             mostly_mods.append([mod, raw_name, freq, run_args])
         return mostly_mods
 
-    def _run_modules(self, mostly_mods):
+    def _run_modules(self, mostly_mods, max_workers=1):
         cc = self.init.cloudify()
+        barrier = self._package_barrier(mostly_mods)
+        self._queue_packages(cc, mostly_mods[barrier:])
+        try:
+            (which_ran, failures) = self._run_module_list(
+                cc, mostly_mods[:barrier], max_workers)
+            self._install_queued_packages(cc)
+            (more_ran, more_failures) = self._run_module_list(
+                cc, mostly_mods[barrier:], max_workers)
+            return (which_ran + more_ran, failures + more_failures)
+        finally:
+            cc.distro.discard_queued_packages()
+
+    def _run_module_list(self, cc, mostly_mods, max_workers):
+        if max_workers > 1 and len(mostly_mods) > 1:
+            return self._run_modules_concurrently(cc, mostly_mods,
+                                                  max_workers)
+        return self._run_modules_serially(cc, mostly_mods)
+
+    @staticmethod
+    def _package_barrier(mostly_mods):
+        """Return the index of the first module after those setting up
+        package sources, 0 if there are none."""
+        barrier = 0
+        for (index, (_mod, name, _freq, _args)) in enumerate(mostly_mods):
+            if config.form_module_name(name) in PACKAGE_SOURCE_MODULES:
+                barrier = index + 1
+        return barrier
+
+    def _install_queued_packages(self, cc):
+        """Install the queued packages with a single package command.
+
+        If that fails, each module still installs its own packages.
+        """
+        try:
+            cc.distro.install_queued_packages()
+        except Exception:
+            util.logexc(LOG, "Installing queued packages failed")
+
+    def _queue_packages(self, cc, mostly_mods):
+        """Let the modules about to run queue packages they will install.
+
+        Modules may define queue_packages, taking the same arguments as
+        handle, to queue packages with distro.queue_packages.  They are
+        installed at once after the modules setting up package sources
+        (see PACKAGE_SOURCE_MODULES), before mostly_mods run.
+        """
+        for (mod, name, freq, args) in mostly_mods:
+            try:
+                freq = self._module_frequency(mod, freq)
+                if cc.has_run("config-%s" % (name), freq):
+                    continue
+                queue_packages = getattr(mod, 'queue_packages', None)
+                if queue_packages:
+                    queue_packages(name, self.cfg, cc, config.LOG, args)
+            except Exception:
+                util.logexc(LOG, "Queueing packages of module %s (%s)"
+                            " failed", name, mod)
+
+    def _run_modules_serially(self, cc, mostly_mods):
         # Return which ones ran
         # and which ones failed + the exception of why it failed
         failures = []
         which_ran = []
         for (mod, name, freq, args) in mostly_mods:
             try:
-                # Try the modules frequency, otherwise fallback to a known one
-                if not freq:
-                    freq = mod.frequency
-                if freq not in FREQUENCIES:
-                    freq = PER_INSTANCE
-                LOG.debug("Running module %s (%s) with frequency %s",
-                          name, mod, freq)
-
-                # Use the configs logger and not our own
-                # TODO(harlowja): possibly check the module
-                # for having a LOG attr and just give it back
-                # its own logger?
-                func_args = [name, self.cfg,
-                             cc, config.LOG, args]
+                (run_name, freq, func_args) = self._prepare_module(
+                    cc, mod, name, freq, args)
                 # Mark it as having started running
                 which_ran.append(name)
-                # This name will affect the semaphore name created
-                run_name = "config-%s" % (name)
 
                 desc = "running %s with frequency %s" % (run_name, freq)
                 myrep = events.ReportEventStack(
                     name=run_name, description=desc, parent=self.reporter)
 
                 with myrep:
-                    ran, _r = cc.run(run_name, mod.handle, func_args,
+                    ran, _r = cc.run(run_name, mod.handle,
+                                     self._module_args(func_args, myrep),
                                      freq=freq)
                     if ran:
                         myrep.message = "%s ran successfully" % run_name
@@ -801,6 +907,97 @@ class Modules(object):
                 failures.append((name, e))
         return (which_ran, failures)
 
+    @staticmethod
+    def _module_frequency(mod, freq):
+        # Try the modules frequency, otherwise fallback to a known one
+        if not freq:
+            freq = mod.frequency
+        if freq not in FREQUENCIES:
+            freq = PER_INSTANCE
+        return freq
+
+    def _prepare_module(self, cc, mod, name, freq, args):
+        freq = self._module_frequency(mod, freq)
+        LOG.debug("Running module %s (%s) with frequency %s",
+                  name, mod, freq)
+
+        # Use the configs logger and not our own
+        # TODO(harlowja): possibly check the module
+        # for having a LOG attr and just give it back
+        # its own logger?
+        func_args = [name, self.cfg,
+                     cc, config.LOG, args]
+        # This name will affect the semaphore name created
+        run_name = "config-%s" % (name)
+        return (run_name, freq, func_args)
+
+    @staticmethod
+    def _module_args(func_args, myrep):
+        """Return func_args with a cloud reporting under the event myrep.
+
+        Events a module reports through cloud.reporter are then children
+        of the module's own event.
+        """
+        (name, cfg, cc, log, args) = func_args
+        mod_cc = copy.copy(cc)
+        mod_cc.reporter = myrep
+        return [name, cfg, mod_cc, log, args]
+
+    def _run_modules_concurrently(self, cc, mostly_mods, max_workers):
+        """Run modules on a pool, modules that conflict in list order.
+
+        A module starts once every earlier module it conflicts with (see
+        config.modules_conflict) has finished.  Reporting events are
+        published from the worker running the module, as it starts and
+        finishes.  Results are collected in list order, as when the
+        modules run one after another.
+        """
+        failures = []
+        which_ran = []
+        runs = []
+        for (mod, name, freq, args) in mostly_mods:
+            try:
+                runs.append((mod, name) + self._prepare_module(
+                    cc, mod, name, freq, args))
+            except Exception as e:
+                util.logexc(LOG, "Running module %s (%s) failed", name, mod)
+                failures.append((name, e))
+        depends = [
+            [before for before in range(index)
+             if config.modules_conflict(runs[before][0], run[0])]
+            for (index, run) in enumerate(runs)]
+
+        def run_module(run):
+            (mod, name, run_name, freq, func_args) = run
+            desc = "running %s with frequency %s" % (run_name, freq)
+            with events.ReportEventStack(
+                    name=run_name, description=desc,
+                    parent=self.reporter) as myrep:
+                try:
+                    ran, _r = cc.run(run_name, mod.handle,
+                                     self._module_args(func_args, myrep),
+                                     freq=freq)
+                except Exception as e:
+                    util.logexc(LOG, "Running module %s (%s) failed",
+                                name, mod)
+                    myrep.result = events.status.FAIL
+                    return e
+                if ran:
+                    myrep.message = "%s ran successfully" % run_name
+                else:
+                    myrep.message = "%s previously ran" % run_name
+            return None
+
+        outcomes = [None] * len(runs)
+        for (index, exc, _exc) in parallel.iter_dependent(
+                run_module, runs, depends, max_workers):
+            outcomes[index] = exc or _exc
+        for (run, exc) in zip(runs, outcomes):
+            which_ran.append(run[1])
+            if exc is not None:
+                failures.append((run[1], exc))
+        return (which_ran, failures)
+
     def run_single(self, mod_name, args=None, freq=None):
         # Form the users module 'specs'
         mod_to_be = {
@@ -849,14 +1046,20 @@ class Modules(object):
         if forced:
             LOG.info("running unverified_modules: '%s'", ', '.join(forced))
 
-        return self._run_modules(active_mods)
+        workers = util.safe_int(util.get_cfg_by_path(
+            self.cfg, ('module_workers', section_name),
+            MODULE_WORKERS.get(section_name, 1)))
+        return self._run_modules(active_mods, workers or 1)
 
 
 def read_runtime_config():
     return util.read_conf(RUN_CLOUD_CONFIG)
 
 
-def fetch_base_config():
+def fetch_base_config(cache_file=None):
+    if cache_file:
+        cache = config_cache.ConfigCache(cache_file)
+        return cache.fetch_base_config(CLOUD_CONFIG, RUN_CLOUD_CONFIG)
     return util.mergemanydict(
         [
             # builtin config
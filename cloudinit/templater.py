@@ -13,19 +13,6 @@
 import collections
 import re
 
-try:
-    from Cheetah.Template import Template as CTemplate
-    CHEETAH_AVAILABLE = True
-except (ImportError, AttributeError):
-    CHEETAH_AVAILABLE = False
-
-try:
-    import jinja2
-    from jinja2 import Template as JTemplate
-    JINJA_AVAILABLE = True
-except (ImportError, AttributeError):
-    JINJA_AVAILABLE = False
-
 from cloudinit import log as logging
 from cloudinit import type_utils as tu
 from cloudinit import util
@@ -34,6 +21,30 @@ LOG = logging.getLogger(__name__)
 TYPE_MATCHER = re.compile(r"##\s*template:(.*)", re.I)
 BASIC_MATCHER = re.compile(r'\$\{([A-Za-z0-9_.]+)\}|\$([A-Za-z0-9_.]+)')
 
+# Template engines are imported when a template first needs one; None
+# marks an engine that is not installed.
+_ENGINES = {}
+
+
+def _import_cheetah():
+    from Cheetah.Template import Template as CTemplate
+    return CTemplate
+
+
+def _import_jinja():
+    import jinja2
+    return jinja2
+
+
+def _engine(name):
+    if name not in _ENGINES:
+        importers = {'cheetah': _import_cheetah, 'jinja': _import_jinja}
+        try:
+            _ENGINES[name] = importers[name]()
+        except (ImportError, AttributeError):
+            _ENGINES[name] = None
+    return _ENGINES[name]
+
 
 def basic_render(content, params):
     """This does simple replacement of bash variable like templates.
@@ -76,14 +87,15 @@ def basic_render(content, params):
 def detect_template(text):
 
     def cheetah_render(content, params):
-        return CTemplate(content, searchList=[params]).respond()
+        return _engine('cheetah')(content, searchList=[params]).respond()
 
     def jinja_render(content, params):
         # keep_trailing_newline is in jinja2 2.7+, not 2.6
         add = "\n" if content.endswith("\n") else ""
-        return JTemplate(content,
-                         undefined=jinja2.StrictUndefined,
-                         trim_blocks=True).render(**params) + add
+        jinja2 = _engine('jinja')
+        return jinja2.Template(content,
+                               undefined=jinja2.StrictUndefined,
+                               trim_blocks=True).render(**params) + add
 
     if text.find("\n") != -1:
         ident, rest = text.split("\n", 1)
@@ -92,7 +104,7 @@ def detect_template(text):
         rest = ''
     type_match = TYPE_MATCHER.match(ident)
     if not type_match:
-        if CHEETAH_AVAILABLE:
+        if _engine('cheetah'):
             LOG.debug("Using Cheetah as the renderer for unknown template.")
             return ('cheetah', cheetah_render, text)
         else:
@@ -102,17 +114,17 @@ def detect_template(text):
         if template_type not in ('jinja', 'cheetah', 'basic'):
             raise ValueError("Unknown template rendering type '%s' requested"
                              % template_type)
-        if template_type == 'jinja' and not JINJA_AVAILABLE:
+        if template_type == 'jinja' and not _engine('jinja'):
             LOG.warning("Jinja not available as the selected renderer for"
                         " desired template, reverting to the basic renderer.")
             return ('basic', basic_render, rest)
-        elif template_type == 'jinja' and JINJA_AVAILABLE:
+        elif template_type == 'jinja':
             return ('jinja', jinja_render, rest)
-        if template_type == 'cheetah' and not CHEETAH_AVAILABLE:
+        if template_type == 'cheetah' and not _engine('cheetah'):
             LOG.warning("Cheetah not available as the selected renderer for"
                         " desired template, reverting to the basic renderer.")
             return ('basic', basic_render, rest)
-        elif template_type == 'cheetah' and CHEETAH_AVAILABLE:
+        elif template_type == 'cheetah':
             return ('cheetah', cheetah_render, rest)
         # Only thing left over is the basic renderer (it is always available).
         return ('basic', basic_render, rest)
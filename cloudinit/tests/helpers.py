@@ -21,6 +21,8 @@ except ImportError:
     from contextlib2 import ExitStack
 
 from cloudinit import helpers as ch
+from cloudinit import safeyaml
+from cloudinit import ssh_util
 from cloudinit import util
 
 # Used for skipping tests
@@ -99,6 +101,11 @@ class TestCase(unittest2.TestCase):
         util.PROC_CMDLINE = None
         util._DNS_REDIRECT_IP = None
         util._LSB_RELEASE = {}
+        util._PLATFORM_FACTS = {}
+        util._BLKID_INDEX = None
+        safeyaml.clear_cache()
+        ch._FILE_SEMAPHORES.clear()
+        ssh_util.forget_authorized_keys()
 
     def setUp(self):
         super(TestCase, self).setUp()
@@ -224,7 +231,9 @@ class FilesystemMockingTestCase(ResourceUsingTestCase):
     def patchUtils(self, new_root):
         patch_funcs = {
             util: [('write_file', 1),
+                   ('write_file_chunks', 1),
                    ('append_file', 1),
+                   ('append_locked', 1),
                    ('load_file', 1),
                    ('ensure_dir', 1),
                    ('chmod', 1),
@@ -0,0 +1,105 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.config_cache."""
+
+import os
+
+from cloudinit import config_cache
+from cloudinit import stages
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit import util
+
+
+class TestConfigCache(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestConfigCache, self).setUp()
+        tmpd = self.tmp_dir()
+        self.cloud_cfg = os.path.join(tmpd, 'cloud.cfg')
+        self.confd = os.path.join(tmpd, 'cloud.cfg.d')
+        self.runtime_cfg = os.path.join(tmpd, 'runtime.cfg')
+        self.cache_file = os.path.join(tmpd, 'base-config.json')
+        util.write_file(self.cloud_cfg, 'key1: base\nkey2: base\n')
+        util.write_file(os.path.join(self.confd, '10_a.cfg'), 'key2: a\n')
+        util.write_file(os.path.join(self.confd, '20_b.cfg'),
+                        'key3: b\nlist: [1]\n')
+        util.write_file(self.runtime_cfg, 'key4: runtime\n')
+        for (name, value) in (('CLOUD_CONFIG', self.cloud_cfg),
+                              ('RUN_CLOUD_CONFIG', self.runtime_cfg)):
+            patcher = mock.patch.object(stages, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cmdline = ''
+        patcher = mock.patch('cloudinit.util.get_cmdline',
+                             side_effect=lambda: self.cmdline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self):
+        cache = config_cache.ConfigCache(self.cache_file)
+        cfg = cache.fetch_base_config(self.cloud_cfg, self.runtime_cfg)
+        return (cfg, cache.parsed)
+
+    def test_matches_uncached_config(self):
+        """The cached and merged results equal fetch_base_config's."""
+        expected = stages.fetch_base_config()
+        self.assertEqual('a', expected['key2'])
+        self.assertEqual(expected, self.fetch()[0])
+        self.assertEqual(expected, self.fetch()[0])
+        self.assertEqual(expected,
+                         stages.fetch_base_config(cache_file=self.cache_file))
+
+    def test_unchanged_inputs_are_not_parsed(self):
+        """Later fetches load the merged config without parsing."""
+        (cfg, parsed) = self.fetch()
+        self.assertEqual(4, parsed)
+        with mock.patch('cloudinit.util.read_conf') as m_read_conf:
+            self.assertEqual((cfg, 0), self.fetch())
+        self.assertEqual(0, m_read_conf.call_count)
+        self.assertIn('Using cached base config', self.logs.getvalue())
+
+    def test_only_changed_fragments_are_parsed(self):
+        """A changed conf.d fragment is the only file parsed again."""
+        self.fetch()
+        util.write_file(os.path.join(self.confd, '20_b.cfg'),
+                        'key3: changed\n')
+        (cfg, parsed) = self.fetch()
+        self.assertEqual(1, parsed)
+        self.assertEqual('changed', cfg['key3'])
+        self.assertEqual(stages.fetch_base_config(), cfg)
+
+    def test_new_and_removed_fragments(self):
+        """Fragments added to or removed from conf.d are noticed."""
+        self.fetch()
+        util.write_file(os.path.join(self.confd, '30_c.cfg'), 'key5: c\n')
+        os.unlink(os.path.join(self.confd, '10_a.cfg'))
+        (cfg, parsed) = self.fetch()
+        self.assertEqual(1, parsed)
+        self.assertEqual('c', cfg['key5'])
+        self.assertEqual('base', cfg['key2'])
+
+    def test_cmdline_change_merges_without_parsing_files(self):
+        """A new kernel command line is merged again."""
+        self.fetch()
+        self.cmdline = 'cc: key1: cmdline end_cc'
+        (cfg, parsed) = self.fetch()
+        self.assertEqual(0, parsed)
+        self.assertEqual('cmdline', cfg['key1'])
+
+    def test_unrepresentable_config_is_not_cached(self):
+        """Config json can not represent exactly is parsed every time."""
+        util.write_file(self.runtime_cfg, '1: integer key\n')
+        (cfg, _parsed) = self.fetch()
+        self.assertEqual('integer key', cfg[1])
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_corrupt_cache_is_ignored(self):
+        """An unreadable cache file is replaced."""
+        util.write_file(self.cache_file, '{not json')
+        (cfg, parsed) = self.fetch()
+        self.assertEqual(4, parsed)
+        self.assertEqual((cfg, 0), self.fetch())
+
+# vi: ts=4 expandtab
@@ -0,0 +1,456 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.fsimage, using images built here and, where
+genisoimage, mkfs.vfat and mcopy are installed, images built by them."""
+
+import os
+import struct
+
+from cloudinit import fsimage
+from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+from cloudinit import util
+
+SEED = {
+    'meta-data': b'instance-id: iid-1\n',
+    'user-data': b'#cloud-config\n' + b'x' * 5000 + b'\n',
+    'openstack/latest/meta_data.json': b'{"uuid": "1"}',
+    'openstack/latest/empty': b'',
+}
+
+
+def _tree(files):
+    """Return nested dicts for paths in files; leaves are contents."""
+    root = {}
+    for path, content in files.items():
+        node = root
+        parts = path.split('/')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = content
+    return root
+
+
+def _both(fmt, value):
+    return struct.pack('<' + fmt, value) + struct.pack('>' + fmt, value)
+
+
+def _iso_record(name, lba, size, is_dir, system_use=b''):
+    pad = b'\x00' if len(name) % 2 == 0 else b''
+    length = 33 + len(name) + len(pad) + len(system_use)
+    tail = b'\x00' if length % 2 else b''
+    return (struct.pack('<BB', length + len(tail), 0) + _both('I', lba) +
+            _both('I', size) + b'\x00' * 7 +
+            struct.pack('<BBB', 2 if is_dir else 0, 0, 0) + _both('H', 1) +
+            struct.pack('<B', len(name)) + name + pad + system_use + tail)
+
+
+def _rr_name(name):
+    raw = name.encode('utf-8')
+    return b'NM' + struct.pack('<BBB', 5 + len(raw), 1, 0) + raw
+
+
+def _rr_symlink(target):
+    raw = target.encode('utf-8')
+    return (b'SL' + struct.pack('<BBBBB', 7 + len(raw), 1, 0, 0, len(raw)) +
+            raw)
+
+
+def make_iso(files, names='rock_ridge', links=None):
+    """Return an iso9660 image holding files.
+
+    names is one of 'plain', 'rock_ridge' or 'joliet'.  links maps paths
+    of files to the targets of Rock Ridge symbolic links.
+    """
+    links = links or {}
+    tree = _tree(files)
+    sectors = {}
+    next_lba = [20]
+
+    def alloc(count):
+        lba = next_lba[0]
+        next_lba[0] += max(count, 1)
+        return lba
+
+    file_lba = {}
+    for path, content in sorted(files.items()):
+        file_lba[path] = alloc((len(content) + 2047) // 2048)
+        sectors[file_lba[path]] = content
+
+    def encode(name, joliet):
+        if joliet:
+            return (name + ';1').encode('utf-16-be')
+        return (name.upper() + ';1').encode('ascii')
+
+    def build_dir(node, prefix, parent_lba, joliet, rock_ridge):
+        lba = alloc(1)
+        children = []
+        for name, child in sorted(node.items()):
+            path = prefix + name
+            su = b''
+            if rock_ridge:
+                su = _rr_name(name)
+                if path in links:
+                    su += _rr_symlink(links[path])
+            if isinstance(child, dict):
+                child_lba = build_dir(child, path + '/', lba, joliet,
+                                      rock_ridge)
+                children.append(_iso_record(encode(name, joliet)[:-4]
+                                            if not joliet else
+                                            name.encode('utf-16-be'),
+                                            child_lba, 2048, True, su))
+            else:
+                children.append(_iso_record(
+                    encode(name, joliet), file_lba[path],
+                    len(child), False, su))
+        self_su = b''
+        if rock_ridge and not prefix:
+            self_su = b'SP' + struct.pack('<BB', 7, 1) + b'\xbe\xef\x00'
+        data = (_iso_record(b'\x00', lba, 2048, True, self_su) +
+                _iso_record(b'\x01', parent_lba or lba, 2048, True) +
+                b''.join(children))
+        assert len(data) <= 2048
+        sectors[lba] = data
+        return lba
+
+    def descriptor(dtype, root_lba, escape=b''):
+        desc = bytearray(2048)
+        desc[0] = dtype
+        desc[1:6] = b'CD001'
+        desc[6] = 1
+        desc[88:88 + len(escape)] = escape
+        if root_lba is not None:
+            desc[156:190] = _iso_record(b'\x00', root_lba, 2048, True)
+        return bytes(desc)
+
+    primary_root = build_dir(tree, '', None, False, names == 'rock_ridge')
+    sectors[16] = descriptor(1, primary_root)
+    if names == 'joliet':
+        sectors[17] = descriptor(2, build_dir(tree, '', None, True, False),
+                                 b'%/E')
+    else:
+        sectors[17] = descriptor(2, primary_root)
+    sectors[18] = descriptor(255, None)
+
+    image = bytearray(next_lba[0] * 2048)
+    for lba, data in sectors.items():
+        image[lba * 2048:lba * 2048 + len(data)] = data
+    return bytes(image)
+
+
+def _short_name(index, name):
+    base, _, ext = name.upper().partition('.')
+    if name == name.upper() and len(base) <= 8 and len(ext) <= 3:
+        return (base.ljust(8) + ext.ljust(3)).encode('ascii'), False
+    base = ''.join(c for c in base if c.isalnum())[:6]
+    return (('%s~%d' % (base, index)).ljust(8) +
+            ext[:3].ljust(3)).encode('ascii'), True
+
+
+def _lfn_entries(name, short):
+    checksum = 0
+    for char in bytearray(short):
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + char) & 0xff
+    chars = name.encode('utf-16-le') + b'\x00\x00'
+    while len(chars) % 26:
+        chars += b'\xff\xff'
+    count = len(chars) // 26
+    entries = []
+    for seq in range(1, count + 1):
+        part = chars[(seq - 1) * 26:seq * 26]
+        order = seq | (0x40 if seq == count else 0)
+        entries.append(struct.pack('<B', order) + part[0:10] +
+                       struct.pack('<BBB', 0x0f, 0, checksum) + part[10:22] +
+                       b'\x00\x00' + part[22:26])
+    return list(reversed(entries))
+
+
+def make_fat(files, bits=12):
+    """Return a FAT image of the given bits holding files."""
+    sector = 512
+    if bits == 12:
+        total, root_entries, fat_sectors = 2880, 224, 9
+    elif bits == 16:
+        total, root_entries, fat_sectors = 20000, 512, 80
+    else:
+        total, root_entries, fat_sectors = 70000, 0, 560
+    reserved = 32 if bits == 32 else 1
+    root_sectors = root_entries * 32 // sector
+    data_start = reserved + 2 * fat_sectors + root_sectors
+    fat = {0: 0xff8, 1: 0xfff}
+    clusters = {}
+    next_cluster = [2]
+    eoc = {12: 0xfff, 16: 0xffff, 32: 0x0fffffff}[bits]
+
+    def alloc(data):
+        count = max((len(data) + sector - 1) // sector, 1)
+        first = next_cluster[0]
+        for i in range(count):
+            cluster = first + i
+            fat[cluster] = cluster + 1 if i < count - 1 else eoc
+            clusters[cluster] = data[i * sector:(i + 1) * sector]
+        next_cluster[0] += count
+        return first
+
+    def dir_entries(node):
+        entries = []
+        for index, (name, child) in enumerate(sorted(node.items()), 1):
+            short, needs_lfn = _short_name(index, name)
+            if needs_lfn:
+                entries.extend(_lfn_entries(name, short))
+            if isinstance(child, dict):
+                data = b''.join(
+                    [b'.'.ljust(11) + b'\x10' + b'\x00' * 20,
+                     b'..'.ljust(11) + b'\x10' + b'\x00' * 20] +
+                    dir_entries(child))
+                first, attr, size = alloc(data), 0x10, 0
+            else:
+                first = alloc(child) if child else 0
+                attr, size = 0x20, len(child)
+            entries.append(short + struct.pack(
+                '<BBBHHHHHHHI', attr, 0, 0, 0, 0, 0, first >> 16, 0, 0,
+                first & 0xffff, size))
+        return entries
+
+    label = b'CIDATA     ' + b'\x08' + b'\x00' * 20
+    root = [label] + dir_entries(_tree(files))
+    if bits == 32:
+        root_cluster = alloc(b''.join(root))
+    image = bytearray(total * sector)
+    boot = bytearray(sector)
+    struct.pack_into('<HBHBHHBH', boot, 11, sector, 1, reserved, 2,
+                     root_entries, 0 if total > 0xffff else total, 0xf8,
+                     0 if bits == 32 else fat_sectors)
+    struct.pack_into('<I', boot, 32, total if total > 0xffff else 0)
+    if bits == 32:
+        struct.pack_into('<II', boot, 36, fat_sectors, 0)
+        struct.pack_into('<I', boot, 44, root_cluster)
+        boot[82:90] = b'FAT32   '
+    else:
+        boot[54:62] = ('FAT%d   ' % bits).encode('ascii')
+    boot[510:512] = b'\x55\xaa'
+    image[0:sector] = boot
+    fat_bytes = bytearray(fat_sectors * sector)
+    for cluster, value in fat.items():
+        if bits == 12:
+            off = cluster + cluster // 2
+            if cluster & 1:
+                fat_bytes[off] = ((fat_bytes[off] & 0x0f) |
+                                  ((value << 4) & 0xf0))
+                fat_bytes[off + 1] = (value >> 4) & 0xff
+            else:
+                fat_bytes[off] = value & 0xff
+                fat_bytes[off + 1] = ((fat_bytes[off + 1] & 0xf0) |
+                                      ((value >> 8) & 0x0f))
+        elif bits == 16:
+            struct.pack_into('<H', fat_bytes, cluster * 2, value)
+        else:
+            struct.pack_into('<I', fat_bytes, cluster * 4, value)
+    for copy in range(2):
+        start = (reserved + copy * fat_sectors) * sector
+        image[start:start + len(fat_bytes)] = fat_bytes
+    if bits != 32:
+        root_data = b''.join(root)
+        start = (reserved + 2 * fat_sectors) * sector
+        image[start:start + len(root_data)] = root_data
+    for cluster, data in clusters.items():
+        start = (data_start + cluster - 2) * sector
+        image[start:start + len(data)] = data
+    return bytes(image)
+
+
+def _extracted(target):
+    """Return a dict of relative paths to contents of files in target."""
+    found = {}
+    for root, _dirs, names in os.walk(target):
+        for name in names:
+            path = os.path.join(root, name)
+            found[os.path.relpath(path, target)] = util.load_file(
+                path, decode=False)
+    return found
+
+
+class TestExtract(CiTestCase):
+
+    def extract(self, image, files=None, **kwargs):
+        device = self.tmp_path('device')
+        util.write_file(device, image, omode='wb')
+        target = self.tmp_dir()
+        fstype = fsimage.extract(device, target, **kwargs)
+        self.assertEqual(SEED if files is None else files,
+                         _extracted(target))
+        return fstype
+
+    def test_iso9660_with_rock_ridge_names(self):
+        """Rock Ridge names are used when present."""
+        self.assertEqual('iso9660', self.extract(make_iso(SEED)))
+
+    def test_iso9660_with_joliet_names(self):
+        """Joliet names are used without Rock Ridge."""
+        self.assertEqual('iso9660',
+                         self.extract(make_iso(SEED, names='joliet')))
+
+    def test_iso9660_plain_names_are_lower_cased(self):
+        """Plain iso9660 names are lower cased without the version."""
+        files = {'meta-data': b'a', 'user-data': b'b'}
+        self.extract(make_iso(files, names='plain'), files)
+
+    def test_fat12_with_long_names(self):
+        """FAT12 long file names and directories are read."""
+        self.assertEqual('vfat', self.extract(make_fat(SEED)))
+
+    def test_fat16_and_fat32(self):
+        """FAT16 and FAT32 images are read."""
+        self.extract(make_fat(SEED, bits=16))
+        self.extract(make_fat(SEED, bits=32))
+
+    def test_fat_short_names_are_lower_cased(self):
+        """Names without a long name are lower cased."""
+        files = {'EC2/META.JSN': b'{}'}
+        self.extract(make_fat(files), {'ec2/meta.jsn': b'{}'})
+
+    def test_fstypes_limit_accepted_filesystems(self):
+        """Images of other filesystem types are not read."""
+        with self.assertRaises(fsimage.ImageError):
+            self.extract(make_fat(SEED), fstypes=['cd9660'])
+        self.extract(make_iso(SEED), fstypes=['cd9660'])
+
+    def test_unknown_filesystem_raises_image_error(self):
+        """Images that are neither iso9660 nor FAT raise ImageError."""
+        with self.assertRaises(fsimage.ImageError):
+            self.extract(b'\x00' * 100000)
+
+    def test_too_much_data_raises_image_error(self):
+        """Images holding more than max_bytes are not extracted."""
+        with self.assertRaises(fsimage.ImageError):
+            self.extract(make_iso(SEED), max_bytes=1000)
+
+    def test_paths_limit_extracted_files(self):
+        """Only the given files and directories are copied."""
+        paths = ['meta-data', 'openstack', 'vendor-data']
+        files = dict((k, v) for k, v in SEED.items() if k != 'user-data')
+        self.extract(make_iso(SEED), files, paths=paths)
+        self.extract(make_fat(SEED), files, paths=paths)
+        self.extract(make_iso(SEED), {'meta-data': SEED['meta-data']},
+                     paths=['meta-data', 'openstack/latest/missing'])
+
+    def test_paths_not_read_do_not_count_to_max_bytes(self):
+        """Files that are not copied do not count to max_bytes."""
+        self.extract(make_iso(SEED), {'meta-data': SEED['meta-data']},
+                     max_bytes=1000, paths=['meta-data'])
+
+    def test_wanted_symlinks_raise_image_error(self):
+        """Rock Ridge symbolic links are not followed."""
+        image = make_iso(SEED, links={'user-data': 'meta-data'})
+        self.extract(image, {'meta-data': SEED['meta-data']},
+                     paths=['meta-data'])
+        with self.assertRaises(fsimage.ImageError):
+            self.extract(image, paths=['meta-data', 'user-data'])
+
+    def test_corrupt_cluster_chain_raises_image_error(self):
+        """A FAT chain pointing outside the image raises ImageError."""
+        image = bytearray(make_fat({'user-data': b'x' * 2000}))
+        # FAT12 entry for cluster 2 is in the first FAT at offset 512 + 3
+        image[515] = 0xf0
+        image[516] = (image[516] & 0xf0) | 0x0e
+        with self.assertRaises(fsimage.ImageError):
+            self.extract(bytes(image))
+
+
+class TestToolImages(CiTestCase):
+    """Read images built by the tools users build seeds with."""
+
+    def seed_dir(self):
+        src = self.tmp_dir()
+        for path, content in SEED.items():
+            util.write_file(os.path.join(src, path), content, omode='wb')
+        return src
+
+    def assert_extracts(self, device, fstype):
+        target = self.tmp_dir()
+        self.assertEqual(fstype,
+                         fsimage.extract(device, target, paths=list(SEED)))
+        self.assertEqual(SEED, _extracted(target))
+
+    def genisoimage(self, src, *args):
+        device = self.tmp_path('cidata.iso')
+        util.subp(['genisoimage', '-quiet', '-output', device,
+                   '-volid', 'cidata'] + list(args) + [src])
+        return device
+
+    def mkfs_vfat(self, src, name, blocks, *args):
+        device = self.tmp_path(name)
+        util.subp(['mkfs.vfat', '-C', '-n', 'cidata'] + list(args) +
+                  [device, blocks])
+        util.subp(['mcopy', '-s', '-i', device] +
+                  [os.path.join(src, name) for name in os.listdir(src)] +
+                  ['::'], update_env={'MTOOLS_SKIP_CHECK': '1'})
+        return device
+
+    @skipIf(not util.which('genisoimage'), 'genisoimage is not installed')
+    def test_genisoimage_rock_ridge(self):
+        """Rock Ridge names and symbolic links are read."""
+        src = self.seed_dir()
+        os.symlink('meta-data', os.path.join(src, 'link-data'))
+        device = self.genisoimage(src, '-joliet', '-rock')
+        self.assert_extracts(device, 'iso9660')
+        with self.assertRaises(fsimage.ImageError):
+            fsimage.extract(device, self.tmp_dir(), paths=['link-data'])
+
+    @skipIf(not util.which('genisoimage'), 'genisoimage is not installed')
+    def test_genisoimage_joliet(self):
+        """Joliet names are read."""
+        self.assert_extracts(self.genisoimage(self.seed_dir(), '-joliet'),
+                             'iso9660')
+
+    @skipIf(not (util.which('mkfs.vfat') and util.which('mcopy')),
+            'mkfs.vfat or mcopy is not installed')
+    def test_mkfs_vfat(self):
+        """FAT12 and FAT32 images are read."""
+        src = self.seed_dir()
+        self.assert_extracts(self.mkfs_vfat(src, 'fat12.img', '1440'),
+                             'vfat')
+        self.assert_extracts(
+            self.mkfs_vfat(src, 'fat32.img', '66000', '-F', '32', '-S',
+                           '512', '-s', '1'), 'vfat')
+
+
+class TestReadImageCb(CiTestCase):
+
+    def setUp(self):
+        super(TestReadImageCb, self).setUp()
+        self.device = self.tmp_path('device')
+        patcher = mock.patch('cloudinit.util.mounts', return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('cloudinit.util.mount_cb')
+    def test_callback_reads_extracted_files(self, m_mount_cb):
+        """The callback gets a directory holding the image's files."""
+        util.write_file(self.device, make_iso(SEED), omode='wb')
+        seeded = util.read_image_cb(
+            self.device, lambda mp, data: util.pathprefix2dict(mp, **data),
+            {'required': ['meta-data', 'user-data']})
+        self.assertEqual(SEED['meta-data'], seeded['meta-data'])
+        self.assertEqual(0, m_mount_cb.call_count)
+
+    @mock.patch('cloudinit.util.mount_cb', return_value='mounted')
+    def test_falls_back_to_mount(self, m_mount_cb):
+        """Devices that can not be read directly are mounted."""
+        util.write_file(self.device, b'\x00' * 100000, omode='wb')
+        callback = mock.Mock()
+        self.assertEqual('mounted', util.read_image_cb(
+            self.device, callback, mtype='vfat', sync=False))
+        m_mount_cb.assert_called_once_with(
+            self.device, callback, data=None, mtype='vfat', sync=False)
+        self.assertEqual(0, callback.call_count)
+
+    @mock.patch('cloudinit.util.mount_cb', return_value='mounted')
+    def test_mounted_devices_use_mount_cb(self, m_mount_cb):
+        """Already mounted devices are read through their mount."""
+        util.write_file(self.device, make_iso(SEED), omode='wb')
+        with mock.patch('cloudinit.util.mounts',
+                        return_value={self.device: {}}):
+            self.assertEqual('mounted',
+                             util.read_image_cb(self.device, mock.Mock()))
+
+# vi: ts=4 expandtab
@@ -0,0 +1,76 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.importer and the import time of the cli."""
+
+import json
+import os
+import subprocess
+import sys
+
+import cloudinit
+from cloudinit import importer
+from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+
+# Modules only some subcommands need, which must not be imported by
+# just starting cloud-init.
+LAZY_MODULES = ('requests', 'jinja2', 'Cheetah', 'pkg_resources', 'yaml',
+                'cloudinit.stages', 'cloudinit.sources', 'cloudinit.netinfo')
+
+# Microseconds allowed for importing cloudinit.cmd.main.  Generous, it
+# only catches large regressions such as an eager heavy dependency.
+IMPORT_BUDGET_US = 1000000
+
+
+def _import_times(statement):
+    """Return {module: cumulative microseconds} importing in a new python."""
+    root = os.path.dirname(os.path.dirname(cloudinit.__file__))
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', statement], cwd=root,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (_out, err) = proc.communicate()
+    if proc.returncode != 0:
+        raise AssertionError('%s failed: %s' % (statement, err))
+    times = {}
+    for line in err.decode().splitlines():
+        if not line.startswith('import time:'):
+            continue
+        (_self, cumulative, name) = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestLazyImport(CiTestCase):
+
+    def test_imported_on_first_attribute(self):
+        """The module is imported once, when an attribute is first used."""
+        lazy = importer.LazyModule('json')
+        with mock.patch('cloudinit.importer.import_module',
+                        return_value=json) as m_import:
+            self.assertEqual(0, m_import.call_count)
+            self.assertIs(json.dumps, lazy.dumps)
+            self.assertIs(json.loads, lazy.loads)
+        m_import.assert_called_once_with('json')
+
+    def test_missing_modules_fail_when_used(self):
+        """ImportError is raised on use rather than on lazy_import."""
+        lazy = importer.lazy_import('cloudinit.tests.no_such_module')
+        with self.assertRaises(ImportError):
+            lazy.anything
+
+    def test_imported_modules_are_returned(self):
+        """Modules already imported are returned as they are."""
+        self.assertIs(os, importer.lazy_import('os'))
+
+
+@skipIf(sys.version_info < (3, 7), "-X importtime needs python 3.7")
+class TestImportBudget(CiTestCase):
+
+    def test_cli_import_is_lazy_and_within_budget(self):
+        """Importing the cli skips heavy modules and stays in budget."""
+        times = _import_times('import cloudinit.cmd.main')
+        self.assertEqual(
+            [], [m for m in LAZY_MODULES if m in times])
+        self.assertLess(times['cloudinit.cmd.main'], IMPORT_BUDGET_US)
+
+# vi: ts=4 expandtab
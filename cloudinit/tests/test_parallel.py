@@ -0,0 +1,162 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.parallel"""
+
+import threading
+
+from cloudinit import parallel
+from cloudinit.tests.helpers import CiTestCase
+
+
+class TestIterCompleted(CiTestCase):
+
+    def test_empty_items_yield_nothing(self):
+        """iter_completed yields nothing and starts no work for no items."""
+        self.assertEqual([], list(parallel.iter_completed(len, [])))
+
+    def test_results_are_indexed_by_item_position(self):
+        """Each result is reported with the index of its item."""
+        results = parallel.iter_completed(lambda x: x * 2, [1, 2, 3])
+        self.assertEqual(
+            [(0, 2, None), (1, 4, None), (2, 6, None)], sorted(results))
+
+    def test_exceptions_are_returned_not_raised(self):
+        """An exception from func is reported in the exc slot."""
+        def func(item):
+            if item == 'bad':
+                raise ValueError(item)
+            return item
+
+        results = sorted(parallel.iter_completed(func, ['good', 'bad']))
+        self.assertEqual((0, 'good', None), results[0])
+        (index, result, exc) = results[1]
+        self.assertEqual((1, None), (index, result))
+        self.assertIsInstance(exc, ValueError)
+
+    def test_base_exceptions_are_raised(self):
+        """A SystemExit from func is raised instead of hanging."""
+        def func(item):
+            if item == 'exit':
+                raise SystemExit(1)
+            return item
+
+        with self.assertRaises(SystemExit):
+            list(parallel.iter_completed(func, ['exit', 'good']))
+
+    def test_completion_order_is_yielded(self):
+        """A fast item is yielded before a slow item that started first."""
+        release = threading.Event()
+
+        def func(item):
+            if item == 'slow':
+                release.wait(5)
+            return item
+
+        results = parallel.iter_completed(func, ['slow', 'fast'])
+        self.assertEqual((1, 'fast', None), next(results))
+        release.set()
+        self.assertEqual((0, 'slow', None), next(results))
+
+    def test_max_workers_bounds_concurrency(self):
+        """No more than max_workers calls are in flight at once."""
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def func(item):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            threading.Event().wait(0.01)
+            with lock:
+                state['running'] -= 1
+
+        list(parallel.iter_completed(func, range(10), max_workers=3))
+        self.assertLessEqual(state['peak'], 3)
+
+    def test_unstarted_items_dropped_when_consumer_stops(self):
+        """Closing the iterator early stops workers taking new items."""
+        called = []
+        gate = threading.Event()
+
+        def func(item):
+            called.append(item)
+            if item:
+                gate.wait(5)
+            return item
+
+        results = parallel.iter_completed(func, range(50), max_workers=1)
+        self.assertEqual((0, 0, None), next(results))
+        results.close()
+        gate.set()
+        threading.Event().wait(0.1)
+        self.assertEqual([0, 1], called)
+
+
+class TestIterDependent(CiTestCase):
+
+    def test_dependents_start_after_their_dependencies(self):
+        """An item only starts once all items it depends on completed."""
+        lock = threading.Lock()
+        events = []
+
+        def func(item):
+            with lock:
+                events.append(('start', item))
+            threading.Event().wait(0.01)
+            with lock:
+                events.append(('end', item))
+            return item
+
+        depends = [[], [], [0, 1], [], [2]]
+        results = list(parallel.iter_dependent(func, range(5), depends))
+        self.assertEqual(list(range(5)), sorted(r[1] for r in results))
+        for (index, deps) in enumerate(depends):
+            for dep in deps:
+                self.assertLess(events.index(('end', dep)),
+                                events.index(('start', index)))
+
+    def test_independent_items_run_concurrently(self):
+        """Items without dependencies between them overlap."""
+        state = {'count': 0}
+        lock = threading.Lock()
+        both = threading.Event()
+
+        def func(item):
+            with lock:
+                state['count'] += 1
+                if state['count'] == 2:
+                    both.set()
+            return both.wait(5)
+
+        results = parallel.iter_dependent(func, ['a', 'b'], [[], []])
+        self.assertEqual([True, True], [r[1] for r in results])
+
+    def test_failed_dependencies_still_release_dependents(self):
+        """Dependents run even when an item they depend on raised."""
+        def func(item):
+            if item == 'bad':
+                raise ValueError(item)
+            return item
+
+        results = sorted(parallel.iter_dependent(
+            func, ['bad', 'after'], [[], [0]]))
+        self.assertIsInstance(results[0][2], ValueError)
+        self.assertEqual((1, 'after', None), results[1])
+
+    def test_base_exceptions_are_raised(self):
+        """A KeyboardInterrupt from func is raised instead of hanging."""
+        def func(item):
+            if item == 'interrupt':
+                raise KeyboardInterrupt()
+            return item
+
+        with self.assertRaises(KeyboardInterrupt):
+            list(parallel.iter_dependent(
+                func, ['interrupt', 'after'], [[], [0]], max_workers=1))
+
+    def test_forward_dependencies_are_rejected(self):
+        """Depending on a later item could never complete."""
+        with self.assertRaises(ValueError):
+            list(parallel.iter_dependent(len, ['a', 'b'], [[1], []]))
+
+# vi: ts=4 expandtab
@@ -0,0 +1,74 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.safeyaml."""
+
+import io
+
+import yaml
+
+from cloudinit import safeyaml
+from cloudinit.tests.helpers import CiTestCase, mock
+
+DOC = u"""\
+#cloud-config
+packages: [git, 'vim']
+write_files:
+  - path: /etc/motd
+    content: !!python/unicode "hello \\u00e9"
+    permissions: '0644'
+    encoding: b64
+ntp:
+  servers: [a, b]
+  enabled: true
+bootcmd:
+  - [sh, -c, 'echo 1']
+number: 0x10
+when: 2017-01-02
+empty:
+"""
+
+
+class TestLoad(CiTestCase):
+
+    def test_fast_and_pure_loaders_agree(self):
+        """The LibYAML loader builds the same objects."""
+        loaded = safeyaml.load(DOC, cached=False)
+        self.assertEqual(safeyaml.load_pure(DOC), loaded)
+        self.assertEqual(u'hello é', loaded['write_files'][0]['content'])
+        self.assertEqual(16, loaded['number'])
+
+    def test_python_objects_are_refused(self):
+        """Tags other than python/unicode are not constructed."""
+        with self.assertRaises(yaml.YAMLError):
+            safeyaml.load('!!python/object/apply:os.system ["true"]')
+
+    def test_cached_loads_return_copies(self):
+        """Changing a loaded document does not change later loads."""
+        first = safeyaml.load(DOC)
+        first['packages'].append('changed')
+        with mock.patch('cloudinit.safeyaml.yaml.load') as m_load:
+            second = safeyaml.load(DOC.encode('utf-8'))
+        self.assertEqual(0, m_load.call_count)
+        self.assertEqual(['git', 'vim'], second['packages'])
+        self.assertIsNot(second, safeyaml.load(DOC))
+
+    def test_errors_are_not_cached(self):
+        """Invalid yaml raises every time."""
+        for _ in range(2):
+            with self.assertRaises(yaml.YAMLError):
+                safeyaml.load('a: [1')
+
+    def test_streams_are_not_cached(self):
+        """Streams are parsed and not remembered."""
+        self.assertEqual({'a': 1}, safeyaml.load(io.StringIO(u'a: 1')))
+        self.assertEqual({}, safeyaml._CACHE)
+
+    def test_cache_is_bounded(self):
+        """The oldest documents are dropped from a full cache."""
+        with mock.patch.object(safeyaml, 'CACHE_MAX_ENTRIES', 2):
+            for i in range(3):
+                safeyaml.load('a: %d' % i)
+        self.assertEqual(2, len(safeyaml._CACHE))
+        self.assertNotIn(safeyaml._cache_key('a: 0'), safeyaml._CACHE)
+
+# vi: ts=4 expandtab
@@ -1,7 +1,15 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
-from cloudinit.url_helper import oauth_headers
-from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+import threading
+
+import httpretty
+
+from cloudinit import url_helper
+from cloudinit.url_helper import (
+    SessionPool, StringResponse, UrlError, oauth_headers, readurl,
+    wait_for_url)
+from cloudinit.tests.helpers import (
+    CiTestCase, HttprettyTestCase, mock, skipIf)
 
 
 try:
@@ -38,3 +46,177 @@ class TestOAuthHeaders(CiTestCase):
             'url', 'consumer_key', 'token_key', 'token_secret',
             'consumer_secret')
         self.assertEqual('url', return_value)
+
+
+class TestRequestsFeatures(CiTestCase):
+
+    @mock.patch.object(url_helper, '_REQ_FEATURES', None)
+    def test_features_without_distutils(self):
+        """Without distutils ssl and config support are not assumed."""
+        with mock.patch.dict('sys.modules', {'distutils.version': None}):
+            self.assertEqual(
+                (None, False, False), url_helper._requests_features())
+
+    @mock.patch.object(url_helper, '_REQ_FEATURES', None)
+    def test_features_from_requests_version(self):
+        """Features are found from the version of requests."""
+        with mock.patch.object(url_helper.requests, '__version__', '0.7.1'):
+            (req_ver, ssl_enabled, config_enabled) = (
+                url_helper._requests_features())
+        self.assertEqual('0.7.1', str(req_ver))
+        self.assertEqual((False, True), (ssl_enabled, config_enabled))
+
+
+class TestSessionPool(HttprettyTestCase):
+
+    def setUp(self):
+        super(TestSessionPool, self).setUp()
+        self.pool = SessionPool()
+        self.addCleanup(self.pool.close)
+
+    def test_same_endpoint_shares_a_session(self):
+        """Urls with the same scheme and host share one session."""
+        self.assertIs(self.pool.get('http://example.com/a'),
+                      self.pool.get('http://example.com/b/c'))
+
+    def test_different_endpoints_get_different_sessions(self):
+        """Scheme, host and port each select their own session."""
+        sessions = [self.pool.get(url) for url in (
+            'http://example.com/', 'https://example.com/',
+            'http://example.com:8080/', 'http://example.org/')]
+        self.assertEqual(4, len(set(id(s) for s in sessions)))
+
+    def test_ssl_details_select_session(self):
+        """Requests with different client certificates never share."""
+        url = 'https://example.com/'
+        with_cert = {'cert_file': '/c.pem', 'key_file': '/k.pem'}
+        self.assertIsNot(self.pool.get(url),
+                         self.pool.get(url, ssl_details=with_cert))
+        self.assertIs(self.pool.get(url, ssl_details=with_cert),
+                      self.pool.get(url, ssl_details=dict(with_cert)))
+
+    @httpretty.activate
+    def test_sessions_do_not_store_cookies(self):
+        """Cookies set by a response are not kept for later requests."""
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.com/data', body='hi',
+            adding_headers={'Set-Cookie': 'name=value'})
+        with mock.patch('cloudinit.url_helper.SESSION_POOL', self.pool):
+            readurl('http://example.com/data')
+        self.assertEqual(0, len(self.pool.get('http://example.com/').cookies))
+
+    def test_close_resets_sessions_and_counters(self):
+        """close drops all sessions and zeroes the counters."""
+        session = self.pool.get('http://example.com/')
+        self.pool.close()
+        self.assertIsNot(session, self.pool.get('http://example.com/'))
+        self.assertEqual(
+            {'requests': 1, 'sessions': 1, 'connections': 0, 'reused': 0},
+            self.pool.stats())
+
+    @httpretty.activate
+    def test_readurl_uses_the_shared_session_pool(self):
+        """readurl gets its session from the module session pool."""
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.com/data', body='hi')
+        with mock.patch('cloudinit.url_helper.SESSION_POOL', self.pool):
+            readurl('http://example.com/data')
+            readurl('http://example.com/data')
+        stats = self.pool.stats()
+        self.assertEqual(
+            {'requests': 2, 'sessions': 1, 'connections': 1, 'reused': 1},
+            stats)
+
+    @httpretty.activate
+    def test_readurl_uses_provided_session(self):
+        """A session passed to readurl is used instead of the pool."""
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.com/data', body='hi')
+        session = self.pool.get('http://example.com/')
+        with mock.patch('cloudinit.url_helper.SESSION_POOL') as m_pool:
+            response = readurl('http://example.com/data', session=session)
+        self.assertEqual(b'hi', response.contents)
+        self.assertEqual([], m_pool.get.call_args_list)
+
+
+class TestWaitForUrl(CiTestCase):
+
+    good = 'http://good/'
+    bad = 'http://bad/'
+    slow = 'http://slow/'
+
+    def setUp(self):
+        super(TestWaitForUrl, self).setUp()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.status = []
+        self.exceptions = []
+
+    def fake_readurl(self, url, *args, **kwargs):
+        if url == self.slow:
+            # Blackholed: only returns once the test is finished.
+            self.release.wait(10)
+        if url == self.good:
+            return StringResponse(b'instance-id')
+        raise UrlError(ValueError('connection refused'), url=url)
+
+    def _wait(self, urls, **kwargs):
+        def exception_cb(msg, exception):
+            self.exceptions.append((msg, exception))
+
+        with mock.patch('cloudinit.url_helper.readurl',
+                        side_effect=self.fake_readurl):
+            return wait_for_url(
+                urls, max_wait=1, timeout=1, status_cb=self.status.append,
+                exception_cb=exception_cb, **kwargs)
+
+    def test_concurrent_returns_good_url_despite_blackholed_first(self):
+        """A blackholed url first in the list does not delay the result."""
+        self.assertEqual(self.good, self._wait([self.slow, self.good]))
+        self.assertEqual([], self.status)
+
+    def test_concurrent_reports_failures_before_success(self):
+        """status_cb and exception_cb are called for each failed url."""
+        self.assertEqual(self.good, self._wait([self.bad, self.slow,
+                                                self.good]))
+        self.assertEqual(1, len(self.status))
+        self.assertIn("Calling 'http://bad/' failed", self.status[0])
+        self.assertEqual(self.status[0], self.exceptions[0][0])
+        self.assertIsInstance(self.exceptions[0][1], UrlError)
+
+    def test_concurrent_returns_false_when_no_url_responds(self):
+        """All failing urls are reported each round until max_wait."""
+        self.assertFalse(self._wait([self.bad, 'http://bad2/']))
+        self.assertIn("Calling 'http://bad/' failed", ''.join(self.status))
+        self.assertIn("Calling 'http://bad2/' failed", ''.join(self.status))
+        self.assertEqual(len(self.status), len(self.exceptions))
+
+    def test_concurrent_rounds_stop_at_max_wait(self):
+        """No round starts after max_wait, none with a timeout of 0."""
+        clock = [0]
+        calls = []
+
+        def readurl(url, timeout=None, **_kwargs):
+            calls.append((clock[0], timeout))
+            raise UrlError(ValueError('connection refused'), url=url)
+
+        def sleep(seconds):
+            clock[0] += seconds + .2
+
+        m_time = mock.Mock(time=lambda: clock[0], sleep=sleep)
+        with mock.patch('cloudinit.url_helper.readurl', side_effect=readurl):
+            with mock.patch('cloudinit.url_helper.time', m_time):
+                self.assertFalse(wait_for_url(
+                    [self.bad, 'http://bad2/'], max_wait=1.5, timeout=1,
+                    status_cb=self.status.append))
+        self.assertEqual([(0, 1), (0, 1), (1.2, 1), (1.2, 1)], calls)
+        self.assertEqual(4, len(self.status))
+
+    def test_serial_tries_urls_in_order(self):
+        """With concurrent=False urls are tried one after the other."""
+        self.assertEqual(
+            self.good, self._wait([self.bad, self.good], concurrent=False))
+        self.assertEqual(1, len(self.status))
+        self.assertIn("Calling 'http://bad/' failed", self.status[0])
+
+# vi: ts=4 expandtab
@@ -0,0 +1,103 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.wait_helper"""
+
+import os
+import threading
+import time
+
+from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+from cloudinit import util
+from cloudinit import wait_helper
+
+
+def _inotify_available():
+    try:
+        wait_helper.Inotify().close()
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+class TestWaitForPaths(CiTestCase):
+
+    with_logs = True
+
+    def create_later(self, path, delay=.1):
+        timer = threading.Timer(delay, util.write_file, (path, 'x'))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_existing_paths_return_at_once(self):
+        """Nothing is waited for when all paths exist."""
+        path = self.tmp_dir()
+        with mock.patch.object(wait_helper, 'Inotify') as m_inotify:
+            self.assertEqual(set(), wait_helper.wait_for_paths([path], 10))
+        self.assertEqual(0, m_inotify.call_count)
+
+    def test_missing_paths_are_returned_after_maxwait(self):
+        """Paths that never appear are returned once maxwait passed."""
+        path = self.tmp_path('missing')
+        start = time.time()
+        self.assertEqual(
+            set([path]), wait_helper.wait_for_paths([path], .3, naplen=.1))
+        self.assertGreaterEqual(time.time() - start, .3)
+
+    @skipIf(not _inotify_available(), "inotify is not available")
+    def test_created_paths_are_noticed_without_a_nap(self):
+        """A path created in a directory not existing yet ends the wait."""
+        path = os.path.join(self.tmp_dir(), 'disk', 'cloud', 'resource')
+        self.create_later(path)
+        start = time.time()
+        self.assertEqual(
+            set(), wait_helper.wait_for_paths([path], 30, naplen=30))
+        self.assertLess(time.time() - start, 10)
+
+    @skipIf(not _inotify_available(), "inotify is not available")
+    def test_files_are_waited_for_until_closed(self):
+        """A regular file counts once it is closed after writing."""
+        path = self.tmp_path('written')
+        fh = open(path, 'w')
+        self.addCleanup(fh.close)
+        fh.write('partial')
+        fh.flush()
+        timer = threading.Timer(.2, fh.close)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.time()
+        self.assertEqual(
+            set(), wait_helper.wait_for_paths([path], 30, naplen=30))
+        self.assertTrue(fh.closed)
+        self.assertLess(time.time() - start, 10)
+
+    def test_files_count_once_size_and_mtime_are_stable(self):
+        """Without events, a file counts once it stopped changing."""
+        path = self.tmp_path('growing')
+        util.write_file(path, 'x')
+        states = [(1, 1.0), (2, 1.0), (2, 2.0), (2, 2.0), (2, 2.0)]
+        with mock.patch.object(wait_helper, 'Inotify',
+                               side_effect=AttributeError('no inotify')):
+            with mock.patch.object(wait_helper, '_file_state',
+                                   side_effect=states) as m_state:
+                self.assertEqual(
+                    set(), wait_helper.wait_for_paths([path], 30, naplen=30,
+                                                      settle=.05))
+        self.assertEqual(4, m_state.call_count)
+
+    def test_inotify_without_libc(self):
+        """Inotify raises OSError when libc could not be loaded."""
+        with mock.patch.object(wait_helper, 'LIBC', None):
+            with self.assertRaises(OSError):
+                wait_helper.Inotify()
+
+    def test_polling_without_inotify(self):
+        """Paths are polled every naplen when inotify is not available."""
+        path = self.tmp_path('polled')
+        self.create_later(path)
+        with mock.patch.object(wait_helper, 'Inotify',
+                               side_effect=AttributeError('no inotify')):
+            self.assertEqual(
+                set(), wait_helper.wait_for_paths([path], 30, naplen=.05))
+        self.assertIn('inotify is not available', self.logs.getvalue())
+
+# vi: ts=4 expandtab
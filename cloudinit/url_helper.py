@@ -10,47 +10,53 @@
 
 import json
 import os
-import requests
-import six
+import threading
 import time
 
 from email.utils import parsedate
 from functools import partial
 
-from requests import exceptions
-
 from six.moves.urllib.parse import (
     urlparse, urlunparse,
     quote as urlquote)
 
+from cloudinit import importer
 from cloudinit import log as logging
+from cloudinit import parallel
 from cloudinit import version
 
+# requests is imported when a url is first read.
+requests = importer.lazy_import('requests')
+exceptions = importer.lazy_import('requests.exceptions')
+http_cookiejar = importer.lazy_import('six.moves.http_cookiejar')
+
 LOG = logging.getLogger(__name__)
 
-if six.PY2:
-    import httplib
-    NOT_FOUND = httplib.NOT_FOUND
-else:
-    import http.client
-    NOT_FOUND = http.client.NOT_FOUND
-
-
-# Check if requests has ssl support (added in requests >= 0.8.8)
-SSL_ENABLED = False
-CONFIG_ENABLED = False  # This was added in 0.7 (but taken out in >=1.0)
-_REQ_VER = None
-try:
-    from distutils.version import LooseVersion
-    import pkg_resources
-    _REQ = pkg_resources.get_distribution('requests')
-    _REQ_VER = LooseVersion(_REQ.version)  # pylint: disable=no-member
-    if _REQ_VER >= LooseVersion('0.8.8'):
-        SSL_ENABLED = True
-    if _REQ_VER >= LooseVersion('0.7.0') and _REQ_VER < LooseVersion('1.0.0'):
-        CONFIG_ENABLED = True
-except ImportError:
-    pass
+# http.client.NOT_FOUND, without importing http.client just for it.
+NOT_FOUND = 404
+
+
+_REQ_FEATURES = None
+
+
+def _requests_features():
+    """Return (version, ssl enabled, config enabled) of requests.
+
+    ssl support was added in requests 0.8.8, config in 0.7 (and taken
+    out in 1.0).  Without distutils neither is assumed, as before.
+    """
+    global _REQ_FEATURES
+    if _REQ_FEATURES is None:
+        try:
+            from distutils.version import LooseVersion
+        except ImportError:
+            _REQ_FEATURES = (None, False, False)
+        else:
+            req_ver = LooseVersion(requests.__version__)
+            _REQ_FEATURES = (
+                req_ver, req_ver >= LooseVersion('0.8.8'),
+                LooseVersion('0.7.0') <= req_ver < LooseVersion('1.0.0'))
+    return _REQ_FEATURES
 
 
 def _cleanurl(url):
@@ -153,9 +159,10 @@ def _get_ssl_args(url, ssl_details):
     ssl_args = {}
     scheme = urlparse(url).scheme
     if scheme == 'https' and ssl_details:
-        if not SSL_ENABLED:
+        (req_ver, ssl_enabled, _config_enabled) = _requests_features()
+        if not ssl_enabled:
             LOG.warning("SSL is not supported in requests v%s, "
-                        "cert. verification can not occur!", _REQ_VER)
+                        "cert. verification can not occur!", req_ver)
         else:
             if 'ca_certs' in ssl_details and ssl_details['ca_certs']:
                 ssl_args['verify'] = ssl_details['ca_certs']
@@ -169,6 +176,94 @@ def _get_ssl_args(url, ssl_details):
     return ssl_args
 
 
+class SessionPool(object):
+    """Keep-alive sessions shared by all requests made through readurl.
+
+    One requests.Session is kept per scheme, host and ssl details so
+    that repeated requests to the same endpoint reuse connections instead
+    of paying a new TCP (and TLS) handshake each time.  Sessions do not
+    store cookies, so requests behave as if each used a fresh session.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._requests = 0
+
+    @staticmethod
+    def _key(url, ssl_details=None):
+        parsed = urlparse(url)
+        ssl_args = _get_ssl_args(url, ssl_details)
+        cert = ssl_args.get('cert')
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        return (parsed.scheme, parsed.netloc, ssl_args.get('verify'), cert)
+
+    def get(self, url, ssl_details=None):
+        """Return the shared session to use for a request to url."""
+        key = self._key(url, ssl_details)
+        with self._lock:
+            self._requests += 1
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.cookies.set_policy(
+                    http_cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                self._sessions[key] = session
+            return session
+
+    def stats(self):
+        """Return counters of requests, sessions and connections used.
+
+        'connections' is the number of connections that were opened and
+        'reused' the number of requests that were served on an already
+        open connection, both as counted by the urllib3 connection pools.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+            requests_made = self._requests
+        connections = 0
+        served = 0
+        for session in sessions:
+            (session_connections, session_served) = _count_connections(
+                session)
+            connections += session_connections
+            served += session_served
+        return {'requests': requests_made, 'sessions': len(sessions),
+                'connections': connections,
+                'reused': max(served - connections, 0)}
+
+    def close(self):
+        """Close all sessions and their connections, resetting counters."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+            self._requests = 0
+        for session in sessions:
+            session.close()
+
+
+def _count_connections(session):
+    """Return (connections opened, requests served) by session's pools."""
+    connections = 0
+    served = 0
+    for adapter in session.adapters.values():
+        manager = getattr(adapter, 'poolmanager', None)
+        if manager is None:
+            continue
+        for pool_key in manager.pools.keys():
+            pool = manager.pools.get(pool_key)
+            connections += getattr(pool, 'num_connections', 0)
+            served += getattr(pool, 'num_requests', 0)
+    return (connections, served)
+
+
+SESSION_POOL = SessionPool()
+
+# Bytes of response content read by readurl, reported when profiling.
+BYTES_FETCHED = parallel.Counter()
+
+
 def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
             headers=None, headers_cb=None, ssl_details=None,
             check_status=True, allow_redirects=True, exception_cb=None,
@@ -187,7 +282,8 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     # It doesn't seem like config
     # was added in older library versions (or newer ones either), thus we
     # need to manually do the retries if it wasn't...
-    if CONFIG_ENABLED:
+    (_req_ver, ssl_enabled, config_enabled) = _requests_features()
+    if config_enabled:
         req_config = {
             'store_cookies': False,
         }
@@ -232,13 +328,14 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
                       manual_tries, url, filtered_req_args)
 
             if session is None:
-                session = requests.Session()
-
-            with session as sess:
-                r = sess.request(**req_args)
+                sess = SESSION_POOL.get(url, ssl_details)
+            else:
+                sess = session
+            r = sess.request(**req_args)
 
             if check_status:
                 r.raise_for_status()
+            BYTES_FETCHED.add(len(r.content))
             LOG.debug("Read from %s (%s, %sb) after %s attempts", url,
                       r.status_code, len(r.content), (i + 1))
             # Doesn't seem like we can make it use a different
@@ -254,7 +351,7 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
                                       url=url))
             else:
                 excps.append(UrlError(e, url=url))
-                if SSL_ENABLED and isinstance(e, exceptions.SSLError):
+                if ssl_enabled and isinstance(e, exceptions.SSLError):
                     # ssl exceptions are not going to get fixed by waiting a
                     # few seconds
                     break
@@ -273,7 +370,7 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
 
 def wait_for_url(urls, max_wait=None, timeout=None,
                  status_cb=None, headers_cb=None, sleep_time=1,
-                 exception_cb=None):
+                 exception_cb=None, concurrent=True):
     """
     urls:      a list of urls to try
     max_wait:  roughly the maximum time to wait before giving up
@@ -286,6 +383,11 @@ def wait_for_url(urls, max_wait=None, timeout=None,
                 for request.
     exception_cb: call method with 2 arguments 'msg' (per status_cb) and
                   'exception', the exception that occurred.
+    concurrent: when True and more than one url is given, each round
+                tries all urls at the same time and returns the first one
+                that responds successfully, instead of trying them in turn.
+                status_cb and exception_cb are still called from the
+                calling thread, once per failed url, as failures come in.
 
     the idea of this routine is to wait for the EC2 metdata service to
     come up.  On both Eucalyptus and EC2 we have seen the case where
@@ -314,56 +416,55 @@ def wait_for_url(urls, max_wait=None, timeout=None,
         return ((max_wait <= 0 or max_wait is None) or
                 (time.time() - start_time > max_wait))
 
+    def shorten_timeout(timeout):
+        # shorten timeout to not run way over max_time
+        now = time.time()
+        if timeout and (now + timeout > (start_time + max_wait)):
+            # a timeout of 0 would not wait at all, or fail
+            timeout = max(int((start_time + max_wait) - now), 1)
+        return timeout
+
+    def report_failure(url, reason, url_exc):
+        time_taken = int(time.time() - start_time)
+        status_msg = "Calling '%s' failed [%s/%ss]: %s" % (url,
+                                                           time_taken,
+                                                           max_wait,
+                                                           reason)
+        status_cb(status_msg)
+        if exception_cb:
+            # This can be used to alter the headers that will be sent
+            # in the future, for example this is what the MAAS datasource
+            # does.
+            exception_cb(msg=status_msg, exception=url_exc)
+
     loop_n = 0
     while True:
         sleep_time = int(loop_n / 5) + 1
-        for url in urls:
-            now = time.time()
+        if concurrent and len(urls) > 1:
             if loop_n != 0:
                 if timeup(max_wait, start_time):
                     break
-                if timeout and (now + timeout > (start_time + max_wait)):
-                    # shorten timeout to not run way over max_time
-                    timeout = int((start_time + max_wait) - now)
-
-            reason = ""
-            url_exc = None
-            try:
-                if headers_cb is not None:
-                    headers = headers_cb(url)
-                else:
-                    headers = {}
-
-                response = readurl(url, headers=headers, timeout=timeout,
-                                   check_status=False)
-                if not response.contents:
-                    reason = "empty response [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                elif not response.ok():
-                    reason = "bad status code [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                else:
+                timeout = shorten_timeout(timeout)
+
+            def probe(url):
+                return _probe_url(url, headers_cb, timeout)
+
+            for index, (reason, url_exc), _exc in parallel.iter_completed(
+                    probe, urls, max_workers=len(urls)):
+                if reason is None:
+                    return urls[index]
+                report_failure(urls[index], reason, url_exc)
+        else:
+            for url in urls:
+                if loop_n != 0:
+                    if timeup(max_wait, start_time):
+                        break
+                    timeout = shorten_timeout(timeout)
+
+                (reason, url_exc) = _probe_url(url, headers_cb, timeout)
+                if reason is None:
                     return url
-            except UrlError as e:
-                reason = "request error [%s]" % e
-                url_exc = e
-            except Exception as e:
-                reason = "unexpected error [%s]" % e
-                url_exc = e
-
-            time_taken = int(time.time() - start_time)
-            status_msg = "Calling '%s' failed [%s/%ss]: %s" % (url,
-                                                               time_taken,
-                                                               max_wait,
-                                                               reason)
-            status_cb(status_msg)
-            if exception_cb:
-                # This can be used to alter the headers that will be sent
-                # in the future, for example this is what the MAAS datasource
-                # does.
-                exception_cb(msg=status_msg, exception=url_exc)
+                report_failure(url, reason, url_exc)
 
         if timeup(max_wait, start_time):
             break
@@ -376,6 +477,35 @@ def wait_for_url(urls, max_wait=None, timeout=None,
     return False
 
 
+def _probe_url(url, headers_cb, timeout):
+    """Read url once for wait_for_url.
+
+    Return (None, None) if url responded with content and a good status,
+    otherwise a (reason, exception) tuple describing the failure.
+    """
+    try:
+        if headers_cb is not None:
+            headers = headers_cb(url)
+        else:
+            headers = {}
+
+        response = readurl(url, headers=headers, timeout=timeout,
+                           check_status=False)
+        if not response.contents:
+            reason = "empty response [%s]" % (response.code)
+            return (reason, UrlError(ValueError(reason), code=response.code,
+                                     headers=response.headers, url=url))
+        elif not response.ok():
+            reason = "bad status code [%s]" % (response.code)
+            return (reason, UrlError(ValueError(reason), code=response.code,
+                                     headers=response.headers, url=url))
+        return (None, None)
+    except UrlError as e:
+        return ("request error [%s]" % e, e)
+    except Exception as e:
+        return ("unexpected error [%s]" % e, e)
+
+
 class OauthUrlHelper(object):
     def __init__(self, consumer_key=None, token_key=None,
                  token_secret=None, consumer_secret=None,
@@ -12,6 +12,7 @@ import contextlib
 import copy as obj_copy
 import ctypes
 import email
+import fcntl
 import glob
 import grp
 import gzip
@@ -30,20 +31,21 @@ import stat
 import string
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 
-from errno import ENOENT, ENOEXEC
+from errno import EBUSY, EEXIST, ENOENT, ENOEXEC, EXDEV
 
 from base64 import b64decode, b64encode
 from six.moves.urllib import parse as urlparse
 
 import six
-import yaml
 
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import mergers
-from cloudinit import safeyaml
+from cloudinit import parallel
 from cloudinit import temp_utils
 from cloudinit import type_utils
 from cloudinit import url_helper
@@ -51,6 +53,11 @@ from cloudinit import version
 
 from cloudinit.settings import (CFG_BUILTIN)
 
+# Imported on first use, commands that never touch yaml do not load it.
+fsimage = importer.lazy_import('cloudinit.fsimage')
+safeyaml = importer.lazy_import('cloudinit.safeyaml')
+yaml = importer.lazy_import('yaml')
+
 try:
     string_types = (basestring,)
 except NameError:
@@ -76,7 +83,19 @@ CONTAINER_TESTS = (['systemd-detect-virt', '--quiet', '--container'],
 
 PROC_CMDLINE = None
 
+# Number of processes started by subp, reported when profiling.
+SUBP_COUNT = parallel.Counter()
+
 _LSB_RELEASE = {}
+
+# Facts about the platform that do not change during a boot, collected at
+# most once per process.  See platform_facts.
+_PLATFORM_FACTS = {}
+
+# Block devices found by blkid, scanned at most once until invalidated.
+# See blkid_index.
+_BLKID_INDEX = None
+_BLKID_INDEX_LOCK = threading.Lock()
 PY26 = sys.version_info[0:2] == (2, 6)
 
 
@@ -742,13 +761,16 @@ def mergemanydict(srcs, reverse=False):
     if reverse:
         srcs = reversed(srcs)
     merged_cfg = {}
+    # The dicts copied while merging are private to this call, so later
+    # sources are merged into them in place rather than copying again.
+    owned = {}
     for cfg in srcs:
         if cfg:
             # Figure out which mergers to apply...
             mergers_to_apply = mergers.dict_extract_mergers(cfg)
             if not mergers_to_apply:
                 mergers_to_apply = mergers.default_mergers()
-            merger = mergers.construct(mergers_to_apply)
+            merger = mergers.construct(mergers_to_apply, owned=owned)
             merged_cfg = merger.merge(merged_cfg, cfg)
     return merged_cfg
 
@@ -863,7 +885,7 @@ def fetch_ssl_details(paths=None):
 
 def read_file_or_url(url, timeout=5, retries=10,
                      headers=None, data=None, sec_between=1, ssl_details=None,
-                     headers_cb=None, exception_cb=None):
+                     headers_cb=None, exception_cb=None, session=None):
     url = url.lstrip()
     if url.startswith("/"):
         url = "file://%s" % url
@@ -889,7 +911,8 @@ def read_file_or_url(url, timeout=5, retries=10,
                                   data=data,
                                   sec_between=sec_between,
                                   ssl_details=ssl_details,
-                                  exception_cb=exception_cb)
+                                  exception_cb=exception_cb,
+                                  session=session)
 
 
 def load_yaml(blob, default=None, allowed=(dict,)):
@@ -942,7 +965,8 @@ def read_seeded(base="", ext="", timeout=5, retries=10, file_retries=0):
     return (md, ud)
 
 
-def read_conf_d(confd):
+def list_conf_d(confd):
+    """Return the paths of the '.cfg' files in confd, later ones first."""
     # Get reverse sorted list (later trumps newer)
     confs = sorted(os.listdir(confd), reverse=True)
 
@@ -950,20 +974,24 @@ def read_conf_d(confd):
     confs = [f for f in confs if f.endswith(".cfg")]
 
     # Remove anything not a file
-    confs = [f for f in confs
-             if os.path.isfile(os.path.join(confd, f))]
+    return [os.path.join(confd, f) for f in confs
+            if os.path.isfile(os.path.join(confd, f))]
+
+
+def read_conf_d(confd, reader=None):
+    if reader is None:
+        reader = read_conf
 
     # Load them all so that they can be merged
     cfgs = []
-    for fn in confs:
-        cfgs.append(read_conf(os.path.join(confd, fn)))
+    for fn in list_conf_d(confd):
+        cfgs.append(reader(fn))
 
     return mergemanydict(cfgs)
 
 
-def read_conf_with_confd(cfgfile):
-    cfg = read_conf(cfgfile)
-
+def get_conf_d(cfgfile, cfg):
+    """Return the conf.d directory to read along with cfgfile or None."""
     confd = False
     if "conf_d" in cfg:
         confd = cfg['conf_d']
@@ -978,10 +1006,21 @@ def read_conf_with_confd(cfgfile):
         confd = "%s.d" % cfgfile
 
     if not confd or not os.path.isdir(confd):
+        return None
+    return confd
+
+
+def read_conf_with_confd(cfgfile, reader=None):
+    if reader is None:
+        reader = read_conf
+    cfg = reader(cfgfile)
+
+    confd = get_conf_d(cfgfile, cfg)
+    if not confd:
         return cfg
 
     # Conf.d settings override input configuration
-    confd_cfg = read_conf_d(confd)
+    confd_cfg = read_conf_d(confd, reader=reader)
     return mergemanydict([confd_cfg, cfg])
 
 
@@ -1190,8 +1229,14 @@ def find_devs_with(criteria=None, oformat='device',
       TYPE=<filesystem>
       LABEL=<label>
       UUID=<uuid>
+
+    Plain device queries are answered from the blkid index, see
+    blkid_index.  Queries for other output formats or tags, or that ask
+    for no_cache, run blkid directly.
     """
-    blk_id_cmd = ['blkid']
+    if oformat == 'device' and not tag and not no_cache:
+        return blkid_index().find(criteria, path)
+
     options = []
     if criteria:
         # Search for block devices with tokens named NAME that
@@ -1216,22 +1261,120 @@ def find_devs_with(criteria=None, oformat='device',
         options.append('-o%s' % (oformat))
     if path:
         options.append(path)
-    cmd = blk_id_cmd + options
+    entries = []
+    for line in _run_blkid(options).splitlines():
+        line = line.strip()
+        if line:
+            entries.append(line)
+    return entries
+
+
+def _run_blkid(options):
     # See man blkid for why 2 is added
     try:
-        (out, _err) = subp(cmd, rcs=[0, 2])
+        (out, _err) = subp(['blkid'] + options, rcs=[0, 2])
     except ProcessExecutionError as e:
         if e.errno == ENOENT:
             # blkid not found...
-            out = ""
-        else:
-            raise
-    entries = []
-    for line in out.splitlines():
+            return ""
+        raise
+    return out
+
+
+def parse_blkid_export(out):
+    """Return a list of (device, tags) from 'blkid -o export' output."""
+    devices = []
+    tags = {}
+    for line in out.splitlines() + ['']:
         line = line.strip()
-        if line:
-            entries.append(line)
-    return entries
+        if not line:
+            if 'DEVNAME' in tags:
+                devices.append((tags.pop('DEVNAME'), tags))
+            tags = {}
+            continue
+        if '=' in line:
+            (key, value) = line.split('=', 1)
+            # export format escapes unsafe characters with a backslash
+            tags[key] = re.sub(r'\\(.)', r'\1', value)
+    return devices
+
+
+class BlkidIndex(object):
+    """The blkid tags of block devices, indexed by the common tags."""
+
+    indexed_tags = ('TYPE', 'LABEL', 'UUID', 'PARTUUID')
+
+    def __init__(self, devices):
+        self._lock = threading.Lock()
+        self.devices = []
+        self.tags = {}
+        self.by_tag = {}
+        for (device, tags) in devices:
+            self._add(device, tags)
+
+    def _add(self, device, tags):
+        if not tags:
+            return
+        self.tags[device] = tags
+        self.devices.append(device)
+        for key in self.indexed_tags:
+            if key in tags:
+                self.by_tag.setdefault((key, tags[key]), []).append(device)
+
+    def _probe(self, path):
+        """Return the tags of path, as an explicit 'blkid path' would.
+
+        Found tags are added to the index.  A path without tags is probed
+        again next time, it may be a device that did not exist yet.
+        """
+        with self._lock:
+            if path in self.tags:
+                return self.tags[path]
+            found = parse_blkid_export(_run_blkid(['-o', 'export', path]))
+            tags = {}
+            if found:
+                tags = found[0][1]
+            self._add(path, tags)
+            return tags
+
+    def find(self, criteria=None, path=None):
+        """Return devices as 'blkid -o device [-t criteria] [path]' would.
+
+        criteria is a single NAME=value token.
+        """
+        if path:
+            devices = [path] if self._probe(path) else []
+        else:
+            devices = self.devices
+        if not criteria:
+            return list(devices)
+        (key, value) = criteria.split('=', 1)
+        value = value.strip('"')
+        if key in self.indexed_tags:
+            matches = self.by_tag.get((key, value), [])
+            return [dev for dev in devices if dev in matches]
+        return [dev for dev in devices if self.tags[dev].get(key) == value]
+
+
+def blkid_index():
+    """Return the BlkidIndex of this process.
+
+    All block devices are scanned with a single blkid run the first time,
+    and again after invalidate_blkid_index.
+    """
+    global _BLKID_INDEX
+    with _BLKID_INDEX_LOCK:
+        if _BLKID_INDEX is None:
+            _BLKID_INDEX = BlkidIndex(
+                parse_blkid_export(_run_blkid(['-o', 'export'])))
+        return _BLKID_INDEX
+
+
+def invalidate_blkid_index():
+    """Forget the blkid index after partitions or filesystems changed."""
+    global _BLKID_INDEX
+    with _BLKID_INDEX_LOCK:
+        _BLKID_INDEX = None
 
 
 def peek_file(fname, max_bytes):
@@ -1467,7 +1610,12 @@ def ensure_dir(path, mode=None):
     if not os.path.isdir(path):
         # Make the dir and adjust the mode
         with SeLinuxGuard(os.path.dirname(path), recursive=True):
-            os.makedirs(path)
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                # Created concurrently by another thread is as good
+                if e.errno != EEXIST or not os.path.isdir(path):
+                    raise
         chmod(path, mode)
     else:
         # Just adjust the mode
@@ -1605,6 +1753,42 @@ def mount_cb(device, callback, data=None, rw=False, mtype=None, sync=True):
             return ret
 
 
+def read_image_cb(device, callback, data=None, mtype=None, sync=True,
+                  paths=None):
+    """
+    Like mount_cb, but first try to read an iso9660 or vfat filesystem
+    on device without mounting it.  Its files are copied into a temporary
+    directory that is passed to callback.  If the filesystem can not be
+    read that way, device is mounted with mount_cb.
+
+    paths optionally limits the copied files to those files and
+    directories, relative to the root of the filesystem.
+    """
+    if isinstance(mtype, str):
+        mtypes = [mtype]
+    elif isinstance(mtype, (list, tuple)):
+        mtypes = list(mtype)
+    else:
+        mtypes = None
+    if mtypes and 'auto' in mtypes:
+        mtypes = None
+
+    if os.path.realpath(device) not in mounts():
+        with temp_utils.tempdir() as tmpd:
+            try:
+                fsimage.extract(device, tmpd, fstypes=mtypes,
+                                paths=paths)
+            except (fsimage.ImageError, IOError, OSError) as exc:
+                LOG.debug("Could not read %s without mounting: %s",
+                          device, exc)
+            else:
+                if data is None:
+                    return callback(tmpd + "/")
+                return callback(tmpd + "/", data)
+
+    return mount_cb(device, callback, data=data, mtype=mtype, sync=sync)
+
+
 def get_builtin_cfg():
     # Deep copy so that others can't modify
     return obj_copy.deepcopy(CFG_BUILTIN)
@@ -1674,6 +1858,22 @@ def append_file(path, content):
     write_file(path, content, omode="ab", mode=None)
 
 
+@contextlib.contextmanager
+def append_locked(path, mode=0o644):
+    """Open path for appending holding an exclusive flock on it.
+
+    Yields the file descriptor; writes of one os.write call are appended
+    whole.  The lock is released when the context exits.
+    """
+    ensure_dir(os.path.dirname(path))
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, mode)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        os.close(fd)
+
+
 def ensure_file(path, mode=0o644):
     write_file(path, content='', omode="ab", mode=mode)
 
@@ -1730,6 +1930,68 @@ def write_file(filename, content, mode=0o644, omode="wb", copy_mode=False):
     chmod(filename, mode)
 
 
+def write_file_chunks(filename, chunks, mode=0o644):
+    """
+    Atomically writes the byte strings chunks yields to a file.
+
+    The chunks are written to a temporary file next to filename, which is
+    then renamed over it, so readers never see a partial file.  If filename
+    is a symlink the file it points to is replaced.  A file with several
+    hard links, or one that can not be renamed over (a bind mount, say),
+    is rewritten in place once all chunks were written.
+
+    @param filename: The full path of the file to write.
+    @param chunks: An iterable of byte strings.
+    @param mode: The filesystem mode to set on the file.
+    @return: The number of bytes written.
+    """
+    # As write_file, only the directory of filename itself is created.
+    ensure_dir(os.path.dirname(filename))
+    filename = os.path.realpath(filename)
+    size = 0
+    tmp_fn = None
+    with SeLinuxGuard(path=filename):
+        try:
+            with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(filename), delete=False,
+                    prefix='.%s.' % os.path.basename(filename)) as fh:
+                tmp_fn = fh.name
+                for chunk in chunks:
+                    fh.write(chunk)
+                    size += len(chunk)
+            os.chmod(tmp_fn, mode)
+            if _hard_linked(filename):
+                _copy_in_place(tmp_fn, filename, mode)
+            else:
+                try:
+                    os.rename(tmp_fn, filename)
+                except OSError as e:
+                    if e.errno not in (EBUSY, EXDEV):
+                        raise
+                    LOG.debug("Renaming over %s failed (%s), writing it in "
+                              "place", filename, e)
+                    _copy_in_place(tmp_fn, filename, mode)
+        finally:
+            if tmp_fn:
+                del_file(tmp_fn)
+    LOG.debug("Wrote %s bytes to %s [%o]", size, filename, mode)
+    return size
+
+
+def _hard_linked(filename):
+    try:
+        return os.stat(filename).st_nlink > 1
+    except OSError:
+        return False
+
+
+def _copy_in_place(src, filename, mode):
+    with open(src, 'rb') as src_fh:
+        with open(filename, 'wb') as fh:
+            shutil.copyfileobj(src_fh, fh)
+    os.chmod(filename, mode)
+
+
 def delete_dir_contents(dirname):
     """
     Deletes all contents of a directory without deleting the directory itself.
@@ -1815,6 +2077,7 @@ def subp(args, data=None, rcs=None, env=None, capture=True, shell=False,
             if not isinstance(data, bytes):
                 data = data.encode()
 
+        SUBP_COUNT.add()
         sp = subprocess.Popen(args, stdout=stdout,
                               stderr=stderr, stdin=stdin,
                               env=env, shell=shell)
@@ -1902,7 +2165,12 @@ def is_container():
     """
     Checks to see if this code running in a container of some sort
     """
+    if 'is_container' not in _PLATFORM_FACTS:
+        _PLATFORM_FACTS['is_container'] = _detect_container()
+    return _PLATFORM_FACTS['is_container']
+
 
+def _detect_container():
     for helper in CONTAINER_TESTS:
         try:
             # try to run a helper program. if it returns true/zero
@@ -2408,11 +2676,20 @@ def read_dmi_data(key):
         3) Fall-back to passing `key` to `dmidecode --string`.
 
     If all of the above fail to find a value, None will be returned.
+
+    Values are only read once per process, see platform_facts.
     """
 
     if is_container():
         return None
 
+    dmi = _PLATFORM_FACTS.setdefault('dmi', {})
+    if key not in dmi:
+        dmi[key] = _read_dmi_data(key)
+    return dmi[key]
+
+
+def _read_dmi_data(key):
     syspath_value = _read_dmi_syspath(key)
     if syspath_value is not None:
         return syspath_value
@@ -2435,6 +2712,48 @@ def read_dmi_data(key):
     return None
 
 
+def platform_facts():
+    """Return the platform facts collected so far.
+
+    The returned dict has an 'is_container' key once is_container has run,
+    and a 'dmi' dict of the values returned by read_dmi_data.
+    """
+    return obj_copy.deepcopy(_PLATFORM_FACTS)
+
+
+def load_platform_facts(path):
+    """Add the platform facts saved in path to those of this process.
+
+    Facts already collected by this process are kept.
+    """
+    try:
+        facts = load_json(load_file(path))
+    except (IOError, OSError, ValueError, TypeError) as e:
+        LOG.debug("Not loading platform facts from %s: %s", path, e)
+        return
+    if 'is_container' in facts:
+        _PLATFORM_FACTS.setdefault('is_container', facts['is_container'])
+    if isinstance(facts.get('dmi'), dict):
+        dmi = _PLATFORM_FACTS.setdefault('dmi', {})
+        for (key, value) in facts['dmi'].items():
+            dmi.setdefault(key, value)
+
+
+def save_platform_facts(path):
+    """Save the platform facts of this process to path for later stages.
+
+    The facts include DMI keys only root can read, such as
+    system-serial-number and system-uuid, so only root can read path.
+    """
+    if not _PLATFORM_FACTS:
+        return
+    try:
+        write_file(path, json.dumps(_PLATFORM_FACTS, sort_keys=True),
+                   mode=0o600)
+    except (IOError, OSError) as e:
+        LOG.warning("Failed saving platform facts to %s: %s", path, e)
+
+
 def message_from_string(string):
     if sys.version_info[:2] < (2, 7):
         return email.message_from_file(six.StringIO(string))
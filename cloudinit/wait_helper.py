@@ -0,0 +1,230 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Wait for files and device nodes to appear.
+
+Rather than sleeping between checks, the directories the paths would
+appear in are watched with inotify, so a path is noticed as soon as it
+is created.  Paths under directories that do not exist yet are found as
+those directories are created.  Where inotify is not available, such as
+on FreeBSD, the paths are polled instead.
+
+Regular files count once they are completely written: once they were
+closed after writing or moved into place, or once their size and mtime
+stopped changing.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import time
+
+from cloudinit import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# From linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE_SELF | IN_MOVE_SELF)
+WRITTEN_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+
+# struct inotify_event without its name
+EVENT = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError as e:
+        LOG.debug("Could not load libc: %s", e)
+        return None
+
+
+# find_library may run ldconfig or a compiler, so only look once.
+LIBC = _load_libc()
+
+
+class Inotify(object):
+    """A minimal inotify instance, telling which files were written."""
+
+    def __init__(self):
+        if LIBC is None:
+            raise OSError(errno.ENOSYS, 'libc could not be loaded')
+        # AttributeError where libc has no inotify.
+        self._add_watch = LIBC.inotify_add_watch
+        self.fd = LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watches = {}
+
+    def watch(self, path):
+        """Watch the directory path, watching it again does nothing."""
+        raw = path
+        if not isinstance(raw, bytes):
+            raw = raw.encode('utf-8')
+        wd = self._add_watch(self.fd, raw, WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.watches[wd] = path
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for events.
+
+        @return: the set of paths closed after writing or moved into a
+            watched directory, empty if there were no such events.
+        """
+        written = set()
+        (ready, _w, _x) = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return written
+        try:
+            while True:
+                data = os.read(self.fd, 4096)
+                if not data:
+                    break
+                written.update(self._written(data))
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return written
+
+    def _written(self, data):
+        pos = 0
+        while pos + EVENT.size <= len(data):
+            (wd, mask, _cookie, length) = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if mask & WRITTEN_MASK and name and wd in self.watches:
+                yield os.path.join(self.watches[wd],
+                                   name.decode('utf-8', 'replace'))
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _existing_dir(path):
+    """Return the deepest existing directory that path would be in."""
+    parent = os.path.dirname(path)
+    while not os.path.isdir(parent):
+        grandparent = os.path.dirname(parent)
+        if grandparent == parent:
+            break
+        parent = grandparent
+    return parent
+
+
+def _watch_dirs(path):
+    dirs = set([_existing_dir(path)])
+    if os.path.islink(path):
+        # A dangling symlink, such as those under /dev/disk, exists once
+        # what it points to does.
+        dirs.add(_existing_dir(os.path.realpath(path)))
+    return dirs
+
+
+def _file_state(path):
+    """Return the size and mtime of path if it is a regular file."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return (st.st_size, st.st_mtime)
+
+
+def wait_for_paths(paths, maxwait, naplen=.5, exists=os.path.exists,
+                   settle=.5):
+    """Wait up to maxwait seconds for every one of paths to exist.
+
+    Paths are checked whenever the directories they would appear in
+    change, and at least every naplen seconds, which is also the polling
+    interval when inotify is not available.  A regular file only counts
+    once it was closed after writing or moved into place, or once its
+    size and mtime did not change for settle seconds.
+
+    @param paths: the paths to wait for.
+    @param maxwait: the most seconds to wait for.
+    @param naplen: the most seconds between checks.
+    @param exists: the check a path must pass, os.path.exists by default.
+    @param settle: the seconds a regular file not seen being closed must
+        stay unchanged for.
+    @return: the set of paths still missing.
+    """
+    # regular file paths to their last seen state and when it was seen
+    states = {}
+    written = set()
+
+    def complete(path):
+        if not exists(path):
+            return False
+        state = _file_state(path)
+        if state is None or path in written:
+            return True
+        seen = states.get(path)
+        now = time.time()
+        if seen is None or seen[0] != state:
+            states[path] = (state, now)
+            return False
+        return now - seen[1] >= settle
+
+    need = set(p for p in paths if not complete(p))
+    if not need:
+        return need
+    deadline = time.time() + maxwait
+    try:
+        inotify = Inotify()
+    except (AttributeError, OSError) as e:
+        LOG.debug("Polling for %s, inotify is not available: %s", need, e)
+        inotify = None
+
+    try:
+        while True:
+            if inotify:
+                try:
+                    for path in need:
+                        for dirname in _watch_dirs(path):
+                            inotify.watch(dirname)
+                except OSError as e:
+                    LOG.debug("Polling for %s, failed watching %s: %s",
+                              need, e.filename, e)
+                    inotify.close()
+                    inotify = None
+            # Check after watching, a path created in between is not missed.
+            need = set(p for p in need if not complete(p))
+            remaining = deadline - time.time()
+            if not need or remaining <= 0:
+                return need
+            timeout = min(naplen, remaining)
+            if need.intersection(states):
+                timeout = min(timeout, settle)
+            if inotify:
+                written.update(inotify.wait(timeout))
+            else:
+                time.sleep(timeout)
+    finally:
+        if inotify:
+            inotify.close()
+
+# vi: ts=4 expandtab
@@ -1,5 +1,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import mock
+
 from cloudinit import settings
 from cloudinit import sources
 from cloudinit import type_utils
@@ -23,6 +25,7 @@ from cloudinit.sources import (
     DataSourceSmartOS as SmartOS,
 )
 from cloudinit.sources import DataSourceNone as DSNone
+from cloudinit.reporting import events
 
 from cloudinit.tests import helpers as test_helpers
 
@@ -76,4 +79,92 @@ class ExpectedDataSources(test_helpers.TestCase):
         self.assertEqual(set([AliYun.DataSourceAliYun]), set(found))
 
 
+class _FakeDataSource(object):
+    """Records calls and returns the configured get_data result."""
+    result = False
+    probed = []
+
+    def __init__(self, sys_cfg, distro, paths):
+        pass
+
+    def get_data(self):
+        self.probed.append(type(self).__name__)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class DataSourceFail(_FakeDataSource):
+    result = False
+
+
+class DataSourceRaise(_FakeDataSource):
+    result = IOError("no metadata service")
+
+
+class DataSourceFirst(_FakeDataSource):
+    result = True
+
+
+class DataSourceSecond(_FakeDataSource):
+    result = True
+
+
+class TestFindSource(test_helpers.CiTestCase):
+
+    def setUp(self):
+        super(TestFindSource, self).setUp()
+        _FakeDataSource.probed = []
+        self.reporter = events.ReportEventStack(
+            "test", "testing find_source", reporting_enabled=False)
+
+    def _find(self, ds_list, sys_cfg=None):
+        with mock.patch.object(
+                sources, 'list_sources', return_value=ds_list):
+            return sources.find_source(
+                sys_cfg or {}, None, None, [sources.DEP_FILESYSTEM],
+                [], [], self.reporter)
+
+    def test_serial_returns_first_success_in_order(self):
+        """Serial discovery stops probing at the first success."""
+        ds, name = self._find(
+            [DataSourceFail, DataSourceRaise, DataSourceFirst,
+             DataSourceSecond])
+        self.assertIsInstance(ds, DataSourceFirst)
+        self.assertEqual('DataSourceFirst', name)
+        self.assertEqual(
+            ['DataSourceFail', 'DataSourceRaise', 'DataSourceFirst'],
+            _FakeDataSource.probed)
+
+    def test_parallel_prefers_earliest_in_list(self):
+        """Parallel discovery returns the highest priority success."""
+        cfg = {'datasource_discovery': {'mode': 'parallel'}}
+        ds, name = self._find(
+            [DataSourceFail, DataSourceRaise, DataSourceFirst,
+             DataSourceSecond], cfg)
+        self.assertIsInstance(ds, DataSourceFirst)
+        self.assertEqual('DataSourceFirst', name)
+
+    def test_parallel_reports_each_search(self):
+        """Each candidate gets its own reporting child event."""
+        cfg = {'datasource_discovery': {'mode': 'parallel',
+                                        'max_workers': 2}}
+        self._find([DataSourceFail, DataSourceRaise, DataSourceFirst], cfg)
+        self.assertEqual(
+            ('FAIL', 'no local data found from DataSourceRaise'),
+            self.reporter.children['search-Raise'])
+        self.assertEqual(
+            ('SUCCESS', 'no local data found from DataSourceFail'),
+            self.reporter.children['search-Fail'])
+        self.assertEqual(
+            ('SUCCESS', 'found local data from DataSourceFirst'),
+            self.reporter.children['search-First'])
+
+    def test_parallel_raises_when_nothing_found(self):
+        """Parallel discovery raises DataSourceNotFoundException."""
+        cfg = {'datasource_discovery': {'mode': 'parallel'}}
+        with self.assertRaises(sources.DataSourceNotFoundException):
+            self._find([DataSourceFail, DataSourceRaise], cfg)
+
+
 # vi: ts=4 expandtab
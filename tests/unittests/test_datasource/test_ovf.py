@@ -6,8 +6,10 @@
 
 import base64
 from collections import OrderedDict
+import os
 
 from cloudinit.tests import helpers as test_helpers
+from cloudinit import util
 
 from cloudinit.sources import DataSourceOVF as dsovf
 
@@ -233,5 +235,18 @@ class TestTransportIso9660(test_helpers.CiTestCase):
         self.assertTrue(dsovf.maybe_cdrom_device('/dev/xvda1'))
         self.assertTrue(dsovf.maybe_cdrom_device('xvdza1'))
 
+
+class TestWaitForImcCfgFile(test_helpers.CiTestCase):
+
+    def test_returns_path_once_the_file_exists(self):
+        """The config file path is returned, or None once maxwait passed."""
+        dirpath = self.tmp_dir()
+        self.assertIsNone(dsovf.wait_for_imc_cfg_file(
+            'cust.cfg', maxwait=.2, naplen=.1, dirpath=dirpath))
+        util.write_file(os.path.join(dirpath, 'cust.cfg'), '')
+        self.assertEqual(
+            os.path.join(dirpath, 'cust.cfg'),
+            dsovf.wait_for_imc_cfg_file('cust.cfg', dirpath=dirpath))
+
 #
 # vi: ts=4 expandtab
@@ -1,7 +1,8 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 from cloudinit import distros
-from cloudinit.tests.helpers import (TestCase, mock)
+from cloudinit.tests.helpers import (CiTestCase, TestCase, mock)
+from cloudinit import util
 
 
 class MyBaseDistro(distros.Distro):
@@ -10,7 +11,7 @@ class MyBaseDistro(distros.Distro):
     def __init__(self, name="basedistro", cfg={}, paths={}):
         super(MyBaseDistro, self).__init__(name, cfg, paths)
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         raise NotImplementedError()
 
     def _write_network(self, settings):
@@ -142,4 +143,128 @@ class TestCreateUser(TestCase):
             mock.call(['passwd', '-l', user])]
         self.assertEqual(m_subp.call_args_list, expected)
 
+
+@mock.patch("cloudinit.distros.util.system_is_snappy", return_value=False)
+@mock.patch("cloudinit.distros.util.subp")
+class TestCreateUsers(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestCreateUsers, self).setUp()
+        self.dist = MyBaseDistro()
+        for (name, ents) in (
+                ('pwd.getpwall', [mock.Mock(pw_name='root'),
+                                  mock.Mock(pw_name='old')]),
+                ('grp.getgrall', [mock.Mock(gr_name='adm', gr_mem=['old'])])):
+            patcher = mock.patch('cloudinit.distros.' + name,
+                                 return_value=ents)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('cloudinit.distros.util.is_user',
+                             return_value=False)
+        self.m_is_user = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_commands_are_batched(self, m_subp, m_is_snappy):
+        """Groups and users are created with one command each, passwords
+        are set with one command for all users."""
+        users = dict(('u%d' % i, {'plain_text_passwd': 'pw%d' % i,
+                                  'groups': 'adm, ops',
+                                  'sudo': 'ALL=(ALL) ALL'})
+                     for i in range(3))
+        users['old'] = {'lock_passwd': True}
+        with mock.patch.object(self.dist,
+                               'write_users_sudo_rules') as m_sudo:
+            self.dist.create_users(users, {'adm': ['u0', 'old', 'nobody']})
+        cmds = [c[0][0] for c in m_subp.call_args_list]
+        self.assertEqual(
+            [['groupadd', 'ops'], ['chpasswd'],
+             ['usermod', '-a', '-G', 'adm', 'u0']],
+            [c for c in cmds if c[0] not in ('useradd', 'passwd')])
+        self.assertEqual(
+            [['passwd', '-l', name] for name in ('old', 'u0', 'u1', 'u2')],
+            sorted(c for c in cmds if c[0] == 'passwd'))
+        self.assertEqual(3, len([c for c in cmds if c[0] == 'useradd']))
+        self.assertEqual(['u0:pw0', 'u1:pw1', 'u2:pw2'],
+                         sorted(m_subp.call_args_list[4][0][1].splitlines()))
+        self.assertEqual(1, m_sudo.call_count)
+        self.assertEqual(['u0', 'u1', 'u2'],
+                         sorted(u for (u, _r) in m_sudo.call_args[0][0]))
+
+    def test_invalid_sudo_rule_does_not_stop_other_users(
+            self, m_subp, m_is_snappy):
+        """An invalid sudo rule is raised once the rest is done."""
+        sudo_file = self.tmp_path('90-cloud-init-users')
+        self.dist.ci_sudoers_fn = sudo_file
+        users = {'good': {'sudo': 'ALL=(ALL) NOPASSWD:ALL',
+                          'ssh_authorized_keys': ['ssh-rsa AAAA good']},
+                 'bad': {'sudo': {'not': 'a rule'},
+                         'ssh_authorized_keys': ['ssh-rsa AAAA bad']}}
+        with mock.patch.object(self.dist, 'ensure_sudo_dir'):
+            with mock.patch.object(self.dist,
+                                   '_setup_user_keys') as m_keys:
+                with self.assertRaises(TypeError):
+                    self.dist.create_users(users)
+        self.assertIn('good ALL=(ALL) NOPASSWD:ALL', util.load_file(sudo_file))
+        self.assertNotIn('bad', util.load_file(sudo_file))
+        self.assertEqual(['bad', 'good'],
+                         sorted(c[0][0] for c in m_keys.call_args_list))
+        self.assertIn('Failed to write sudo rules', self.logs.getvalue())
+
+    def test_failed_step_does_not_stop_the_others(self, m_subp, m_is_snappy):
+        """A failing chpasswd does not keep keys from being set up."""
+        def subp(args, *_a, **_k):
+            if args[0] == 'chpasswd':
+                raise util.ProcessExecutionError(cmd=args)
+        m_subp.side_effect = subp
+        with mock.patch.object(self.dist, '_setup_user_keys') as m_keys:
+            with self.assertRaises(util.ProcessExecutionError):
+                self.dist.create_users(
+                    {'old': {'plain_text_passwd': 'pw',
+                             'ssh_authorized_keys': ['ssh-rsa AAAA old']}})
+        self.assertEqual(1, m_keys.call_count)
+
+    def test_members_not_enumerated_are_looked_up(self, m_subp, m_is_snappy):
+        """Group members getpwall does not list are looked up by name."""
+        self.m_is_user.side_effect = lambda name: name == 'ldapuser'
+        self.dist.create_users({}, {'adm': ['ldapuser', 'nobody']})
+        self.assertEqual(
+            [['usermod', '-a', '-G', 'adm', 'ldapuser']],
+            [c[0][0] for c in m_subp.call_args_list])
+        self.assertIn("Unable to add group member 'nobody'",
+                      self.logs.getvalue())
+
+    def test_locking_keeps_the_last_password_change(
+            self, m_subp, m_is_snappy):
+        """Passwords are locked with passwd -l, not by rewriting the hash,
+        so a forced password change (last change 0) is kept."""
+        shadow = self.tmp_path('shadow')
+        content = 'old:$6$salt$hash:0:0:99999:7:::\n'
+        util.write_file(shadow, content)
+
+        def passwd(args, *_a, **_k):
+            # passwd -l only prefixes the hash with '!'
+            (name, rest) = util.load_file(shadow).split(':', 1)
+            if args == ['passwd', '-l', name]:
+                util.write_file(shadow, name + ':!' + rest)
+        m_subp.side_effect = passwd
+        self.dist.create_users({'old': {'lock_passwd': True}})
+        self.assertEqual([mock.call(['passwd', '-l', 'old'])],
+                         m_subp.call_args_list)
+        self.assertEqual('old:!$6$salt$hash:0:0:99999:7:::\n',
+                         util.load_file(shadow))
+
+    def test_failed_lock_does_not_stop_locking_others(
+            self, m_subp, m_is_snappy):
+        """Every password is locked, the first failure is raised."""
+        def subp(args, *_a, **_k):
+            if args == ['passwd', '-l', 'a']:
+                raise util.ProcessExecutionError(cmd=args)
+        m_subp.side_effect = subp
+        with self.assertRaises(util.ProcessExecutionError):
+            self.dist.lock_passwds(['a', 'b'])
+        self.assertEqual([['passwd', '-l', 'a'], ['passwd', '-l', 'b']],
+                         [c[0][0] for c in m_subp.call_args_list])
+
 # vi: ts=4 expandtab
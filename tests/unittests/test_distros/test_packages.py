@@ -0,0 +1,68 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for the package queue of cloudinit.distros.Distro."""
+
+import pickle
+
+from cloudinit.distros import debian
+from cloudinit.tests.helpers import CiTestCase, mock
+
+
+class TestPackageQueue(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestPackageQueue, self).setUp()
+        self.distro = debian.Distro('ubuntu', {}, None)
+        patcher = mock.patch.object(self.distro, '_install_packages')
+        self.m_install = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_queued_packages_install_with_one_command(self):
+        """Queued packages are installed by one package command."""
+        self.distro.queue_packages(('puppet', '3.8'))
+        self.distro.queue_packages(['salt-minion', ('chef',)])
+        self.distro.install_queued_packages()
+        self.distro.install_packages(('salt-minion',))
+        self.distro.install_packages(['chef', ('puppet', '3.8')])
+        self.assertEqual(
+            [mock.call([('puppet', '3.8'), 'salt-minion', 'chef'])],
+            self.m_install.call_args_list)
+
+    def test_install_packages_only_installs_pkglist(self):
+        """Queued packages do not ride along with install_packages."""
+        self.distro.queue_packages(['ntp'])
+        self.distro.install_packages(['rhn-setup'])
+        self.assertEqual([mock.call(['rhn-setup'])],
+                         self.m_install.call_args_list)
+        self.distro.install_queued_packages()
+        self.assertEqual(mock.call(['ntp']), self.m_install.call_args)
+
+    def test_failed_batch_leaves_modules_to_install_their_own(self):
+        """A failing queued package does not fail the other modules."""
+        self.m_install.side_effect = [RuntimeError('no such package'), None]
+        self.distro.queue_packages(['bogus', 'ntp'])
+        with self.assertRaises(RuntimeError):
+            self.distro.install_queued_packages()
+        self.distro.install_packages(['ntp'])
+        self.assertEqual(
+            [mock.call(['bogus', 'ntp']), mock.call(['ntp'])],
+            self.m_install.call_args_list)
+
+    def test_discarded_packages_are_not_installed(self):
+        """Packages queued by modules which did not install are dropped."""
+        self.distro.queue_packages(['lxd'])
+        self.distro.discard_queued_packages()
+        self.distro.install_queued_packages()
+        self.assertEqual(0, self.m_install.call_count)
+
+    def test_queue_is_not_pickled(self):
+        """Distros pickled with a datasource restore an empty queue."""
+        distro = debian.Distro('ubuntu', {}, None)
+        distro.queue_packages(['lxd'])
+        restored = pickle.loads(pickle.dumps(distro))
+        self.assertEqual([], restored._queued_packages)
+        self.assertEqual('ubuntu', restored.name)
+
+# vi: ts=4 expandtab
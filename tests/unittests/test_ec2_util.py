@@ -185,4 +185,97 @@ class TestEc2Util(helpers.HttprettyTestCase):
         self.assertEqual(iam['info']['LastUpdated'], '2016-10-27T17:29:39Z')
         self.assertNotIn('security-credentials', iam)
 
+    @hp.activate
+    def test_metadata_fetch_concurrently(self):
+        base_url = 'http://169.254.169.254/%s/meta-data/' % (self.VERSION)
+        hp.register_uri(hp.GET, base_url, status=200,
+                        body="\n".join(['instance-id',
+                                        'block-device-mapping/']))
+        hp.register_uri(hp.GET, uh.combine_url(base_url, 'instance-id'),
+                        status=200, body='123')
+        hp.register_uri(hp.GET,
+                        uh.combine_url(base_url, 'block-device-mapping/'),
+                        status=200,
+                        body="\n".join(['ami', 'ephemeral0']))
+        hp.register_uri(hp.GET,
+                        uh.combine_url(base_url, 'block-device-mapping/ami'),
+                        status=200,
+                        body="sdb")
+        hp.register_uri(hp.GET,
+                        uh.combine_url(base_url,
+                                       'block-device-mapping/ephemeral0'),
+                        status=200,
+                        body="sdc")
+        md = eu.get_instance_metadata(self.VERSION, retries=0, timeout=0.1,
+                                      max_workers=4)
+        self.assertEqual(
+            {'instance-id': '123',
+             'block-device-mapping': {'ami': 'sdb', 'ephemeral0': 'sdc'}},
+            md)
+
+
+class TestMetadataMaterializer(helpers.CiTestCase):
+
+    base_url = 'http://169.254.169.254/latest/meta-data/'
+    tree = {
+        '': "\n".join(['instance-id', 'public-keys/', 'iam/',
+                       'network/']),
+        'instance-id': 'i-123',
+        'public-keys/': "\n".join(['0=my-key', '1=other-key']),
+        'public-keys/0/openssh-key': 'ssh-rsa AAAA my-key',
+        'public-keys/1/openssh-key': 'ssh-rsa BBBB other-key',
+        'iam/': "\n".join(['info', 'security-credentials/']),
+        'iam/info': '{"Code": "Success"}',
+        'iam/security-credentials/': 'ReadOnly',
+        'network/': 'interfaces/',
+        'network/interfaces/': 'macs/',
+        'network/interfaces/macs/': "\n".join(['0a:00/', '0a:01/']),
+        'network/interfaces/macs/0a:00/': "\n".join(['device-number',
+                                                     'local-ipv4s']),
+        'network/interfaces/macs/0a:00/device-number': '0',
+        'network/interfaces/macs/0a:00/local-ipv4s': '10.0.0.1\n10.0.0.2',
+        'network/interfaces/macs/0a:01/': 'device-number',
+        'network/interfaces/macs/0a:01/device-number': '1',
+    }
+
+    def _caller(self, fetched):
+        def caller(url):
+            path = url[len(self.base_url):]
+            fetched.append(path)
+            return self.tree[path].encode()
+        return caller
+
+    def _materialize(self, max_workers):
+        fetched = []
+        materializer = eu.MetadataMaterializer(
+            self.tree[''].encode(), self.base_url, self._caller(fetched),
+            max_workers=max_workers)
+        return (materializer.materialize(), fetched)
+
+    def test_concurrent_crawl_matches_sequential_crawl(self):
+        """Crawling concurrently produces exactly the sequential result."""
+        (expected, expected_fetched) = self._materialize(max_workers=1)
+        (md, fetched) = self._materialize(max_workers=4)
+        self.assertEqual(expected, md)
+        self.assertEqual(sorted(expected_fetched), sorted(fetched))
+        self.assertEqual(
+            {'0a:00': {'device-number': '0',
+                       'local-ipv4s': ['10.0.0.1', '10.0.0.2']},
+             '0a:01': {'device-number': '1'}},
+            md['network']['interfaces']['macs'])
+        self.assertEqual({'Code': 'Success'}, md['iam']['info'])
+
+    def test_concurrent_crawl_skips_security_credentials(self):
+        """security-credentials is neither fetched nor materialized."""
+        (md, fetched) = self._materialize(max_workers=4)
+        self.assertNotIn('security-credentials', md['iam'])
+        self.assertNotIn('iam/security-credentials/', fetched)
+
+    def test_concurrent_crawl_raises_fetch_errors(self):
+        """A failed fetch fails the crawl as it does sequentially."""
+        self.tree = dict(self.tree)
+        del self.tree['network/interfaces/macs/0a:01/device-number']
+        with self.assertRaises(KeyError):
+            self._materialize(max_workers=4)
+
 # vi: ts=4 expandtab
@@ -0,0 +1,79 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import logging
+import threading
+
+from cloudinit.config import cc_ssh
+from cloudinit import util
+from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+
+LOG = logging.getLogger(__name__)
+
+MODPATH = "cloudinit.config.cc_ssh."
+
+
+@mock.patch(MODPATH + "os.path.exists", return_value=False)
+@mock.patch(MODPATH + "util.ensure_dir")
+@mock.patch(MODPATH + "sys.stdout")
+class TestHandleGenerateKeys(CiTestCase):
+
+    with_logs = True
+
+    cfg = {'ssh_deletekeys': False, 'disable_root': False,
+           'ssh_genkeytypes': ['rsa', 'dsa', 'ecdsa', 'ed25519']}
+
+    def setUp(self):
+        super(TestHandleGenerateKeys, self).setUp()
+        self.cloud = mock.Mock()
+        self.cloud.get_public_ssh_keys.return_value = []
+        patcher = mock.patch(MODPATH + "apply_credentials")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @skipIf(not hasattr(threading, 'Barrier'), "needs threading.Barrier")
+    def test_keys_generated_concurrently_reported_in_order(
+            self, m_stdout, m_ensure_dir, m_exists):
+        """Key types run at once and their output keeps the config order."""
+        # Every key type must be running before any of them finishes.
+        started = threading.Barrier(4)
+        others_done = threading.Semaphore(0)
+
+        def subp(cmd, capture, env):
+            keytype = cmd[2]
+            started.wait(5)
+            if keytype == 'rsa':
+                # rsa finishes last, and is still written first.
+                for _ in range(3):
+                    others_done.acquire()
+            else:
+                others_done.release()
+            return ('%s output\n' % keytype, '')
+
+        with mock.patch(MODPATH + "util.subp", side_effect=subp):
+            cc_ssh.handle('cc_ssh', self.cfg, self.cloud, LOG, None)
+        self.assertEqual(
+            ['rsa output\n', 'dsa output\n', 'ecdsa output\n',
+             'ed25519 output\n'],
+            [c[0][0] for c in m_stdout.write.call_args_list])
+
+    def test_errors_are_handled_per_key_type(
+            self, m_stdout, m_ensure_dir, m_exists):
+        """Unknown and failing key types do not stop the others."""
+        def subp(cmd, capture, env):
+            if cmd[2] == 'dsa':
+                raise util.ProcessExecutionError(
+                    stderr='unknown key type dsa', exit_code=1)
+            if cmd[2] == 'ecdsa':
+                raise util.ProcessExecutionError(stderr='boom', exit_code=2)
+            return ('%s output\n' % cmd[2], '')
+
+        with mock.patch(MODPATH + "util.subp", side_effect=subp):
+            cc_ssh.handle('cc_ssh', self.cfg, self.cloud, LOG, None)
+        self.assertEqual(
+            ['rsa output\n', 'ed25519 output\n'],
+            [c[0][0] for c in m_stdout.write.call_args_list])
+        logs = self.logs.getvalue()
+        self.assertIn("ssh-keygen: unknown key type 'dsa'", logs)
+        self.assertIn("Failed generating key type ecdsa", logs)
+
+# vi: ts=4 expandtab
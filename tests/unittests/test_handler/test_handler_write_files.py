@@ -1,13 +1,17 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+from cloudinit.config import cc_write_files
 from cloudinit.config.cc_write_files import write_files, decode_perms
 from cloudinit import log as logging
+from cloudinit.reporting import events
 from cloudinit import util
 
-from cloudinit.tests.helpers import CiTestCase, FilesystemMockingTestCase
+from cloudinit.tests.helpers import CiTestCase, FilesystemMockingTestCase, mock
 
 import base64
+import errno
 import gzip
+import os
 import shutil
 import six
 import tempfile
@@ -98,6 +102,108 @@ class TestWriteFiles(FilesystemMockingTestCase):
         self.assertEqual(len(expected), flen_expected)
 
 
+class TestWriteFilesStreaming(FilesystemMockingTestCase):
+
+    def setUp(self):
+        super(TestWriteFilesStreaming, self).setUp()
+        self.tmp = self.tmp_dir()
+        self.patchUtils(self.tmp)
+
+    def test_large_content_is_decoded_in_chunks(self):
+        """gzip+base64 content larger than a chunk decodes as a whole."""
+        data = b''.join(os.urandom(16) * 64 for _ in range(256))
+        encoded = base64.b64encode(_gzip_bytes(data))
+        # Split in lines, as in a yaml block scalar.
+        content = b'\n'.join(encoded[i:i + 76]
+                             for i in range(0, len(encoded), 76))
+        with mock.patch.object(cc_write_files, 'CHUNK_SIZE', 1000):
+            write_files("test_stream", [{'content': content,
+                                         'encoding': 'gz+b64',
+                                         'path': '/tmp/large'}])
+        self.assertEqual(data, util.load_file('/tmp/large', decode=False))
+
+    def test_undecodable_content_leaves_file_untouched(self):
+        """A decoding error raises and leaves no partial file behind."""
+        util.write_file('/tmp/existing', 'old content')
+        with self.assertRaises(util.DecompressionError):
+            write_files("test_bad", [{'content': b'not gzip',
+                                      'encoding': 'gzip',
+                                      'path': '/tmp/existing'}])
+        self.assertEqual('old content', util.load_file('/tmp/existing'))
+        self.assertEqual(['existing'],
+                         os.listdir(os.path.join(self.tmp, 'tmp')))
+
+    def test_parallel_writes_keep_entry_order(self):
+        """Entries for the same path are written in order when parallel."""
+        files = [{'content': 'file %d\n' % i, 'path': '/tmp/f%d' % (i % 3)}
+                 for i in range(12)]
+        write_files("test_parallel", files, max_workers=4)
+        for i in range(3):
+            self.assertEqual('file %d\n' % (9 + i),
+                             util.load_file('/tmp/f%d' % i))
+
+    @mock.patch('cloudinit.reporting.events.report_event')
+    def test_throughput_reported_per_file(self, m_report):
+        """Each file has finish events with its size, under the module's."""
+        init = events.ReportEventStack('init', 'init')
+        with events.ReportEventStack('config-write_files', 'module',
+                                     parent=init) as reporter:
+            write_files("write_files",
+                        [{'content': 'abc', 'path': '/tmp/a'},
+                         {'content': 'defg', 'path': '/tmp/b'}],
+                        reporter=reporter, max_workers=2)
+        finished = dict(
+            (c[0][0].name, c[0][0].description)
+            for c in m_report.call_args_list
+            if c[0][0].event_type == 'finish')
+        self.assertIn('wrote 3 bytes to',
+                      finished['init/config-write_files/write-file-1'])
+        self.assertIn('wrote 4 bytes to',
+                      finished['init/config-write_files/write-file-2'])
+        self.assertIn('KiB/s',
+                      finished['init/config-write_files/write-file-2'])
+
+    def test_nul_padded_gzip_is_accepted(self):
+        """NUL padding after a gzip member is ignored, as by GzipFile."""
+        content = _gzip_bytes(b'one\n') + b'\0' * 10 + _gzip_bytes(b'two\n')
+        write_files("test_padded", [{'content': content + b'\0' * 512,
+                                     'encoding': 'gzip',
+                                     'path': '/tmp/padded'}])
+        self.assertEqual('one\ntwo\n', util.load_file('/tmp/padded'))
+
+    def test_dangling_link_to_missing_dir_raises(self):
+        """A symlink into a missing directory raises ENOENT, no dirs made."""
+        util.ensure_dir(os.path.join(self.tmp, 'etc'))
+        os.symlink(os.path.join(self.tmp, 'missing', 'target'),
+                   os.path.join(self.tmp, 'etc', 'link'))
+        with self.assertRaises((IOError, OSError)) as ctx:
+            write_files("test_link", [{'content': 'x',
+                                       'path': '/etc/link'}])
+        self.assertEqual(errno.ENOENT, ctx.exception.errno)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'missing')))
+
+    def test_hard_linked_file_is_written_in_place(self):
+        """Every hard link of a file sees its new content."""
+        util.write_file('/tmp/linked', 'old')
+        os.link(os.path.join(self.tmp, 'tmp', 'linked'),
+                os.path.join(self.tmp, 'tmp', 'other'))
+        write_files("test_hard", [{'content': 'new', 'path': '/tmp/linked'}])
+        self.assertEqual('new', util.load_file('/tmp/other'))
+        self.assertEqual(['linked', 'other'],
+                         sorted(os.listdir(os.path.join(self.tmp, 'tmp'))))
+
+    def test_write_in_place_when_rename_fails(self):
+        """A file that can not be renamed over is rewritten in place."""
+        util.write_file('/tmp/mounted', 'old')
+        with mock.patch('cloudinit.util.os.rename',
+                        side_effect=OSError(errno.EBUSY, 'busy')):
+            write_files("test_busy", [{'content': 'new',
+                                       'path': '/tmp/mounted'}])
+        self.assertEqual('new', util.load_file('/tmp/mounted'))
+        self.assertEqual(['mounted'],
+                         os.listdir(os.path.join(self.tmp, 'tmp')))
+
+
 class TestDecodePerms(CiTestCase):
 
     with_logs = True
@@ -5,8 +5,12 @@
 import os
 
 from cloudinit.tests import helpers as test_helpers
+from cloudinit.tests.helpers import mock
 
+from cloudinit import helpers
+from cloudinit.settings import PER_ALWAYS, PER_INSTANCE, PER_ONCE
 from cloudinit import sources
+from cloudinit import util
 
 
 class MyDataSource(sources.DataSource):
@@ -34,4 +38,111 @@ class TestPaths(test_helpers.ResourceUsingTestCase):
 
         self.assertIsNone(mypaths.get_ipath())
 
+
+class TestFileSemaphores(test_helpers.CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestFileSemaphores, self).setUp()
+        self.sem_path = os.path.join(self.tmp_dir(), 'sem')
+        self.sems = helpers.FileSemaphores(self.sem_path)
+
+    def run_once(self, sems, name, freq=PER_INSTANCE):
+        with sems.lock(name, freq) as lk:
+            return lk
+
+    def test_runs_are_journaled(self):
+        """A run appends one record to the journal, no file per run."""
+        self.assertFalse(self.sems.has_run('config_a', PER_INSTANCE))
+        self.assertTrue(self.run_once(self.sems, 'config_a'))
+        self.assertTrue(self.run_once(self.sems, 'config_b', PER_ONCE))
+        self.assertTrue(self.sems.has_run('config_a', PER_INSTANCE))
+        self.assertTrue(self.sems.has_run('config_b', PER_ONCE))
+        self.assertFalse(self.sems.has_run('config_b', PER_INSTANCE))
+        self.assertFalse(self.sems.has_run('config_a', PER_ALWAYS))
+        self.assertEqual(['.journal'], os.listdir(self.sem_path))
+        records = [line.split('\t')[:2] for line in
+                   util.load_file(self.sems.journal).splitlines()]
+        self.assertEqual(
+            [['+', 'config_a'], ['+', 'config_b.once']], records)
+
+    def test_clear_through_symlink_is_seen(self):
+        """Clearing through a symlink is seen by the object for the dir."""
+        link = os.path.join(self.tmp_dir(), 'instance-sem')
+        os.symlink(self.sem_path, link)
+        self.assertTrue(self.run_once(self.sems, 'config_a'))
+        self.assertTrue(self.sems.has_run('config_a', PER_INSTANCE))
+        linked = helpers.FileSemaphores(link)
+        self.assertTrue(linked.clear('config_a', PER_INSTANCE))
+        self.assertFalse(self.sems.has_run('config_a', PER_INSTANCE))
+        self.assertTrue(self.run_once(self.sems, 'config_a'))
+
+    def test_shared_by_real_path(self):
+        """file_semaphores returns one object for paths to the same dir."""
+        util.ensure_dir(self.sem_path)
+        link = os.path.join(self.tmp_dir(), 'instance-sem')
+        os.symlink(self.sem_path, link)
+        self.assertIs(helpers.file_semaphores(self.sem_path),
+                      helpers.file_semaphores(link))
+
+    def test_second_lock_fails(self):
+        """A lock is only acquired once, also from another process."""
+        self.assertTrue(self.run_once(self.sems, 'config_a'))
+        self.assertIsNone(self.run_once(self.sems, 'config_a'))
+        other = helpers.FileSemaphores(self.sem_path)
+        other.has_run('config_b', PER_INSTANCE)
+        self.assertTrue(self.run_once(self.sems, 'config_b'))
+        self.assertIsNone(self.run_once(other, 'config_b'))
+
+    def test_clear(self):
+        """Clearing records it in the journal and removes legacy files."""
+        util.write_file(os.path.join(self.sem_path, 'config_b'), 'legacy')
+        self.run_once(self.sems, 'config_a')
+        self.assertTrue(self.sems.clear('config_a', PER_INSTANCE))
+        self.assertTrue(self.sems.clear('config_b', PER_INSTANCE))
+        for sems in (self.sems, helpers.FileSemaphores(self.sem_path)):
+            self.assertFalse(sems.has_run('config_a', PER_INSTANCE))
+            self.assertFalse(sems.has_run('config_b', PER_INSTANCE))
+        self.assertEqual(['.journal'], os.listdir(self.sem_path))
+
+    def test_clear_on_fail(self):
+        """A failed run with clear_on_fail can run again."""
+        with self.assertRaises(RuntimeError):
+            with self.sems.lock('config_a', PER_INSTANCE, True):
+                raise RuntimeError()
+        self.assertFalse(self.sems.has_run('config_a', PER_INSTANCE))
+        self.assertTrue(self.run_once(self.sems, 'config_a'))
+
+    def test_legacy_files(self):
+        """Semaphore files written before the journal count as run."""
+        util.write_file(os.path.join(self.sem_path, 'config_a'), 'legacy')
+        util.write_file(os.path.join(self.sem_path, 'config_b-c.once'), '')
+        self.assertTrue(self.sems.has_run('config_a', PER_INSTANCE))
+        self.assertTrue(self.sems.has_run('config_b-c', PER_ONCE))
+        self.assertIn('likely the migrator has not yet run',
+                      self.logs.getvalue())
+
+    def test_partial_records_are_ignored(self):
+        """A record is only read once its line is complete."""
+        util.write_file(self.sems.journal, '+\tconfig_a\t1\t1\n+\tconf')
+        self.assertTrue(self.sems.has_run('config_a', PER_INSTANCE))
+        self.assertFalse(self.sems.has_run('conf', PER_INSTANCE))
+
+    def test_runners_share_semaphores(self):
+        """Runners read each semaphore directory only once."""
+        # Creating the journal changes the directory, which is read again.
+        util.write_file(self.sems.journal, '')
+        paths = mock.Mock()
+        paths.get_ipath.return_value = self.sem_path
+        with mock.patch('cloudinit.helpers.os.listdir',
+                        return_value=[]) as m_listdir:
+            for _ in range(3):
+                runners = helpers.Runners(paths)
+                runners.run('config_a', lambda: None, [], PER_INSTANCE)
+        self.assertEqual(1, m_listdir.call_count)
+        self.assertTrue(
+            helpers.file_semaphores(self.sem_path).has_run(
+                'config_a', PER_INSTANCE))
+
 # vi: ts=4 expandtab
@@ -6,9 +6,11 @@ from cloudinit.handlers import cloud_config
 from cloudinit.handlers import (CONTENT_START, CONTENT_END)
 
 from cloudinit import helpers as c_helpers
+from cloudinit import mergers
 from cloudinit import util
 
 import collections
+import copy
 import glob
 import os
 import random
@@ -258,4 +260,48 @@ class TestSimpleRun(helpers.ResourceUsingTestCase):
         d = util.mergemanydict([a, b])
         self.assertEqual(c, d)
 
+
+class TestCompiledMerge(helpers.TestCase):
+
+    def test_plans_are_compiled_once(self):
+        """Merger modules are found once per distinct merge_how."""
+        parsed = mergers.string_extract_mergers(
+            'dict(recurse_array)+list(append)')
+        mergers.compile_plan(parsed)
+        with helpers.mock.patch('cloudinit.mergers.importer') as m_importer:
+            for _ in range(3):
+                merger = mergers.construct(parsed)
+                self.assertEqual({'a': [1, 2]},
+                                 merger.merge({'a': [1]}, {'a': [2]}))
+        self.assertEqual(0, m_importer.find_module.call_count)
+
+    def test_unhashable_settings_are_not_cached(self):
+        """merge_how given as dicts with settings still constructs."""
+        cfg = {'merge_how': [{'name': 'dict', 'settings': {'replace': 1}}],
+               'a': 2}
+        self.assertEqual({'a': 2}, util.mergemanydict([cfg, {'a': 1}]))
+
+    def test_sources_are_not_changed(self):
+        """Merging in place never changes the dicts being merged."""
+        shared = {'x': {'y': 1}}
+        srcs = [{'a': shared, 'b': shared, 'l': [shared]},
+                {'a': {'x': {'z': 2}}, 'c': 1},
+                {'b': {'x': {'w': 3}}, 'a': {'x': {'v': 4}}}]
+        expected = copy.deepcopy(srcs)
+        merged = util.mergemanydict(srcs)
+        self.assertEqual(expected, srcs)
+        self.assertEqual({'y': 1, 'z': 2, 'v': 4}, merged['a']['x'])
+        self.assertEqual({'y': 1, 'w': 3}, merged['b']['x'])
+        self.assertIs(shared, merged['l'][0])
+
+    def test_matches_copying_merge(self):
+        """Merging in place gives the results of copying every level."""
+        for seed in range(1, 20):
+            srcs = [make_dict(5, seed * j) for j in range(1, 8)]
+            copying = {}
+            for src in copy.deepcopy(srcs):
+                merger = mergers.construct(mergers.default_mergers())
+                copying = merger.merge(copying, src)
+            self.assertEqual(copying, util.mergemanydict(srcs))
+
 # vi: ts=4 expandtab
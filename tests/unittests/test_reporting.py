@@ -5,10 +5,14 @@
 from cloudinit import reporting
 from cloudinit.reporting import events
 from cloudinit.reporting import handlers
+from cloudinit import url_helper
+from cloudinit import util
 
+import json
 import mock
+import os
 
-from cloudinit.tests.helpers import TestCase
+from cloudinit.tests.helpers import CiTestCase, TestCase
 
 
 def _fake_registry():
@@ -155,6 +159,97 @@ class TestLogHandler(TestCase):
                       getLogger.return_value.log.call_args[0][1])
 
 
+class TestProfileHandler(CiTestCase):
+
+    def setUp(self):
+        super(TestProfileHandler, self).setUp()
+        self.trace_file = os.path.join(self.tmp_dir(), 'trace.json')
+        self.handler = handlers.ProfileHandler(trace_file=self.trace_file)
+
+    def publish(self, event_type, name, result=events.status.SUCCESS):
+        if event_type == 'start':
+            event = events.ReportingEvent('start', name, 'desc ' + name)
+        else:
+            event = events.FinishReportingEvent(name, 'desc ' + name, result)
+        self.handler.publish_event(event)
+
+    def test_trace_written_when_top_level_event_finishes(self):
+        """Records are flushed only when a stage finishes."""
+        self.publish('start', 'init-local')
+        self.publish('start', 'init-local/search-NoCloud')
+        self.publish('finish', 'init-local/search-NoCloud')
+        self.assertFalse(os.path.exists(self.trace_file))
+        self.publish('finish', 'init-local')
+        trace = handlers.load_trace(self.trace_file)
+        self.assertEqual(handlers.TRACE_VERSION, trace['version'])
+        self.assertEqual(['init-local/search-NoCloud', 'init-local'],
+                         [r['name'] for r in trace['events']])
+        for record in trace['events']:
+            self.assertLessEqual(record['start'], record['end'])
+            self.assertEqual('SUCCESS', record['result'])
+
+    def test_trace_counts_subprocesses_and_bytes_fetched(self):
+        """Resource counters are reported as deltas for each event."""
+        self.publish('start', 'init')
+        util.SUBP_COUNT.add(2)
+        url_helper.BYTES_FETCHED.add(1024)
+        self.publish('finish', 'init')
+        [record] = handlers.load_trace(self.trace_file)['events']
+        self.assertEqual(2, record['subprocesses'])
+        self.assertEqual(1024, record['bytes_fetched'])
+
+    def test_trace_appends_to_earlier_stages(self):
+        """A later stage, possibly another process, appends its records."""
+        self.publish('start', 'init-local')
+        self.publish('finish', 'init-local')
+        handler = handlers.ProfileHandler(trace_file=self.trace_file)
+        handler.publish_event(events.ReportingEvent('start', 'init', 'd'))
+        handler.publish_event(events.FinishReportingEvent(
+            'init', 'd', events.status.FAIL))
+        trace = handlers.load_trace(self.trace_file)
+        self.assertEqual(
+            [('init-local', 'SUCCESS'), ('init', 'FAIL')],
+            [(r['name'], r['result']) for r in trace['events']])
+
+    def test_stages_are_appended_without_reading_the_trace(self):
+        """Each stage appends a json line per record, only the header of
+        the trace is read and only once."""
+        with mock.patch.object(handlers, 'load_trace_header',
+                               wraps=handlers.load_trace_header) as m_head:
+            for stage in ('init-local', 'init', 'modules-final'):
+                self.publish('start', stage)
+                self.publish('finish', stage)
+        self.assertEqual(1, m_head.call_count)
+        lines = util.load_file(self.trace_file).splitlines()
+        self.assertEqual({'version': handlers.TRACE_VERSION},
+                         json.loads(lines[0]))
+        self.assertEqual(['init-local', 'init', 'modules-final'],
+                         [json.loads(line)['name'] for line in lines[1:]])
+
+    def test_truncated_record_is_skipped(self):
+        """A partly written last record does not make the trace unusable."""
+        self.publish('start', 'init')
+        self.publish('finish', 'init')
+        util.append_file(self.trace_file, '{"name": "modu')
+        trace = handlers.load_trace(self.trace_file)
+        self.assertEqual(['init'], [r['name'] for r in trace['events']])
+
+    def test_unknown_trace_version_is_replaced(self):
+        """A trace with another version is not loaded or extended."""
+        util.write_file(self.trace_file, json.dumps(
+            {'version': 'bogus', 'events': [{'name': 'old'}]}))
+        self.assertIsNone(handlers.load_trace(self.trace_file))
+        self.publish('start', 'init')
+        self.publish('finish', 'init')
+        trace = handlers.load_trace(self.trace_file)
+        self.assertEqual(['init'], [r['name'] for r in trace['events']])
+
+    def test_unmatched_finish_is_ignored(self):
+        """A finish without a start is not recorded."""
+        self.publish('finish', 'init')
+        self.assertFalse(os.path.exists(self.trace_file))
+
+
 class TestDefaultRegisteredHandler(TestCase):
 
     def test_log_handler_registered_by_default(self):
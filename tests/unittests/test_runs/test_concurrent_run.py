@@ -0,0 +1,205 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests running config modules concurrently."""
+
+import threading
+import types
+
+from cloudinit import config
+from cloudinit.reporting import events
+from cloudinit.settings import PER_ALWAYS, RES_CONSOLE, RES_NETWORK
+from cloudinit import stages
+from cloudinit.tests.helpers import CiTestCase, mock
+
+
+def make_module(name, handle, **attrs):
+    mod = types.ModuleType('cc_' + name)
+    mod.handle = handle
+    mod.frequency = PER_ALWAYS
+    for (attr, value) in attrs.items():
+        setattr(mod, attr, value)
+    return [config.fixup_module(mod), name, None, []]
+
+
+def run_functor(_name, functor, args, freq=None):
+    return (True, functor(*args))
+
+
+class TestConcurrentModules(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestConcurrentModules, self).setUp()
+        init = mock.Mock()
+        init.cloudify.return_value.run.side_effect = run_functor
+        self.mods = stages.Modules(init)
+        self.mods._cached_cfg = {}
+
+    def test_independent_modules_overlap(self):
+        """Modules using different resources run at the same time."""
+        started = threading.Event()
+        order = []
+
+        def slow(*_args):
+            started.set()
+            order.append(('slow', started.is_set()))
+
+        def waits(*_args):
+            order.append(('waits', started.wait(5)))
+
+        mostly_mods = [
+            make_module('waits', waits, reads=[RES_NETWORK]),
+            make_module('slow', slow, writes=[RES_CONSOLE])]
+        (which_ran, failures) = self.mods._run_modules(mostly_mods, 2)
+        self.assertEqual((['waits', 'slow'], []), (which_ran, failures))
+        self.assertIn(('waits', True), order)
+
+    def test_conflicting_modules_keep_list_order(self):
+        """Conflicting and undeclared modules run one after another."""
+        order = []
+
+        def handle(name, *_args):
+            order.append(name)
+
+        mostly_mods = [
+            make_module('first', handle, writes=[RES_CONSOLE]),
+            make_module('undeclared', handle),
+            make_module('second', handle, writes=['/etc/second']),
+            make_module('third', handle, reads=['/etc/second/third'])]
+        self.mods._run_modules(mostly_mods, 4)
+        self.assertEqual(['first', 'undeclared', 'second', 'third'], order)
+
+    def test_events_reported_live_failures_in_list_order(self):
+        """Events are reported as modules finish, failures in list order."""
+        fast_done = threading.Event()
+        finished = []
+
+        def report_finish(name, _desc, result, **_kwargs):
+            finished.append((name, result))
+            if name.endswith('config-fast'):
+                fast_done.set()
+
+        def slow(*_args):
+            fast_done.wait(5)
+            raise RuntimeError('slow failed')
+
+        def fast(*_args):
+            raise RuntimeError('fast failed')
+
+        mostly_mods = [
+            make_module('slow', slow, writes=['/slow']),
+            make_module('fast', fast, writes=['/fast'])]
+        path = 'cloudinit.reporting.events.'
+        self.mods.reporter.reporting_enabled = True
+        with mock.patch(path + 'report_start_event') as m_start:
+            with mock.patch(path + 'report_finish_event',
+                            side_effect=report_finish):
+                (which_ran, failures) = self.mods._run_modules(
+                    mostly_mods, 2)
+        self.assertEqual(['slow', 'fast'], which_ran)
+        self.assertEqual(['slow failed', 'fast failed'],
+                         [str(exc) for (_name, exc) in failures])
+        self.assertEqual(
+            set(['module-reporter/config-slow',
+                 'module-reporter/config-fast']),
+            set(c[0][0] for c in m_start.call_args_list))
+        self.assertEqual(
+            [('module-reporter/config-fast', events.status.FAIL),
+             ('module-reporter/config-slow', events.status.FAIL)],
+            finished)
+        self.assertIn('Running module fast', self.logs.getvalue())
+
+    def test_modules_report_under_their_own_event(self):
+        """cloud.reporter of a module is the module's event."""
+        reporters = []
+
+        def handle(_name, _cfg, cloud, *_args):
+            reporters.append(cloud.reporter.fullname)
+
+        mostly_mods = [make_module('first', handle, writes=['/first']),
+                       make_module('second', handle, writes=['/second'])]
+        self.mods._run_modules(mostly_mods, 2)
+        self.mods._run_modules(mostly_mods[:1], 1)
+        self.assertEqual(
+            ['module-reporter/config-first', 'module-reporter/config-first',
+             'module-reporter/config-second'], sorted(reporters))
+
+    def test_module_workers_from_config(self):
+        """module_workers sets the concurrency of each section."""
+        self.mods._cached_cfg = {
+            'cloud_final_modules': [], 'cloud_config_modules': [],
+            'module_workers': {'cloud_config_modules': 3}}
+        with mock.patch.object(self.mods, '_run_modules') as m_run:
+            self.mods.run_section('cloud_config_modules')
+            self.mods.run_section('cloud_final_modules')
+            self.mods.run_section('cloud_init_modules')
+        self.assertEqual([3, 1, 1],
+                         [c[0][1] for c in m_run.call_args_list])
+
+
+class TestModulePackageQueue(CiTestCase):
+
+    def test_modules_about_to_run_queue_packages(self):
+        """queue_packages of modules that have not run is called first."""
+        order = []
+
+        def queue(name, *_args):
+            order.append(('queue', name))
+
+        def handle(name, *_args):
+            order.append(('handle', name))
+
+        init = mock.Mock()
+        cc = init.cloudify.return_value
+        cc.run.side_effect = run_functor
+        cc.has_run.side_effect = lambda name, _freq: name == 'config-ran'
+        mods = stages.Modules(init)
+        mods._cached_cfg = {}
+        mostly_mods = [
+            make_module('first', handle, queue_packages=queue),
+            make_module('ran', handle, queue_packages=queue),
+            make_module('second', handle, queue_packages=queue)]
+        mods._run_modules(mostly_mods)
+        self.assertEqual(
+            [('queue', 'first'), ('queue', 'second'), ('handle', 'first'),
+             ('handle', 'ran'), ('handle', 'second')], order)
+        cc.distro.install_queued_packages.assert_called_once_with()
+        cc.distro.discard_queued_packages.assert_called_once_with()
+
+    def test_queued_packages_install_after_package_sources(self):
+        """Queued packages install once package sources are set up."""
+        order = []
+
+        def queue(name, *_args):
+            order.append(('queue', name))
+
+        def handle(name, *_args):
+            order.append(('handle', name))
+
+        for workers in (1, 3):
+            del order[:]
+            init = mock.Mock()
+            cc = init.cloudify.return_value
+            cc.run.side_effect = run_functor
+            cc.has_run.return_value = False
+            cc.distro.install_queued_packages.side_effect = (
+                lambda: order.append(('install', 'queued')))
+            mods = stages.Modules(init)
+            mods._cached_cfg = {}
+            mostly_mods = [
+                make_module('spacewalk', handle, queue_packages=queue),
+                make_module('yum-add-repo', handle, writes=[]),
+                make_module('ntp', handle, queue_packages=queue,
+                            writes=[]),
+                make_module('runcmd', handle, writes=[])]
+            mods._run_modules(mostly_mods, workers)
+            self.assertEqual(
+                [('queue', 'ntp'), ('handle', 'spacewalk'),
+                 ('handle', 'yum-add-repo'), ('install', 'queued')],
+                order[:4])
+            self.assertEqual(
+                set([('handle', 'ntp'), ('handle', 'runcmd')]),
+                set(order[4:]))
+
+# vi: ts=4 expandtab
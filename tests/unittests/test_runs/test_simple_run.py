@@ -149,4 +149,40 @@ class TestSimpleRun(helpers.FilesystemMockingTestCase):
             "running unverified_modules: 'spacewalk'",
             self.logs.getvalue())
 
+    def test_none_ds_is_cached_as_json_and_restored(self):
+        """The datasource is cached as json and restored on the next run."""
+        initer = stages.Init()
+        initer.read_cfg()
+        initer.initialize()
+        initer.fetch()
+        initer.instancify()
+        self.assertTrue(os.path.exists('/var/lib/cloud/instance/obj.json'))
+        self.assertFalse(os.path.exists('/var/lib/cloud/instance/obj.pkl'))
+
+        restored = stages.Init()
+        restored.read_cfg()
+        restored.fetch(existing='trust')
+        self.assertTrue(restored.ds_restored)
+        self.assertEqual('iid-datasource-none',
+                         restored.datasource.get_instance_id())
+
+    def test_pickled_cache_is_migrated_to_json(self):
+        """A pickle from an older version is restored and migrated."""
+        initer = stages.Init()
+        initer.read_cfg()
+        initer.initialize()
+        initer.fetch()
+        initer.instancify()
+        util.del_file('/var/lib/cloud/instance/obj.json')
+        self.assertTrue(stages._pkl_store(
+            initer.datasource, '/var/lib/cloud/instance/obj.pkl'))
+
+        restored = stages.Init()
+        restored.read_cfg()
+        restored.fetch(existing='trust')
+        self.assertTrue(restored.ds_restored)
+        restored.instancify()
+        self.assertTrue(os.path.exists('/var/lib/cloud/instance/obj.json'))
+        self.assertFalse(os.path.exists('/var/lib/cloud/instance/obj.pkl'))
+
 # vi: ts=4 expandtab
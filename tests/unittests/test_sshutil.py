@@ -1,9 +1,14 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import os
+import stat
+
+import mock
 from mock import patch
 
 from cloudinit import ssh_util
 from cloudinit.tests import helpers as test_helpers
+from cloudinit import util
 
 
 VALID_CONTENT = {
@@ -126,6 +131,112 @@ class TestAuthKeyLineParser(test_helpers.TestCase):
         self.assertFalse(key.valid())
 
 
+class TestAuthorizedKeys(test_helpers.TestCase):
+
+    def parse(self, *lines):
+        parser = ssh_util.AuthKeyLineParser()
+        return [parser.parse(line) for line in lines]
+
+    def test_merge_replaces_in_place_and_appends(self):
+        """Known keys are replaced where they are, new ones appended."""
+        old = self.parse('# comment', 'rsa %s old' % VALID_CONTENT['rsa'],
+                         'dsa %s' % VALID_CONTENT['dsa'])
+        new = self.parse('ecdsa %s added' % VALID_CONTENT['ecdsa'],
+                         'rsa %s new' % VALID_CONTENT['rsa'])
+        self.assertEqual(
+            '\n'.join(['# comment', 'rsa %s new' % VALID_CONTENT['rsa'],
+                       'dsa %s' % VALID_CONTENT['dsa'],
+                       'ecdsa %s added' % VALID_CONTENT['ecdsa'], '']),
+            ssh_util.update_authorized_keys(old, new))
+
+    def test_merge_reports_changes(self):
+        """Merging keys already present as they are changes nothing."""
+        content = 'rsa %s user@host\n' % VALID_CONTENT['rsa']
+        auth_keys = ssh_util.AuthorizedKeys(self.parse(content), content)
+        self.assertFalse(auth_keys.merge(self.parse(content)))
+        self.assertTrue(auth_keys.merge(
+            self.parse('dsa %s' % VALID_CONTENT['dsa'])))
+
+    def test_merge_replaces_every_duplicate(self):
+        """Each entry with a merged key is replaced, not just the first."""
+        rsa = 'rsa %s' % VALID_CONTENT['rsa']
+        old = self.parse(rsa + ' one', '# comment', rsa + ' two')
+        self.assertEqual(
+            '\n'.join([rsa + ' new', '# comment', rsa + ' new', '']),
+            ssh_util.update_authorized_keys(old, self.parse(rsa + ' new')))
+
+    def test_merge_many_keys(self):
+        """Duplicate keys collapse to the last one, at the first position."""
+        keys = ['ssh-rsa AAAA%05d key-%d' % (i, i) for i in range(5000)]
+        auth_keys = ssh_util.AuthorizedKeys(self.parse(*keys))
+        auth_keys.merge(self.parse(*(keys + ['ssh-rsa AAAA00000 last'])))
+        self.assertEqual(5000, len(auth_keys))
+        self.assertEqual('last', auth_keys.entries[0].comment)
+
+
+class TestSetupUserKeys(test_helpers.CiTestCase):
+
+    def setUp(self):
+        super(TestSetupUserKeys, self).setUp()
+        self.ssh_dir = self.tmp_path('.ssh')
+        self.key_fn = os.path.join(self.ssh_dir, 'authorized_keys')
+        pwent = mock.Mock(pw_dir=self.tmp_dir(), pw_uid=1, pw_gid=1)
+        for (name, kwargs) in (
+                ('users_ssh_info', {'return_value': (self.ssh_dir, pwent)}),
+                ('_authorized_keys_file', {'return_value': self.key_fn})):
+            patcher = mock.patch.object(ssh_util, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('cloudinit.ssh_util.util.chownbyid')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_file_is_parsed_once_and_written_when_changed(self):
+        """Callers share one parse and unchanged keys are not rewritten."""
+        rsa = 'rsa %s user@host' % VALID_CONTENT['rsa']
+        with mock.patch.object(ssh_util, 'load_authorized_keys_file',
+                               wraps=ssh_util.load_authorized_keys_file) as m:
+            ssh_util.setup_user_keys([rsa], 'user')
+            self.assertEqual(rsa + '\n', util.load_file(self.key_fn))
+            with mock.patch.object(ssh_util.atomic_helper,
+                                   'write_file') as m_write:
+                ssh_util.setup_user_keys([rsa], 'user')
+            self.assertEqual(0, m_write.call_count)
+            (key_fn, entries) = ssh_util.extract_authorized_keys('user')
+            self.assertEqual(1, m.call_count)
+        self.assertEqual(self.key_fn, key_fn)
+        self.assertEqual([rsa], [str(ent) for ent in entries])
+
+    def test_keys_changed_on_disk_are_parsed_again(self):
+        """A file written by something else is not served from the cache."""
+        ssh_util.setup_user_keys(['rsa %s' % VALID_CONTENT['rsa']], 'user')
+        dsa = 'dsa %s user@host' % VALID_CONTENT['dsa']
+        util.write_file(self.key_fn, dsa + '\n')
+        (_key_fn, auth_keys) = ssh_util.load_authorized_keys('user')
+        self.assertEqual([dsa], [str(ent) for ent in auth_keys])
+
+    def test_unchanged_keys_still_get_their_modes(self):
+        """The directory and file modes are set when nothing changed."""
+        rsa = 'rsa %s user@host' % VALID_CONTENT['rsa']
+        ssh_util.setup_user_keys([rsa], 'user')
+        os.chmod(self.ssh_dir, 0o755)
+        os.chmod(self.key_fn, 0o644)
+        ssh_util.setup_user_keys([rsa], 'user')
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self.ssh_dir).st_mode))
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.key_fn).st_mode))
+
+    def test_symlinked_file_is_written_through(self):
+        """A symlinked authorized_keys is updated where it points to."""
+        target = self.tmp_path('shared_keys')
+        util.write_file(target, '')
+        util.ensure_dir(self.ssh_dir)
+        os.symlink(target, self.key_fn)
+        rsa = 'rsa %s user@host' % VALID_CONTENT['rsa']
+        ssh_util.setup_user_keys([rsa], 'user')
+        self.assertTrue(os.path.islink(self.key_fn))
+        self.assertEqual(rsa + '\n', util.load_file(target))
+
+
 class TestParseSSHConfig(test_helpers.TestCase):
 
     def setUp(self):
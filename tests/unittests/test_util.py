@@ -2,6 +2,7 @@
 
 from __future__ import print_function
 
+import json
 import logging
 import os
 import shutil
@@ -432,6 +433,8 @@ class TestReadDMIData(helpers.FilesystemMockingTestCase):
             for arch in expected:
                 m_uname.return_value = ('x-sysname', 'x-nodename',
                                         'x-release', 'x-version', arch)
+                # values are cached per process, forget them per arch
+                self.reset_global_state()
                 found[arch] = util.read_dmi_data(dmi_name)
         self.assertEqual(expected, found)
 
@@ -477,6 +480,189 @@ class TestReadDMIData(helpers.FilesystemMockingTestCase):
         self.assertIsNone(util.read_dmi_data("system-product-name"))
 
 
+class TestPlatformFacts(helpers.CiTestCase):
+
+    @mock.patch('cloudinit.util._read_dmi_data', return_value='value')
+    @mock.patch('cloudinit.util._detect_container', return_value=False)
+    def test_facts_collected_once(self, m_detect, m_read):
+        """DMI values and container detection are only collected once."""
+        for _ in range(3):
+            self.assertEqual('value', util.read_dmi_data('system-uuid'))
+            self.assertFalse(util.is_container())
+        self.assertEqual(1, m_read.call_count)
+        self.assertEqual(1, m_detect.call_count)
+        self.assertEqual({'is_container': False,
+                          'dmi': {'system-uuid': 'value'}},
+                         util.platform_facts())
+
+    @mock.patch('cloudinit.util._read_dmi_data', return_value=None)
+    @mock.patch('cloudinit.util._detect_container', return_value=False)
+    def test_missing_values_are_cached(self, m_detect, m_read):
+        """A dmi key without a value is not looked up again."""
+        self.assertIsNone(util.read_dmi_data('bogus'))
+        self.assertIsNone(util.read_dmi_data('bogus'))
+        self.assertEqual(1, m_read.call_count)
+
+    def test_platform_facts_returns_a_copy(self):
+        """Changing the returned facts does not change the cache."""
+        util._PLATFORM_FACTS['dmi'] = {'system-uuid': 'value'}
+        util.platform_facts()['dmi']['system-uuid'] = 'other'
+        self.assertEqual('value', util._PLATFORM_FACTS['dmi']['system-uuid'])
+
+    @mock.patch('cloudinit.util._read_dmi_data')
+    @mock.patch('cloudinit.util._detect_container')
+    def test_saved_facts_are_used_by_later_stages(self, m_detect, m_read):
+        """Facts saved by one stage are loaded instead of re-collected."""
+        path = self.tmp_path('platform-facts.json')
+        util._PLATFORM_FACTS.update(
+            {'is_container': False, 'dmi': {'system-uuid': 'saved'}})
+        util.save_platform_facts(path)
+        self.reset_global_state()
+        util.load_platform_facts(path)
+        self.assertEqual('saved', util.read_dmi_data('system-uuid'))
+        self.assertEqual(0, m_read.call_count)
+        self.assertEqual(0, m_detect.call_count)
+
+    def test_load_keeps_facts_already_collected(self):
+        """Loading does not replace facts collected by this process."""
+        path = self.tmp_path('platform-facts.json')
+        util.write_file(path, json.dumps(
+            {'dmi': {'system-uuid': 'saved', 'chassis-asset-tag': 'tag'}}))
+        util._PLATFORM_FACTS['dmi'] = {'system-uuid': 'current'}
+        util.load_platform_facts(path)
+        self.assertEqual(
+            {'dmi': {'system-uuid': 'current', 'chassis-asset-tag': 'tag'}},
+            util.platform_facts())
+
+    def test_load_ignores_missing_or_invalid_files(self):
+        """Unusable saved facts are ignored."""
+        path = self.tmp_path('platform-facts.json')
+        util.load_platform_facts(path)
+        util.write_file(path, '[1, 2]')
+        util.load_platform_facts(path)
+        self.assertEqual({}, util.platform_facts())
+
+    def test_saved_facts_are_only_readable_by_root(self):
+        """Saved facts hold root only DMI keys, the file is mode 0600."""
+        path = self.tmp_path('platform-facts.json')
+        util.write_file(path, '{}', mode=0o644)
+        util._PLATFORM_FACTS['dmi'] = {'system-serial-number': 'secret'}
+        util.save_platform_facts(path)
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+
+    def test_save_without_facts_writes_nothing(self):
+        """No file is written before any fact is collected."""
+        path = self.tmp_path('platform-facts.json')
+        util.save_platform_facts(path)
+        self.assertFalse(os.path.exists(path))
+
+
+BLKID_EXPORT = """\
+DEVNAME=/dev/sda1
+LABEL=cloudimg-rootfs
+UUID=aaaa-bbbb
+TYPE=ext4
+PARTUUID=1111-01
+
+DEVNAME=/dev/sdb1
+UUID=cccc
+TYPE=vfat
+LABEL=cidata
+
+DEVNAME=/dev/sdc
+LABEL=my\\ disk
+TYPE=ext4
+"""
+
+
+class TestBlkidIndex(helpers.CiTestCase):
+
+    def setUp(self):
+        super(TestBlkidIndex, self).setUp()
+        self.calls = []
+        self.outputs = {('-o', 'export'): BLKID_EXPORT}
+        patcher = mock.patch('cloudinit.util.subp', side_effect=self._subp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _subp(self, cmd, rcs=None):
+        self.calls.append(cmd)
+        return (self.outputs.get(tuple(cmd[1:]), ''), '')
+
+    def test_parse_blkid_export(self):
+        """Export output is parsed into devices and unescaped tags."""
+        devices = util.parse_blkid_export(BLKID_EXPORT)
+        self.assertEqual(['/dev/sda1', '/dev/sdb1', '/dev/sdc'],
+                         [dev for (dev, _tags) in devices])
+        self.assertEqual({'LABEL': 'my disk', 'TYPE': 'ext4'}, devices[2][1])
+
+    def test_queries_answered_from_one_scan(self):
+        """Repeated find_devs_with calls run blkid once."""
+        self.assertEqual(['/dev/sdb1'], util.find_devs_with('TYPE=vfat'))
+        self.assertEqual(['/dev/sda1', '/dev/sdc'],
+                         util.find_devs_with('TYPE=ext4'))
+        self.assertEqual(['/dev/sdb1'], util.find_devs_with('LABEL=cidata'))
+        self.assertEqual(['/dev/sdc'],
+                         util.find_devs_with('LABEL="my disk"'))
+        self.assertEqual(['/dev/sda1'], util.find_devs_with('UUID=aaaa-bbbb'))
+        self.assertEqual(['/dev/sda1'],
+                         util.find_devs_with('PARTUUID=1111-01'))
+        self.assertEqual([], util.find_devs_with('TYPE=iso9660'))
+        self.assertEqual(3, len(util.find_devs_with()))
+        self.assertEqual([['blkid', '-o', 'export']], self.calls)
+
+    def test_unindexed_tags_are_matched(self):
+        """Tags outside the indexed ones are still searched."""
+        self.outputs[('-o', 'export')] = (
+            'DEVNAME=/dev/sdd\nTYPE=ext2\nSEC_TYPE=ext2\n')
+        self.assertEqual(['/dev/sdd'], util.find_devs_with('SEC_TYPE=ext2'))
+
+    def test_path_queries_probe_new_devices_once(self):
+        """Devices missing from the scan are probed and then indexed."""
+        self.outputs[('-o', 'export', '/dev/sr0')] = (
+            'DEVNAME=/dev/sr0\nTYPE=iso9660\nLABEL=cidata\n')
+        self.assertEqual(['/dev/sr0'], util.find_devs_with(path='/dev/sr0'))
+        self.assertEqual(['/dev/sr0'], util.find_devs_with(path='/dev/sr0'))
+        self.assertEqual(['/dev/sda1'], util.find_devs_with(path='/dev/sda1'))
+        self.assertEqual(['/dev/sdb1', '/dev/sr0'],
+                         util.find_devs_with('LABEL=cidata'))
+        self.assertEqual(
+            [['blkid', '-o', 'export'],
+             ['blkid', '-o', 'export', '/dev/sr0']], self.calls)
+
+    def test_path_misses_are_probed_again(self):
+        """A path without tags is probed again, it may have appeared."""
+        self.assertEqual([], util.find_devs_with(path='/dev/sr1'))
+        self.outputs[('-o', 'export', '/dev/sr1')] = (
+            'DEVNAME=/dev/sr1\nTYPE=iso9660\nLABEL=config-2\n')
+        self.assertEqual(['/dev/sr1'], util.find_devs_with(path='/dev/sr1'))
+        self.assertEqual(['/dev/sr1'], util.find_devs_with('LABEL=config-2'))
+        self.assertEqual(
+            [['blkid', '-o', 'export'],
+             ['blkid', '-o', 'export', '/dev/sr1'],
+             ['blkid', '-o', 'export', '/dev/sr1']], self.calls)
+
+    def test_invalidate_rescans(self):
+        """Devices are scanned again after invalidate_blkid_index."""
+        util.find_devs_with('TYPE=vfat')
+        self.outputs[('-o', 'export')] = 'DEVNAME=/dev/sdb1\nTYPE=ext4\n'
+        self.assertEqual(['/dev/sdb1'], util.find_devs_with('TYPE=vfat'))
+        util.invalidate_blkid_index()
+        self.assertEqual([], util.find_devs_with('TYPE=vfat'))
+        self.assertEqual(2, len(self.calls))
+
+    def test_no_cache_and_other_formats_run_blkid(self):
+        """Queries the index can not answer are passed to blkid."""
+        self.outputs[('-tTYPE=ntfs', '-c', '/dev/null', '-odevice')] = (
+            '/dev/sdb1\n')
+        self.assertEqual(['/dev/sdb1'],
+                         util.find_devs_with('TYPE=ntfs', no_cache=True))
+        util.find_devs_with('TYPE=ext4', oformat='value', tag='UUID')
+        self.assertEqual(
+            [['blkid', '-tTYPE=ntfs', '-c', '/dev/null', '-odevice'],
+             ['blkid', '-tTYPE=ext4', '-sUUID', '-ovalue']], self.calls)
+
+
 class TestMultiLog(helpers.FilesystemMockingTestCase):
 
     def _createConsole(self, root):